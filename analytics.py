@@ -0,0 +1,304 @@
+import argparse
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Per-session rows plus running totals. The totals are updated in the same transaction as the rows they summarize,
+# so "which step fails most" and "which feedback fires most" read a handful of rows however long the history is;
+# medians and per-athlete trends walk an index range instead of the whole table. A session's started and ended are
+# wall-clock times; clock_started and clock_ended are the same moments on the clock it was scored on, which step
+# times use and which for a replayed video or recording is media time
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY, session TEXT, athlete TEXT, program TEXT, source TEXT,
+    started REAL, ended REAL, clock_started REAL, clock_ended REAL, completed INTEGER, completed_steps INTEGER);
+CREATE INDEX IF NOT EXISTS sessions_by_athlete ON sessions (athlete, started);
+CREATE TABLE IF NOT EXISTS steps (
+    session_id INTEGER, program TEXT, step TEXT, position INTEGER, started REAL, completed REAL, duration REAL,
+    frames INTEGER, failing_frames INTEGER, hold_attempts INTEGER, hold_failures INTEGER);
+CREATE INDEX IF NOT EXISTS steps_by_duration ON steps (program, step, duration) WHERE duration IS NOT NULL;
+CREATE INDEX IF NOT EXISTS steps_by_session ON steps (session_id);
+CREATE TABLE IF NOT EXISTS feedback (session_id INTEGER, step TEXT, message TEXT, frames INTEGER);
+CREATE INDEX IF NOT EXISTS feedback_by_session ON feedback (session_id);
+CREATE TABLE IF NOT EXISTS step_totals (
+    program TEXT, step TEXT, position INTEGER, sessions INTEGER, completions INTEGER, frames INTEGER,
+    failing_frames INTEGER, hold_attempts INTEGER, hold_failures INTEGER, total_duration REAL,
+    PRIMARY KEY (program, step));
+CREATE TABLE IF NOT EXISTS feedback_totals (
+    program TEXT, step TEXT, message TEXT, frames INTEGER, sessions INTEGER, PRIMARY KEY (program, step, message));
+"""
+
+
+class SessionStats:
+    # Per-step counters for one session, fed every scored frame by StepMachine.advance. Only dictionary increments
+    # happen on the frame loop; rows are built once, when the session ends. `started` is the wall-clock time the
+    # session began, for replays whose clock isn't the wall clock; by default it is taken at the first frame
+    def __init__(self, session=None, athlete=None, program='stance', source=None, started=None):
+        self.session = session
+        self.athlete = athlete
+        self.program = program
+        self.source = source
+        self.started = started
+        self.clock_started = None
+        self.clock_ended = None
+        self.step_names = {}
+        self.step_started = {}
+        self.step_completed = {}
+        self.frames = Counter()
+        self.failing_frames = Counter()
+        self.hold_attempts = Counter()
+        self.hold_failures = Counter()
+        self.feedback = Counter()  # (step position, feedback text) -> frames it was shown on
+        self._holding = False
+
+    def observe(self, position, result, now):
+        if self.clock_started is None:
+            self.clock_started = now
+            if self.started is None:
+                self.started = time.time()
+        if position not in self.step_started:
+            # A step starts when the previous one completes, or with the session for the first
+            self.step_started[position] = self.step_completed.get(position - 1, self.clock_started)
+            self.step_names[position] = result.step_name
+            self._holding = False
+        self.clock_ended = now
+        self.frames[position] += 1
+        if not result.correct:
+            self.failing_frames[position] += 1
+            if result.feedback:
+                self.feedback[position, result.feedback] += 1
+        holding = result.remaining_time is not None
+        if holding and not self._holding:
+            self.hold_attempts[position] += 1
+        elif self._holding and not holding:
+            self.hold_failures[position] += 1
+        self._holding = holding
+        if holding and result.remaining_time <= 0:
+            self.step_completed[position] = now
+            self._holding = False
+
+    @property
+    def ended(self):
+        if self.clock_ended is None:
+            return None
+        return self.started + (self.clock_ended - self.clock_started)
+
+    def record(self, steps=None, completed=None):
+        # Plain data for the store (and JSON); `steps` lists every step name so unreached steps are recorded too
+        names = dict(self.step_names)
+        if steps is not None:
+            names.update((i, name) for i, name in enumerate(steps) if i not in names)
+        step_rows = []
+        for position in sorted(names):
+            started, finished = self.step_started.get(position), self.step_completed.get(position)
+            step_rows.append({
+                "step": names[position], "position": position, "started": started, "completed": finished,
+                "duration": None if finished is None else round(finished - started, 4),
+                "frames": self.frames[position], "failing_frames": self.failing_frames[position],
+                "hold_attempts": self.hold_attempts[position], "hold_failures": self.hold_failures[position],
+            })
+        return {
+            "session": self.session, "athlete": self.athlete, "program": self.program, "source": self.source,
+            "started": self.started, "ended": self.ended,
+            "clock_started": self.clock_started, "clock_ended": self.clock_ended,
+            "completed": bool(step_rows) and all(row["completed"] is not None for row in step_rows)
+            if completed is None else bool(completed),
+            "completed_steps": len(self.step_completed),
+            "steps": step_rows,
+            "feedback": [[names[position], text, frames] for (position, text), frames in self.feedback.items()],
+        }
+
+
+class AnalyticsStore:
+    # SQLite history of session outcomes. add() only queues a record; a writer thread inserts whatever has queued
+    # up in one transaction, so neither the frame loop nor a batch job waits on the disk. A batch that fails to
+    # write is rolled back and the writer carries on with the next; flush() raises for it
+    def __init__(self, path='analytics.db', batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._error = None  # First write failure since the last flush
+        self.sessions_written = 0
+        self.sessions_failed = 0
+
+    # Writing
+
+    def add(self, record):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        connection = sqlite3.connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    with connection:
+                        self._insert(connection, records)
+                    self.sessions_written += len(records)
+                except Exception as error:
+                    self.sessions_failed += len(records)
+                    self._error = self._error or error
+            if stop:
+                break
+        connection.close()
+
+    @staticmethod
+    def _insert(connection, records):
+        # SQLite assigns the session ids, so processes sharing one database never pick the same one
+        steps, feedback, step_totals, feedback_totals = [], [], Counter(), Counter()
+        positions, feedback_sessions = {}, Counter()
+        for record in records:
+            program = record["program"]
+            session_id = connection.execute(
+                "INSERT INTO sessions VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["session"], record["athlete"], program, record["source"], record["started"], record["ended"],
+                 record["clock_started"], record["clock_ended"], int(record["completed"]),
+                 record["completed_steps"])).lastrowid
+            for row in record["steps"]:
+                steps.append((session_id, program, row["step"], row["position"], row["started"], row["completed"],
+                              row["duration"], row["frames"], row["failing_frames"], row["hold_attempts"],
+                              row["hold_failures"]))
+                key = (program, row["step"])
+                positions[key] = row["position"]
+                # Steps never reached are kept as rows but don't count as attempts
+                for name, value in (("sessions", row["started"] is not None),
+                                    ("completions", row["completed"] is not None),
+                                    ("frames", row["frames"]), ("failing_frames", row["failing_frames"]),
+                                    ("hold_attempts", row["hold_attempts"]), ("hold_failures", row["hold_failures"]),
+                                    ("total_duration", row["duration"] or 0.0)):
+                    step_totals[key + (name,)] += value
+            for step, message, frames in record["feedback"]:
+                feedback.append((session_id, step, message, frames))
+                feedback_totals[program, step, message] += frames
+                feedback_sessions[program, step, message] += 1
+        connection.executemany("INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", steps)
+        connection.executemany("INSERT INTO feedback VALUES (?, ?, ?, ?)", feedback)
+        columns = ("sessions", "completions", "frames", "failing_frames", "hold_attempts", "hold_failures",
+                   "total_duration")
+        connection.executemany(
+            "INSERT INTO step_totals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (program, step) DO UPDATE SET "
+            + ", ".join(f"{column} = {column} + excluded.{column}" for column in columns),
+            [key + (position,) + tuple(step_totals[key + (column,)] for column in columns)
+             for key, position in positions.items()])
+        connection.executemany(
+            "INSERT INTO feedback_totals VALUES (?, ?, ?, ?, ?) ON CONFLICT (program, step, message) DO UPDATE SET "
+            "frames = frames + excluded.frames, sessions = sessions + excluded.sessions",
+            [key + (frames, feedback_sessions[key]) for key, frames in feedback_totals.items()])
+
+    def flush(self):
+        # Waits until everything added so far is committed, or raises if any of it could not be
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError(f"{self.sessions_failed} session(s) could not be written to {self.path}") from error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Queries
+
+    def _rows(self, sql, parameters=()):
+        cursor = self.connection.execute(sql, parameters)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def step_failures(self, program='stance'):
+        # Steps ordered from most to least failed: the share of attempts at the step that never completed
+        return self._rows("""
+            SELECT step, sessions, completions, sessions - completions AS not_completed, hold_attempts, hold_failures,
+                   CAST(failing_frames AS REAL) / MAX(frames, 1) AS failing_frame_ratio,
+                   total_duration / MAX(completions, 1) AS mean_duration
+            FROM step_totals WHERE program = ?
+            ORDER BY CAST(sessions - completions AS REAL) / MAX(sessions, 1) DESC, failing_frame_ratio DESC""",
+                          (program,))
+
+    def median_duration(self, step, program='stance'):
+        # Median seconds to complete a step, read straight off the (program, step, duration) index
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM steps WHERE program = ? AND step = ? AND duration IS NOT NULL",
+            (program, step)).fetchone()[0]
+        if not count:
+            return None
+        middle = self.connection.execute(
+            "SELECT duration FROM steps WHERE program = ? AND step = ? AND duration IS NOT NULL "
+            "ORDER BY duration LIMIT ? OFFSET ?", (program, step, 2 - count % 2, (count - 1) // 2)).fetchall()
+        return sum(value for value, in middle) / len(middle)
+
+    def top_feedback(self, program='stance', step=None, limit=10):
+        where, parameters = "program = ?", [program]
+        if step is not None:
+            where += " AND step = ?"
+            parameters.append(step)
+        return self._rows(f"SELECT step, message, frames, sessions FROM feedback_totals WHERE {where} "
+                          "ORDER BY frames DESC LIMIT ?", parameters + [limit])
+
+    def athlete_trend(self, athlete, period=7 * 24 * 3600, since=None):
+        # Per period (a week by default): sessions, how many completed, and mean time to finish all steps
+        return self._rows("""
+            SELECT CAST(started / :period AS INTEGER) * :period AS period_start, COUNT(*) AS sessions,
+                   SUM(completed) AS completed, AVG(CASE WHEN completed THEN ended - started END) AS mean_duration,
+                   AVG(completed_steps) AS mean_completed_steps
+            FROM sessions WHERE athlete = :athlete AND started >= :since
+            GROUP BY period_start ORDER BY period_start""",
+                          {"athlete": athlete, "period": period, "since": -1e18 if since is None else since})
+
+    def athlete_steps(self, athlete, step, program='stance'):
+        # Every completion time of one step by one athlete, oldest first
+        return self._rows("""
+            SELECT sessions.started, steps.duration FROM sessions JOIN steps ON steps.session_id = sessions.id
+            WHERE sessions.athlete = ? AND steps.program = ? AND steps.step = ? AND steps.duration IS NOT NULL
+            ORDER BY sessions.started""", (athlete, program, step))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the session analytics store")
+    parser.add_argument('database', nargs='?', default='analytics.db')
+    parser.add_argument('--program', default='stance', choices=('stance', 'evaluation'))
+    parser.add_argument('--median', metavar='STEP', help="median seconds to complete this step")
+    parser.add_argument('--athlete', help="per-week trend for this athlete")
+    args = parser.parse_args()
+    store = AnalyticsStore(args.database)
+    start = time.perf_counter()
+    if args.median:
+        print(f"Median time to complete {args.median}: {store.median_duration(args.median, args.program)}")
+    elif args.athlete:
+        for row in store.athlete_trend(args.athlete):
+            print(json.dumps(row))
+    else:
+        print("Steps, most failed first:")
+        for row in store.step_failures(args.program):
+            print(json.dumps(row))
+        print("Most frequent feedback:")
+        for row in store.top_feedback(args.program):
+            print(json.dumps(row))
+    print(f"({(time.perf_counter() - start) * 1e3:.1f} ms)")
+    store.close()
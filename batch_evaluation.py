@@ -0,0 +1,185 @@
+import argparse
+import json
+import multiprocessing
+import os
+import cv2
+from analytics import AnalyticsStore, SessionStats
+from engine import create_pose
+from features import PoseFeatures
+from landmarks import LandmarkFrame
+from recording import LandmarkRecording
+from sources import open_source
+from steps import StepMachine
+from temporal import filter_sequence
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+RECORDING_EXTENSION = '.lmk'
+
+_worker_options = {}
+
+
+def _init_worker(model_complexity):
+    global _worker_options
+    _worker_options = {"model_complexity": model_complexity}
+
+
+def session_name(path):
+    # The file name keeps its extension, so a.mp4, a.avi and a.lmk in one directory stay separate sessions
+    return os.path.basename(os.path.normpath(path))
+
+
+def find_videos(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(VIDEO_EXTENSIONS))
+
+
+def find_recordings(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(RECORDING_EXTENSION) and os.path.isdir(os.path.join(directory, name)))
+
+
+def evaluate_video(path, pose, hold_time=3, frames_file=None):
+    # Frames decode on a background thread while the previous one is being inferred
+    cap = open_source(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    session = session_name(path)
+    stats = SessionStats(session, program='stance', source=path)
+    machine = StepMachine(hold_time=hold_time, stats=stats)
+    frame_index = 0
+    detected_frames = 0
+    step_frames = [0] * len(machine.steps)
+
+    while cap.isOpened() and not machine.done:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # Virtual clock from the frame position, so replay speed doesn't change the outcome
+        now = frame_index / fps
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        keypoints = LandmarkFrame.from_results(pose.process(image))
+        record = {"session": session, "frame": frame_index, "time": round(now, 4), "detected": keypoints is not None}
+        if keypoints is not None:
+            detected_frames += 1
+            step_frames[machine.current_step] += 1
+            # Passing only the frame shape keeps the checks from drawing anything
+            result = machine.update(frame.shape, keypoints, now)
+            record.update(step=result.step_name, correct=result.correct, feedback=result.feedback,
+                          remaining_time=result.remaining_time)
+        if frames_file is not None:
+            frames_file.write(json.dumps(record) + "\n")
+        frame_index += 1
+    cap.release()
+
+    return {
+        "session": session,
+        "path": path,
+        "frames": frame_index,
+        "detected_frames": detected_frames,
+        "fps": fps,
+        "duration": round(frame_index / fps, 4),
+        "completed_steps": machine.current_step,
+        "completed": machine.done,
+        "step_completion_times": [round(t, 4) for t in machine.completion_times],
+        "step_frames": dict(zip((step.name for step in machine.steps), step_frames)),
+        "analytics": stats.record([step.name for step in machine.steps]),
+    }
+
+
+def evaluate_recording(path, hold_time=3, frames_file=None):
+    # Re-score recorded landmarks without running the model: features are extracted once for the whole recording
+    # and every step's rules run over them in one go
+    recording = LandmarkRecording(path)
+    session = session_name(path)
+    timestamps = recording.timestamps
+    start_time = float(timestamps[0]) if len(recording) else 0.0
+    # Recordings are timestamped with the wall clock of the live session, so that is when this session started
+    stats = SessionStats(session, program='stance', source=path, started=start_time if len(recording) else None)
+    machine = StepMachine(hold_time=hold_time, stats=stats)
+    frame_shape = tuple(recording.frame_size or (480, 640))
+    present = recording.present
+    # Smooth the whole recording up front, the same way StepMachine.update smooths live frames
+    points = filter_sequence(recording.points, timestamps, present)
+    visibility = recording.visibility_scores()
+    features = PoseFeatures(points, frame_shape)
+    scores = [step.evaluate(features) for step in machine.steps]
+    step_frames = [0] * len(machine.steps)
+    frames = 0
+
+    for frame_index in range(len(recording)):
+        if machine.done:
+            break
+        frames += 1
+        now = float(timestamps[frame_index]) - start_time
+        record = {"session": session, "frame": frame_index, "time": round(now, 4),
+                  "detected": bool(present[frame_index])}
+        if present[frame_index]:
+            step_frames[machine.current_step] += 1
+            correct, feedback = scores[machine.current_step]
+            keypoints = LandmarkFrame.from_keypoints(points[frame_index], visibility[frame_index])
+            result = machine.advance(correct[frame_index], feedback[frame_index], now, keypoints)
+            record.update(step=result.step_name, correct=result.correct, feedback=result.feedback,
+                          remaining_time=result.remaining_time)
+        if frames_file is not None:
+            frames_file.write(json.dumps(record) + "\n")
+
+    return {
+        "session": session,
+        "path": path,
+        "frames": frames,
+        "detected_frames": int(present[:frames].sum()),
+        "duration": round(float(timestamps[frames - 1]) - start_time, 4) if frames else 0.0,
+        "completed_steps": machine.current_step,
+        "completed": machine.done,
+        "step_completion_times": [round(t, 4) for t in machine.completion_times],
+        "step_frames": dict(zip((step.name for step in machine.steps), step_frames)),
+        "analytics": stats.record([step.name for step in machine.steps]),
+    }
+
+
+def _evaluate_in_worker(args):
+    path, output_dir, hold_time = args
+    with open(os.path.join(output_dir, f"{session_name(path)}.frames.jsonl"), "w") as frames_file:
+        if path.endswith(RECORDING_EXTENSION):
+            return evaluate_recording(path, hold_time=hold_time, frames_file=frames_file)
+        # A fresh Pose for every video: its tracker would otherwise start from wherever the worker's previous
+        # video left off, and which videos a worker gets varies from run to run
+        pose = create_pose(**_worker_options)
+        try:
+            return evaluate_video(path, pose, hold_time=hold_time, frames_file=frames_file)
+        finally:
+            pose.close()
+
+
+def evaluate_directory(video_dir, output_dir, processes=None, hold_time=3, model_complexity=1, analytics_path=None):
+    os.makedirs(output_dir, exist_ok=True)
+    # Landmark recordings (.lmk) are scored without touching the model; videos go through pose extraction
+    videos = find_videos(video_dir) + find_recordings(video_dir)
+    jobs = [(path, output_dir, hold_time) for path in videos]
+    sessions_path = os.path.join(output_dir, "sessions.jsonl")
+    store = AnalyticsStore(analytics_path) if analytics_path else None
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(model_complexity,)) as pool, \
+            open(sessions_path, "w") as sessions_file:
+        # imap keeps sessions.jsonl in file order no matter which worker finishes first
+        for summary in pool.imap(_evaluate_in_worker, jobs):
+            record = summary.pop("analytics")
+            if store is not None:
+                store.add(record)
+            sessions_file.write(json.dumps(summary) + "\n")
+            sessions_file.flush()
+            print(f"{summary['session']}: {summary['completed_steps']}/{len(summary['step_frames'])} steps")
+    if store is not None:
+        store.close()
+    return sessions_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score recorded boxing stance videos without a display")
+    parser.add_argument('video_dir', help="directory of recorded session videos and/or .lmk landmark recordings")
+    parser.add_argument('output_dir', help="where per-frame and per-session JSON lines are written")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--hold-time', type=float, default=3, help="seconds each step must be held")
+    parser.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2))
+    parser.add_argument('--analytics', metavar='DB', help="also add every session's outcomes to this SQLite store")
+    args = parser.parse_args()
+    evaluate_directory(args.video_dir, args.output_dir, processes=args.processes, hold_time=args.hold_time,
+                       model_complexity=args.model_complexity, analytics_path=args.analytics)
@@ -0,0 +1,229 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+import cv2
+import numpy as np
+import utils
+from boxing_coach import render_step
+from engine import get_pose
+from features import PoseFeatures
+from landmarks import LandmarkFrame
+from overlay import IdealPoseOverlay
+from rendering import draw_label, draw_text
+from stance_library import StanceLibrary
+from steps import STEPS, StepMachine
+from synthetic import SyntheticCapture, SyntheticPose, synthetic_landmarks, STANCE_TEMPLATE
+
+
+def summarize(name, durations, items=1):
+    durations = np.asarray(durations, dtype=np.float64)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1e3
+    return {
+        "name": name,
+        "iterations": len(durations),
+        "items_per_iteration": items,
+        "mean_ms": float(durations.mean() * 1e3),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "throughput_per_s": float(items * len(durations) / durations.sum()) if durations.sum() else float('inf'),
+    }
+
+
+def measure(name, function, iterations, warmup=10, items=1):
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return summarize(name, durations, items)
+
+
+def bench_checks(iterations, frame_size, batch_size):
+    h, w = frame_size
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    singles = synthetic_landmarks(iterations, seed=1)
+    batch = synthetic_landmarks(batch_size, seed=2)
+    checks = [utils.draw_foot_position_box, utils.check_foot_angles, utils.check_knee_bend, utils.check_hands_and_chin]
+    results = []
+    counter = iter(range(10 ** 9))
+
+    for check in checks:
+        results.append(measure(f"check.{check.__name__}", lambda: check(frame, singles[next(counter) % iterations]),
+                               iterations))
+        results.append(measure(f"check.{check.__name__}.batch", lambda: check((h, w), batch),
+                               max(iterations // 50, 5), items=batch_size))
+    def all_steps(keypoints):
+        # Feature extraction once, then every step's rules against it: the status board's per-frame cost
+        features = PoseFeatures(keypoints, (h, w))
+        return [step.evaluate(features) for step in STEPS]
+
+    results.append(measure("features.PoseFeatures", lambda: PoseFeatures(singles[next(counter) % iterations], (h, w)),
+                           iterations))
+    results.append(measure("rules.all_steps", lambda: all_steps(singles[next(counter) % iterations]), iterations))
+    results.append(measure("rules.all_steps.batch", lambda: all_steps(batch), max(iterations // 50, 5),
+                           items=batch_size))
+    results.append(measure("check.check_feet_alignment", lambda: utils.check_feet_alignment(singles[0]), iterations))
+    results.append(measure("check.check_feet_alignment.batch", lambda: utils.check_feet_alignment(batch),
+                           max(iterations // 50, 5), items=batch_size))
+    results.append(measure("check.check_alignment", lambda: utils.check_alignment(singles[0], STANCE_TEMPLATE),
+                           iterations))
+    results.append(measure("check.check_alignment.batch", lambda: utils.check_alignment(batch, STANCE_TEMPLATE),
+                           max(iterations // 50, 5), items=batch_size))
+    library = StanceLibrary()
+    for i, reference in enumerate(synthetic_landmarks(batch_size, noise=0.03, seed=3)):
+        library.add(f"reference{i}", reference, w / h, mirror=True)
+    library.select()  # Build the index outside the timed calls
+    results.append(measure(f"library.best.{len(library)}", lambda: library.best(singles[next(counter) % iterations],
+                                                                                w / h), iterations))
+    return results
+
+
+def bench_drawing(iterations, frame_size):
+    frame = np.zeros(frame_size + (3,), dtype=np.uint8)
+    keypoints = LandmarkFrame.from_keypoints(STANCE_TEMPLATE)
+    overlay = IdealPoseOverlay(STANCE_TEMPLATE)
+
+    def legacy_overlay():
+        overlay_frame = frame.copy()
+        utils.draw_keypoints_with_lines(overlay_frame, STANCE_TEMPLATE)
+        return cv2.addWeighted(frame, 0.5, overlay_frame, 0.5, 0)
+
+    instruction = STEPS[0].instruction
+    counter = iter(range(10 ** 9))
+
+    def progress():
+        # Text that changes every frame, like the calibration progress: a fresh string on each call
+        return f"Calibrating... hold still ({next(counter)}/30)"
+
+    return [
+        measure("draw.draw_keypoints_with_lines", lambda: utils.draw_keypoints_with_lines(frame, keypoints),
+                iterations),
+        measure("draw.putText", lambda: cv2.putText(frame, instruction, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                                                    (0, 255, 0), 1, cv2.LINE_AA), iterations),
+        measure("draw.label", lambda: draw_label(frame, instruction, (10, 60)), iterations),
+        measure("draw.text_per_frame", lambda: draw_text(frame, progress(), (10, 60)), iterations),
+        measure("draw.label_per_frame", lambda: draw_label(frame, progress(), (10, 60)), iterations),
+        measure("overlay.addWeighted_full_frame", legacy_overlay, iterations),
+        measure("overlay.cached_layer", lambda: overlay.apply(frame), iterations),
+    ]
+
+
+def bench_step_machine(iterations, frame_size):
+    frame = np.zeros(frame_size + (3,), dtype=np.uint8)
+    landmarks = [LandmarkFrame.from_keypoints(p) for p in synthetic_landmarks(iterations, seed=3)]
+    state = {"machine": StepMachine(hold_time=1), "index": 0, "now": 0.0}
+
+    def step():
+        machine = state["machine"]
+        if machine.done:
+            machine = state["machine"] = StepMachine(hold_time=1)
+        state["now"] += 1 / 30
+        machine.update(frame, landmarks[state["index"] % iterations], state["now"])
+        state["index"] += 1
+
+    return [measure("steps.StepMachine.update", step, iterations)]
+
+
+def bench_frame_loop(iterations, frame_size, real_pose=False):
+    # Mirrors boxing_coach.run_sequential stage by stage, without the window
+    cap = SyntheticCapture(size=frame_size)
+    if real_pose:
+        pose = get_pose()
+    else:
+        pose = SyntheticPose(synthetic_landmarks(300, seed=4))
+    machine = StepMachine(hold_time=1)
+    stages = {name: [] for name in ("capture", "convert", "inference", "landmarks", "render", "total")}
+    clock = 0.0
+
+    for i in range(iterations + 10):
+        t0 = time.perf_counter()
+        _, frame = cap.read()
+        t1 = time.perf_counter()
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t2 = time.perf_counter()
+        results = pose.process(image)
+        t3 = time.perf_counter()
+        keypoints = LandmarkFrame.from_results(results)
+        t4 = time.perf_counter()
+        clock += 1 / 30
+        if machine.done:
+            machine = StepMachine(hold_time=1)
+        render_step(frame, keypoints, machine, clock)
+        t5 = time.perf_counter()
+        if i >= 10:
+            for name, duration in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t5 - t0)):
+                stages[name].append(duration)
+    return [summarize(f"loop.{name}", durations) for name, durations in stages.items()]
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\n{'benchmark':45s} {'p50 before':>11s} {'p50 after':>11s} {'change':>8s}")
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None or not before["p50_ms"]:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        print(f"{result['name']:45s} {before['p50_ms']:11.4f} {result['p50_ms']:11.4f} {change:+8.1%}")
+
+
+def run(iterations=500, frame_size=(720, 1280), batch_size=1000, real_pose=False, only=None):
+    suites = {
+        "checks": lambda: bench_checks(iterations, frame_size, batch_size),
+        "drawing": lambda: bench_drawing(iterations, frame_size),
+        "steps": lambda: bench_step_machine(iterations, frame_size),
+        "loop": lambda: bench_frame_loop(iterations, frame_size, real_pose),
+    }
+    results = []
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        results.extend(suite())
+    return {"environment": environment(), "frame_size": list(frame_size), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stance coach hot paths with synthetic input")
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--size', default='1280x720', help="frame size as WIDTHxHEIGHT")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--real-pose', action='store_true', help="run MediaPipe in the frame loop benchmark")
+    parser.add_argument('--only', nargs='*', choices=('checks', 'drawing', 'steps', 'loop'))
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare p50 latencies against an earlier JSON run")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    report = run(args.iterations, (height, width), args.batch_size, args.real_pose, args.only)
+    print(f"{'benchmark':45s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'per s':>12s}")
+    for result in report["results"]:
+        print(f"{result['name']:45s} {result['p50_ms']:9.4f} {result['p95_ms']:9.4f} {result['p99_ms']:9.4f} "
+              f"{result['throughput_per_s']:12.1f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(report["results"], args.compare)
@@ -1,129 +1,355 @@
+import argparse
+import functools
 import cv2
-import mediapipe as mp
 import time
 import pickle
+import numpy as np
 from utils import draw_keypoints_with_lines, generate_feedback, load_ideal_keypoints, check_feet_alignment, \
     check_foot_angles, check_knee_bend, check_hands_and_chin, draw_foot_direction_lines, draw_foot_position_box, \
-    draw_foot_rotation_arrows, check_alignment  # Import the new function
+    draw_foot_rotation_arrows, check_alignment
+from analytics import AnalyticsStore, SessionStats
+from buffers import FrameRing
+from engine import get_pose, warm_up
+from features import PoseFeatures, largest_deviation
+from governor import CpuGovernor, add_governor_arguments, apply_limits
+from instrumentation import DISABLED, StageTimer
+from landmarks import LandmarkFrame
+from motion import MotionMatcher, MotionReference
+from overlay import IdealPoseOverlay
+from pipeline import PosePipeline
+from recording import LandmarkRecorder
+from rendering import draw_label, draw_text
+from scheduler import AdaptiveInference
+from session_recorder import SessionRecorder
+from sources import add_source_arguments, open_source, source_label
+from stance_library import StanceLibrary
+from steps import StepMachine
 
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
+WINDOW_NAME = 'Boxing Coach'
 
-def main():
-    print("Starting Virtual Boxing Coach...")
-
-    # Step 1: Show welcome message
-    cap = cv2.VideoCapture(0)
-    cv2.namedWindow('Boxing Coach', cv2.WND_PROP_FULLSCREEN)
-    cv2.setWindowProperty('Boxing Coach', cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
 
+def show_message(cap, text, duration):
     start_time = time.time()
-    while time.time() - start_time < 10:
-        ret, frame = cap.read()
+    frames = FrameRing(1)
+    while time.time() - start_time < duration:
+        ret, frame = frames.read(cap)
         if not ret:
             break
-        cv2.putText(frame, "Welcome to Boxing Coach!", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2,
-                    cv2.LINE_AA)
-        cv2.imshow('Boxing Coach', frame)
+        draw_label(frame, text, (50, 50), 1, (255, 0, 0), 2)
+        cv2.imshow(WINDOW_NAME, frame)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
-    time.sleep(2)  # Pause for 2 seconds between messages
 
-    # Step 2: Instruct user to get into boxing stance
-    start_time = time.time()
-    while time.time() - start_time < 5:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        cv2.putText(frame, "Get into your boxing stance", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2,
-                    cv2.LINE_AA)
-        cv2.imshow('Boxing Coach', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
 
-    # Step 3: Load ideal keypoints and show overlay
-    ideal_keypoints = load_ideal_keypoints()
-    print(f"Loaded ideal keypoints: {ideal_keypoints}")  # Debugging line
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        overlay_frame = frame.copy()
-        draw_keypoints_with_lines(overlay_frame, ideal_keypoints)
-        combined_frame = cv2.addWeighted(frame, 0.5, overlay_frame, 0.5, 0)
-        cv2.putText(combined_frame, "Align yourself with the overlay", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (255, 0, 0), 2, cv2.LINE_AA)
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image)
-        if results.pose_landmarks:
-            current_keypoints = [(lm.x, lm.y, lm.z) for lm in results.pose_landmarks.landmark]
-            draw_keypoints_with_lines(frame, current_keypoints)  # Draw user's pose
-            if check_alignment(current_keypoints, ideal_keypoints, threshold=0.1):  # Adjust threshold as needed
-                break
-            else:
-                print("Alignment not correct yet")  # Debugging line
+def render_alignment(frame, current_keypoints, overlay, timer=DISABLED, library=None, filters=None, motion=None):
+    combined_frame = overlay.apply(frame)
+    draw_label(combined_frame, "Align yourself with the overlay", (50, 50), 1, (255, 0, 0), 2)
+    timer.lap('overlay')
+    if current_keypoints is None:
+        timer.count('no_pose_landmarks')
+        return combined_frame, False
+    draw_keypoints_with_lines(combined_frame, current_keypoints)  # Draw user's pose
+    timer.lap('draw')
+    if motion is not None:
+        render_motion(combined_frame, current_keypoints, motion, timer)
+    if library is not None:
+        return render_library_alignment(combined_frame, current_keypoints, overlay, library, filters, timer)
+    aligned = check_alignment(current_keypoints, overlay.ideal_keypoints, threshold=0.1)  # Adjust threshold as needed
+    if not aligned:
+        timer.count('alignment_not_correct')
+        # Point at the joint angle furthest from the ideal pose
+        name, delta = largest_deviation(PoseFeatures(current_keypoints, combined_frame), overlay.ideal_features)
+        draw_text(combined_frame, f"{name.replace('_', ' ')}: {delta:+.0f} deg from ideal", (50, 90), 0.6,
+                  (0, 0, 255), 2)
+    timer.lap('check')
+    return combined_frame, aligned
+
+
+def render_library_alignment(frame, current_keypoints, overlay, library, filters=None, timer=DISABLED):
+    # Match against the closest reference stance wherever the user stands and however large they appear; the
+    # overlay follows whichever reference that is
+    h, w = frame.shape[:2]
+    match = library.best(current_keypoints, w / h, **(filters or {}))
+    timer.lap('check')
+    if match is None:
+        # Too little of the user in view to tell which reference they are closest to
+        draw_label(frame, "Step fully into view", (50, 90), 0.6, (0, 0, 255), 2)
+        return frame, False
+    if not np.array_equal(overlay.ideal_keypoints, match.keypoints):
+        overlay.set_ideal_keypoints(match.keypoints)
+    aligned = match.aligned()
+    draw_label(frame, f"Closest stance: {match.name} ({match.stance})", (50, 90), 0.6, (255, 0, 0), 2)
+    if not aligned:
+        timer.count('alignment_not_correct')
+        worst = match.worst_landmark
+        if worst is not None:
+            draw_label(frame, f"Check your {worst.name.lower().replace('_', ' ')}", (50, 120), 0.6, (0, 0, 255), 2)
+    return frame, aligned
+
+
+def render_motion(frame, current_keypoints, motion, timer=DISABLED):
+    # How the way into stance compares with the reference clip so far, and the joint furthest off in this phase
+    score = motion.update(current_keypoints)
+    timer.lap('motion')
+    draw_text(frame, f"Stance entry: {score.similarity:.0%} match ({score.phase}, {score.progress:.0%})",
+              (50, 150), 0.6, (255, 0, 0), 2)
+    worst = score.worst_joints.get(score.phase)
+    if worst:
+        joint = worst[0][0]
+        draw_label(frame, f"Watch your {joint.name.lower().replace('_', ' ')}", (50, 180), 0.6, (0, 0, 255), 2)
+    return score
+
+
+def report_motion(motion, session=None):
+    score = motion.score()
+    if score is None:
+        return
+    print(f"Stance entry: {score.similarity:.0%} match with the reference, {score.progress:.0%} of it reached")
+    for phase, joints in score.worst_joints.items():
+        print(f"  {phase}: " + ", ".join(f"{joint.name.lower()} {error:.2f}" for joint, error in joints))
+    if session is not None:
+        session.event('motion_score', similarity=score.similarity, progress=score.progress,
+                      worst_joints={phase: [joint.name for joint, _ in joints]
+                                    for phase, joints in score.worst_joints.items()})
+
+
+def draw_status_board(frame, machine):
+    # Every step's verdict on this frame, bottom left: done, passing right now, or not yet
+    h = frame.shape[0]
+    for i, status in enumerate(machine.board):
+        if i < machine.current_step:
+            color = (255, 255, 0)
         else:
-            print("No pose landmarks detected")  # Debugging line
-        cv2.imshow('Boxing Coach', combined_frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            color = (0, 255, 0) if status.correct else (0, 0, 255)
+        y = h - 20 * (len(machine.board) - i)
+        draw_label(frame, status.step_name, (10, y), 0.5, color, 1)
+
+
+def render_step(frame, current_keypoints, machine, now, timer=DISABLED, session=None):
+    if current_keypoints is None:
+        timer.count('no_pose_landmarks')
+        return frame, machine.done
+    if machine.done:
+        return frame, True
+    draw_keypoints_with_lines(frame, current_keypoints)  # Draw current keypoints and lines on the frame
+    timer.lap('draw')
+
+    result = machine.update(frame, current_keypoints, now)
+    timer.lap('check')
+    if session is not None:
+        session.log_step(result, now, done=machine.done)
+    if machine.done:
+        draw_label(frame, "Congrats! You're in a perfect boxing stance!", (20, 50), 0.5, (0, 255, 0), 2)
+        return frame, True
+    feedback_text = machine.feedback_text(result)
+    if feedback_text is not None:
+        draw_text(frame, feedback_text, (4, 140), 0.6, (0, 0, 255), 2)
+
+    draw_label(frame, f'Current Step: {result.step_name}', (10, 30), 0.5, (0, 255, 0), 1)
+    draw_label(frame, result.step_feedback, (10, 60), 0.5, (0, 255, 0), 1)
+    draw_status_board(frame, machine)
+    timer.lap('text')
+    return frame, False
 
-    # Step 4: Evaluate stance
-    steps = [
-        ("1. Feet Alignment", draw_foot_position_box,
-         "Align your front foot toe with your back foot heel and keep feet a bit wider than shoulder-width apart."),
-        ("2. Foot Positioning", check_foot_angles,
-         "Point your front foot 20-30 degrees and your back foot 50-90 degrees."),
-        ("3. Knee Bend", check_knee_bend, "Bend knees a bit by sticking out your butt."),
-        ("4. Hands and Chin", check_hands_and_chin, "Raise your hands and tuck your chin.")
-    ]
-    current_step = 0
-    hold_time = 3  # Hold each position for at least 3 seconds
-    step_start_time = None
 
+def run_sequential(cap, render, recorder=None, timer=DISABLED, adaptive=None, pose=None, session=None):
+    # Capture, inference, checks and display one after another on this thread
+    if pose is None:
+        pose = get_pose()
+    # Capture and colour conversion reuse the same buffers every frame; the frame handed back when the steps
+    # finish is never written to again
+    frames, rgb = FrameRing(1), FrameRing(1)
     while cap.isOpened():
-        ret, frame = cap.read()
+        timer.begin_frame()
+        ret, frame = frames.read(cap)
         if not ret:
             break
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image)
-        if results.pose_landmarks:
-            current_keypoints = [(lm.x, lm.y, lm.z) for lm in results.pose_landmarks.landmark]
-            draw_keypoints_with_lines(frame, current_keypoints)  # Draw current keypoints and lines on the frame
-
-            step_name, check_function, step_feedback = steps[current_step]
-            correct, feedback = check_function(frame, current_keypoints)
-            if correct:
-                if step_start_time is None:
-                    step_start_time = time.time()
-                elapsed_time = time.time() - step_start_time
-                remaining_time = hold_time - int(elapsed_time)
-                if remaining_time > 0:
-                    feedback_text = f"{feedback}. Hold for {remaining_time} seconds..."
-                    cv2.putText(frame, feedback_text, (4, 140), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2,
-                                cv2.LINE_AA)
-                else:
-                    current_step += 1
-                    step_start_time = None
-                    if current_step >= len(steps):
-                        cv2.putText(frame, "Congrats! You're in a perfect boxing stance!", (20, 50),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
-                        cv2.imshow('Boxing Coach', frame)
-                        cv2.waitKey(5000)
-                        break
-            else:
-                step_start_time = None
-                cv2.putText(frame, feedback, (4, 140), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2, cv2.LINE_AA)
-
-            cv2.putText(frame, f'Current Step: {step_name}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1,
-                        cv2.LINE_AA)
-            cv2.putText(frame, step_feedback, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
-        cv2.imshow('Boxing Coach', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        timer.lap('capture')
+        now = time.time()
+        if adaptive is not None:
+            current_keypoints = adaptive.process_frame(frame)
+            timer.lap('inference')
+        else:
+            image = rgb.to_rgb(frame)
+            timer.lap('convert')
+            results = pose.process(image)
+            timer.lap('inference')
+            current_keypoints = LandmarkFrame.from_results(results)
+        if recorder is not None:
+            recorder.append(current_keypoints, now)
+        timer.lap('landmarks')
+        display_frame, done = render(frame, current_keypoints, now)
+        if session is not None:
+            session.add_frame(display_frame, now)
+        if done:
+            return display_frame
+        timer.end_frame(display_frame)
+        cv2.imshow(WINDOW_NAME, display_frame)
+        key = cv2.waitKey(1)
+        timer.lap('display')
+        if key & 0xFF == ord('q'):
             break
+    return None
+
+
+def run_pipelined(cap, render, recorder=None, timer=DISABLED, adaptive=None, pose=None, session=None,
+                  pipeline=None):
+    # Capture and inference run on their own threads; this thread renders at camera rate with the latest landmarks.
+    # Phases that share a capture share one started `pipeline` too, which is left running for the next phase: two
+    # pipelines would have two threads reading the same capture
+    owned = pipeline is None
+    if owned:
+        if pose is None:
+            pose = get_pose()
+        pipeline = PosePipeline(cap, pose, on_landmarks=recorder.append if recorder is not None else None,
+                                timer=timer, adaptive=adaptive).start()
+    try:
+        for frame, current_keypoints, landmarks_time in pipeline.frames():
+            timer.begin_frame()
+            display_frame, done = render(frame, current_keypoints, landmarks_time or time.time())
+            if session is not None:
+                session.add_frame(display_frame)  # Landmark times repeat between inferences; stamp with wall time
+            if done:
+                return display_frame
+            timer.end_frame(display_frame)
+            cv2.imshow(WINDOW_NAME, display_frame)
+            key = cv2.waitKey(1)
+            timer.lap('display')
+            if key & 0xFF == ord('q'):
+                break
+    finally:
+        if owned:
+            pipeline.stop()
+    return None
+
+
+def main(pipelined=False, record_path=None, timer=DISABLED, latency_budget_ms=None, model_complexity=1,
+         session_path=None, session_fps=15, library_path=None, athlete=None, stance=None, analytics_path=None,
+         source=0, max_side=None, stride=1, threads=None, cores=None, target_fps=None, motion_path=None):
+    print("Starting Virtual Boxing Coach...")
+    # Before the model and the frame source start their threads, so they inherit the limits
+    limits = apply_limits(threads, cores)
+    if limits["cores"] is not None:
+        print(f"Pinned to cores {limits['cores']}")
+    # The model loads in the background while the welcome screens are up
+    warm_up(model_complexity=model_complexity)
+
+    # Step 1: Show welcome message
+    cap = open_source(source, max_side=max_side, stride=stride)
+    recorder = session = pipeline = None
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+    if session_path is not None:
+        # The session writes the landmarks too, on its own thread, into record_path if one was given
+        session = recorder = SessionRecorder(session_path, max_fps=session_fps, landmarks_path=record_path,
+                                             frame_size=frame_size)
+    elif record_path is not None:
+        recorder = LandmarkRecorder(record_path, frame_size=frame_size)
+    cv2.namedWindow(WINDOW_NAME, cv2.WND_PROP_FULLSCREEN)
+    cv2.setWindowProperty(WINDOW_NAME, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+
+    try:
+        show_message(cap, "Welcome to Boxing Coach!", 10)
+        time.sleep(2)  # Pause for 2 seconds between messages
+
+        # Step 2: Instruct user to get into boxing stance
+        show_message(cap, "Get into your boxing stance", 5)
+
+        # Step 3: Load ideal keypoints and show overlay
+        pose = get_pose(model_complexity=model_complexity)
+        adaptive = AdaptiveInference(pose, budget_ms=latency_budget_ms) if latency_budget_ms else None
+        if target_fps:
+            adaptive = CpuGovernor(pose, target_fps, model_complexity, adaptive=adaptive)
+        ideal_keypoints = load_ideal_keypoints()
+        overlay = IdealPoseOverlay(ideal_keypoints)
+        library, filters = None, {"athlete": athlete, "stance": stance}
+        if library_path is not None:
+            library = StanceLibrary.load(library_path)
+            print(f"Loaded {len(library.select(**filters))} reference stances from {library_path}")
+        motion = None
+        if motion_path is not None:
+            reference = MotionReference.from_recording(motion_path)
+            motion = MotionMatcher(reference, aspect=frame_size[1] / frame_size[0] if frame_size[0] else 4 / 3)
+        run_loop = run_sequential
+        if pipelined:
+            # One capture and inference thread pair for both phases below
+            pipeline = PosePipeline(cap, pose, on_landmarks=recorder.append if recorder is not None else None,
+                                    timer=timer, adaptive=adaptive).start()
+            run_loop = functools.partial(run_pipelined, pipeline=pipeline)
+        if session is not None:
+            session.event('phase', phase='alignment')
+        aligned_frame = run_loop(cap, lambda frame, keypoints, now: render_alignment(frame, keypoints, overlay, timer,
+                                                                                    library, filters, motion),
+                                 recorder, timer, adaptive, pose, session)
+        if motion is not None:
+            report_motion(motion, session)
+        if session is not None:
+            session.event('phase', phase='steps', aligned=aligned_frame is not None)
+
+        # Step 4: Evaluate stance
+        stats = None
+        if analytics_path is not None:
+            stats = SessionStats(athlete=athlete, program='stance', source=source_label(source))
+        machine = StepMachine(stats=stats)
+        final_frame = run_loop(cap, lambda frame, keypoints, now: render_step(frame, keypoints, machine, now, timer,
+                                                                              session),
+                               recorder, timer, adaptive, pose, session)
+    finally:
+        if pipeline is not None:
+            pipeline.stop()
+        # Also on q or an error: everything already queued is written before the session files are closed
+        if session is not None:
+            session.event('session_ended')
+        if recorder is not None:
+            recorder.close()
+        if session is not None:
+            print(f"Session saved to {session_path}: {session.stats()}")
+    if stats is not None:
+        # Written on the store's thread while the final frame is on screen
+        analytics = AnalyticsStore(analytics_path)
+        analytics.add(stats.record([step.name for step in machine.steps]))
+    timer.dump()
+    if isinstance(adaptive, CpuGovernor):
+        print(f"CPU governor: {adaptive.stats()}")
+    if final_frame is not None:
+        cv2.imshow(WINDOW_NAME, final_frame)
+        cv2.waitKey(5000)
+    if stats is not None:
+        analytics.close()
     cap.release()
     cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Virtual Boxing Coach")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="run capture, inference and rendering on separate threads")
+    parser.add_argument('--record', metavar='PATH', help="save the session's landmarks to a .lmk recording")
+    parser.add_argument('--session', metavar='DIR',
+                        help="save the annotated video, landmarks and step events of this session to DIR")
+    parser.add_argument('--session-fps', type=float, default=15,
+                        help="highest frame rate written to the session video; frames beyond it are skipped")
+    parser.add_argument('--adaptive', metavar='BUDGET_MS', type=float,
+                        help="crop, downscale and skip still frames to keep inference within this latency budget")
+    parser.add_argument('--library', metavar='NPZ',
+                        help="align against the closest stance in this reference library (see stance_library.py)")
+    parser.add_argument('--athlete', help="who is training: filters --library references and tags --analytics")
+    parser.add_argument('--analytics', metavar='DB', help="add this session's outcomes to a SQLite analytics store")
+    parser.add_argument('--motion-reference', metavar='LMK',
+                        help="grade how you get into stance against this landmark recording of a reference entry")
+    parser.add_argument('--stance', choices=('orthodox', 'southpaw'), help="with --library, only match this stance")
+    parser.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2),
+                        help="pose model size; landmark smoothing keeps the lighter models usable")
+    add_source_arguments(parser)
+    add_governor_arguments(parser)
+    parser.add_argument('--profile', action='store_true', help="time each stage of the frame loop")
+    parser.add_argument('--hud', action='store_true', help="with --profile, draw fps and stage timings on screen")
+    parser.add_argument('--stats-interval', type=float, default=5.0, help="seconds between stats dumps")
+    parser.add_argument('--stats-file', help="append stats as JSON lines to this file instead of stdout")
+    args = parser.parse_args()
+    timer = StageTimer(enabled=args.profile, hud=args.hud, dump_interval=args.stats_interval,
+                       dump_file=args.stats_file)
+    main(pipelined=args.pipelined, record_path=args.record, timer=timer, latency_budget_ms=args.adaptive,
+         model_complexity=args.model_complexity, session_path=args.session, session_fps=args.session_fps,
+         library_path=args.library, athlete=args.athlete, stance=args.stance, analytics_path=args.analytics,
+         source=args.source, max_side=args.max_side, stride=args.stride, threads=args.threads, cores=args.cores,
+         target_fps=args.target_fps, motion_path=args.motion_reference)
@@ -0,0 +1,90 @@
+from multiprocessing import shared_memory
+import queue
+import cv2
+import numpy as np
+
+
+class FrameRing:
+    # A fixed set of preallocated images handed out in rotation, so steady-state frame loops allocate nothing.
+    # A buffer is reused `count` calls later: size the ring for the most frames that can be alive at once (queued,
+    # being drawn on, shown). Buffers are (re)allocated lazily to whatever shape is asked for
+    def __init__(self, count, dtype=np.uint8):
+        self.count = count
+        self.dtype = dtype
+        self._buffers = [None] * count
+        self._next = 0
+
+    def get(self, shape):
+        i = self._next
+        self._next = (i + 1) % self.count
+        buffer = self._buffers[i]
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = self._buffers[i] = np.empty(shape, dtype=self.dtype)
+        return buffer
+
+    def read(self, cap):
+        # cap.read() into the next buffer. The first read, or one after a resolution change, sizes the buffer
+        buffer = self._buffers[self._next]
+        ret, frame = cap.read(buffer) if buffer is not None else cap.read()
+        if ret and frame is not buffer:
+            self._buffers[self._next] = frame
+        self._next = (self._next + 1) % self.count
+        return ret, frame
+
+    def to_rgb(self, frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.get(frame.shape))
+
+
+class SharedFrameRing:
+    # Fixed-size image slots in one shared-memory block, so a frame reaches a worker process as a slot number
+    # instead of a pickled array. The owner hands out free slots and gets them back once the worker is done
+    def __init__(self, slots, slot_shape, name=None):
+        self.slots = slots
+        self.slot_shape = tuple(slot_shape)
+        self.slot_bytes = int(np.prod(self.slot_shape))
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+            self._free = queue.Queue()
+            for slot in range(slots):
+                self._free.put(slot)
+        else:
+            # Workers started by multiprocessing share the owner's resource tracker, which already knows the block
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+
+    def spec(self):
+        # What a worker needs to attach: SharedFrameRing(*ring.spec())
+        return self.slots, self.slot_shape, self.name
+
+    def view(self, slot, shape):
+        # A (h, w, 3) uint8 array over the start of the slot; writes go straight to shared memory
+        offset = slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf, offset=offset)
+
+    def acquire(self, block=True, timeout=None):
+        # A free slot, or None if none frees up in time
+        try:
+            return self._free.get(block, timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def put_rgb(self, slot, frame):
+        # BGR frame to RGB straight into the slot, downscaled to fit it if needed; returns the shape stored
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.slot_shape[0] / h, self.slot_shape[1] / w)
+        shape = (int(h * scale), int(w * scale), 3)
+        view = self.view(slot, shape)
+        if scale < 1:
+            cv2.resize(frame, (shape[1], shape[0]), dst=view, interpolation=cv2.INTER_AREA)
+            frame = view
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=view)
+        return shape
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -1,39 +1,147 @@
+import argparse
 import cv2
-import mediapipe as mp
+import numpy as np
 import pickle
+from buffers import FrameRing
+from engine import get_pose
+from instrumentation import DISABLED
+from landmarks import LandmarkFrame, LandmarkRing
+from rendering import draw_text
+from sources import add_source_arguments, open_source
 
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
 
+def robust_keypoints(samples, min_visibility=0.5, jitter_threshold=3.0):
+    # samples is a (N, 33, 4) array of x, y, z, visibility; returns (33, 3) keypoints and a rejection mask
+    points = samples[..., :3].astype(np.float64)
+    rejected = samples[..., 3] < min_visibility
+    masked = np.where(rejected[..., None], np.nan, points)
+    # Medians only over joints seen at least once; a joint never seen has nothing to take one of
+    seen = ~rejected.all(axis=0)
 
-def capture_video_and_save_keypoints(filename='ideal_keypoints.pkl'):
-    cap = cv2.VideoCapture(0)
-    frames = []
-    while len(frames) < 600:  # 20 seconds at 30fps
-        ret, frame = cap.read()
+    # Reject samples that sit far from the per-joint median, measured in median absolute deviations
+    median = np.full(points.shape[1:], np.nan)
+    median[seen] = np.nanmedian(masked[:, seen], axis=0)
+    deviation = np.linalg.norm(masked - median, axis=-1)
+    mad = np.full(points.shape[1], np.nan)
+    mad[seen] = np.nanmedian(deviation[:, seen], axis=0)
+    rejected |= deviation > jitter_threshold * np.maximum(mad, 1e-4)
+    masked = np.where(rejected[..., None], np.nan, points)
+
+    # Joints that were never trusted fall back to the plain median, and count as unconverged in the quality report
+    keypoints = np.median(points, axis=0)
+    kept = ~rejected.all(axis=0)
+    keypoints[kept] = np.nanmedian(masked[:, kept], axis=0)
+    return keypoints, rejected
+
+
+def calibration_quality(samples, keypoints, rejected):
+    # Spread is over the joints with at least one sample kept; with none kept it is NaN and there is no worst joint
+    deviation = np.linalg.norm(samples[..., :3] - keypoints, axis=-1)
+    kept = ~rejected.all(axis=0)
+    spread = np.nanmedian(np.where(rejected, np.nan, deviation)[:, kept], axis=0)
+    return {
+        "frames": len(samples),
+        "mean_visibility": float(samples[..., 3].mean()),
+        "rejected_fraction": float(rejected.mean()),
+        "joint_spread": float(spread.mean()) if kept.any() else float('nan'),
+        "worst_joint": int(np.flatnonzero(kept)[np.argmax(spread)]) if kept.any() else None,
+        "unconverged_joints": np.flatnonzero(~kept).tolist(),
+    }
+
+
+class Calibration:
+    # Stance samples gathered one frame at a time until the robust estimate stops moving, so calibration can run
+    # inside any frame loop
+    def __init__(self, max_frames=600, window=90, min_frames=30, tolerance=0.002, check_every=10, timer=DISABLED):
+        self.max_frames = max_frames  # 20 seconds at 30fps at most
+        self.min_frames = min_frames
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.timer = timer
+        self.ring = LandmarkRing(window)
+        self.keypoints = None
+        self.frames_seen = 0
+        self._last_landmarks = None
+
+    def update(self, frame, landmarks):
+        # Takes one frame's landmarks (or None) and draws the progress; True once calibration is finished. Loops
+        # that skip inference on some frames hand the same landmarks over again; those aren't new samples
+        self.frames_seen += 1
+        new_sample = landmarks is not None and landmarks is not self._last_landmarks
+        if new_sample:
+            self.ring.push(landmarks)
+            self._last_landmarks = landmarks
+        elif landmarks is None:
+            self.timer.count('no_pose_landmarks')
+        draw_text(frame, f"Calibrating... hold still ({len(self.ring)}/{self.min_frames})", (10, 30), 0.7,
+                  (255, 0, 0), 2)
+
+        # Stop early once the estimate stops moving between checks
+        if new_sample and len(self.ring) >= self.min_frames and self.ring.count % self.check_every == 0:
+            previous = self.keypoints
+            self.keypoints, _ = robust_keypoints(self.ring.ordered())
+            self.timer.lap('aggregate')
+            if previous is not None and np.abs(self.keypoints - previous).max() < self.tolerance:
+                return True
+        return self.frames_seen >= self.max_frames
+
+    def result(self):
+        # (33, 3) keypoints from every sample kept and their quality report, or (None, None) if nobody was seen
+        if not len(self.ring):
+            return None, None
+        samples = self.ring.ordered()
+        keypoints, rejected = robust_keypoints(samples)
+        return keypoints, calibration_quality(samples, keypoints, rejected)
+
+
+def save_keypoints(keypoints, quality, filename='ideal_keypoints.pkl'):
+    with open(filename, 'wb') as f:
+        pickle.dump([tuple(p) for p in keypoints.tolist()], f)
+    print(f"Keypoints saved successfully from {quality['frames']} frames "
+          f"(spread {quality['joint_spread']:.4f}, {quality['rejected_fraction']:.0%} samples rejected).")
+    if quality['unconverged_joints']:
+        print(f"No trusted samples for joints {quality['unconverged_joints']}: they are plain medians of "
+              "low-visibility samples.")
+
+
+def capture_video_and_save_keypoints(filename='ideal_keypoints.pkl', max_frames=600, window=90, min_frames=30,
+                                     tolerance=0.002, check_every=10, timer=DISABLED, source=0, max_side=None,
+                                     stride=1):
+    cap = open_source(source, max_side=max_side, stride=stride)
+    pose = get_pose()
+    calibration = Calibration(max_frames, window, min_frames, tolerance, check_every, timer)
+    frames, rgb = FrameRing(1), FrameRing(1)
+    while True:
+        timer.begin_frame()
+        ret, frame = frames.read(cap)
         if not ret:
             break
+        timer.lap('capture')
+        image = rgb.to_rgb(frame)
+        timer.lap('convert')
+        landmarks = LandmarkFrame.from_results(pose.process(image))
+        timer.lap('inference')
+        done = calibration.update(frame, landmarks)
+        timer.end_frame(frame)
         cv2.imshow('Calibration', frame)  # Show the webcam feed
-        frames.append(frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        key = cv2.waitKey(1)
+        timer.lap('display')
+        if done or key & 0xFF == ord('q'):
             break
+    timer.dump()
     cap.release()
     cv2.destroyAllWindows()
 
-    if frames:
-        last_frame = frames[-1]
-        image = cv2.cvtColor(last_frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image)
-        if results.pose_landmarks:
-            keypoints = [(lm.x, lm.y, lm.z) for lm in results.pose_landmarks.landmark]
-            with open(filename, 'wb') as f:
-                pickle.dump(keypoints, f)
-            print("Keypoints saved successfully.")
-        else:
-            print("No landmarks detected in the final frame.")
-    else:
-        print("No frames captured.")
+    keypoints, quality = calibration.result()
+    if keypoints is None:
+        print("No landmarks detected during calibration.")
+        return None
+    save_keypoints(keypoints, quality, filename)
+    return quality
 
 
 if __name__ == "__main__":
-    capture_video_and_save_keypoints()
+    parser = argparse.ArgumentParser(description="Capture the ideal stance")
+    add_source_arguments(parser)
+    args = parser.parse_args()
+    capture_video_and_save_keypoints(source=args.source, max_side=args.max_side, stride=args.stride)
@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from engine import create_pose
+from governor import limit_threads
+from landmarks import NUM_LANDMARKS, LandmarkFrame
+from multistation import prepare_image
+from recording import LandmarkRecording
+from sources import open_source
+from steps import EVALUATION_STEPS, STEPS, StepMachine
+
+# Wire protocol, over any byte stream (TCP here). Client to server: a header, then its payload
+#   b'H'  hello, JSON options: {"hold_time": 3, "steps": "stance" | "evaluation", "frame_size": [h, w]}
+#   b'J'  one JPEG-encoded BGR frame
+#   b'L'  one pose as 33 x 4 little-endian float32 (x, y, z, visibility), from a client running its own model
+#   b'Q'  goodbye
+# The header's timestamp is the client's capture time and is the clock hold times run on. Server to client: a
+# 4-byte length, then a JSON reply carrying the sequence number of the request it answers. Every J and L request
+# gets exactly one reply: its result, {"dropped": true} if a newer frame from the same client overtook it, or an
+# error. A header announcing a payload over its kind's limit ends the connection before the payload is read
+HEADER = struct.Struct('!cIdI')  # kind, sequence, timestamp, payload length
+REPLY_LENGTH = struct.Struct('!I')
+LANDMARK_BYTES = NUM_LANDMARKS * 4 * 4
+MAX_FRAME_BYTES = 8 << 20
+MAX_PAYLOAD_BYTES = {b'H': 64 << 10, b'J': MAX_FRAME_BYTES, b'L': LANDMARK_BYTES, b'Q': 0}
+STEP_SETS = {'stance': STEPS, 'evaluation': EVALUATION_STEPS}
+
+
+def decode_frame(jpeg):
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _infer(pose, jpeg, inference_size):
+    # (frame size, landmark data or None) for one JPEG frame
+    frame = decode_frame(jpeg)
+    if frame is None:
+        return None, None
+    landmarks = LandmarkFrame.from_results(pose.process(prepare_image(frame, inference_size)))
+    return frame.shape[:2], None if landmarks is None else landmarks.data
+
+
+def _create_service_pose(model_complexity):
+    # Workers serve every client in turn, so no frame may be tracked from another client's landmarks: every frame
+    # runs the detector afresh
+    return create_pose(static_image_mode=True, model_complexity=model_complexity)
+
+
+def _service_worker(tasks, results, model_complexity, inference_size):
+    # Like multistation's workers, but frames arrive JPEG-encoded and are decoded here, off the event loop
+    limit_threads(1)
+    pose = _create_service_pose(model_complexity)
+    pose.process(np.zeros((256, 256, 3), dtype=np.uint8))
+    results.put(None)  # Ready: the model is loaded and its graph has run once
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        key, jpeg = task
+        try:
+            results.put((key,) + _infer(pose, jpeg, inference_size))
+        except Exception as error:
+            results.put((key, None, None, f"inference failed: {error!r}"))
+    pose.close()
+
+
+async def read_message(reader):
+    kind, sequence, timestamp, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    limit = MAX_PAYLOAD_BYTES.get(kind, MAX_FRAME_BYTES)
+    if length > limit:
+        raise ValueError(f"{kind!r} payload of {length} bytes is over the {limit}-byte limit")
+    return kind, sequence, timestamp, await reader.readexactly(length)
+
+
+def write_message(writer, kind, sequence, timestamp, payload=b''):
+    writer.write(HEADER.pack(kind, sequence, timestamp, len(payload)))
+    writer.write(payload)
+
+
+async def read_reply(reader):
+    length, = REPLY_LENGTH.unpack(await reader.readexactly(REPLY_LENGTH.size))
+    return json.loads(await reader.readexactly(length))
+
+
+def write_reply(writer, reply):
+    data = json.dumps(reply).encode()
+    writer.write(REPLY_LENGTH.pack(len(data)) + data)
+
+
+class CoachSession:
+    # One connected client: its own step machine, plus at most one frame being inferred and one waiting
+    def __init__(self, session_id, writer, hold_time=3):
+        self.session_id = session_id
+        self.writer = writer
+        self.configure(hold_time=hold_time)
+        self.pending = None  # (sequence, timestamp, jpeg, received) waiting for a free worker
+        self.in_flight = False
+        self.closed = False
+        self.requests = 0
+        self.dropped = 0
+
+    def configure(self, hold_time=3, steps='stance', frame_size=(480, 640)):
+        # Checked here, so a bad hello gets an error reply instead of failing later inside score()
+        hold_time = float(hold_time)
+        if not hold_time > 0:
+            raise ValueError(f"hold_time must be positive, not {hold_time}")
+        if len(frame_size) != 2 or not all(isinstance(side, int) and side > 0 for side in frame_size):
+            raise ValueError(f"frame_size must be two positive integers, not {frame_size!r}")
+        self.machine = StepMachine(STEP_SETS[steps], hold_time=hold_time)
+        self.frame_size = tuple(frame_size)
+
+    def score(self, landmarks, sequence, timestamp, received):
+        machine = self.machine
+        reply = {"seq": sequence, "pose": landmarks is not None}
+        if landmarks is not None and not machine.done:
+            result = machine.update(self.frame_size, landmarks, timestamp)
+            reply.update(step=result.step_name, instruction=result.step_feedback, correct=result.correct,
+                         feedback=result.feedback, text=machine.feedback_text(result),
+                         remaining_time=result.remaining_time,
+                         board=[[status.step_name, bool(status.correct)] for status in machine.board])
+        reply["completed_steps"] = machine.current_step
+        reply["done"] = machine.done
+        reply["latency_ms"] = round((time.perf_counter() - received) * 1e3, 3)
+        return reply
+
+
+class CoachService:
+    # Serves the step machine to many clients from one event loop. MediaPipe's Pose has no batched call, so
+    # batching happens in the scheduling: each session keeps only its newest frame, and the waiting sessions share
+    # the pose workers round robin (one process each, or one in-process thread with workers=0). Landmark requests
+    # skip inference and are scored as soon as they arrive. If a worker process dies, the requests waiting on
+    # inference get an error reply and the service stops accepting clients
+    def __init__(self, workers=None, inference_size=640, model_complexity=1, hold_time=3):
+        self.workers = max(1, multiprocessing.cpu_count() - 1) if workers is None else workers
+        self.inference_size = inference_size
+        self.model_complexity = model_complexity
+        self.hold_time = hold_time
+        self.sessions = {}
+        self._ids = itertools.count()
+        self._keys = itertools.count()
+        self._ready = deque()  # Sessions with a pending frame, in the order they get a worker
+        self._in_flight = {}
+        self._free = max(1, self.workers)
+        self._processes = []
+        self._stopping = False
+        self.failure = None  # Why inference stopped, once a worker has died
+        self.requests = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=10000)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        # Returns the port actually bound, so port=0 picks a free one
+        self._loop = asyncio.get_running_loop()
+        if self.workers:
+            context = multiprocessing.get_context('spawn')
+            self._tasks, self._results = context.Queue(), context.Queue()
+            self._processes = [context.Process(target=_service_worker, daemon=True,
+                                               args=(self._tasks, self._results, self.model_complexity,
+                                                     self.inference_size))
+                               for _ in range(self.workers)]
+            for process in self._processes:
+                process.start()
+            # Clients are only accepted once every worker has its model up
+            ready = 0
+            while ready < len(self._processes):
+                try:
+                    await self._loop.run_in_executor(None, self._results.get, True, 0.5)
+                    ready += 1
+                except queue.Empty:
+                    self.failure = self._dead_worker()
+                    if self.failure is not None:
+                        await self.stop()
+                        raise RuntimeError(self.failure)
+            self._collector = threading.Thread(target=self._collect, daemon=True)
+            self._collector.start()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._pose = await self._loop.run_in_executor(
+                self._executor, _create_service_pose, self.model_complexity)
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._stopping = True
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.workers:
+            for _ in self._processes:
+                self._tasks.put(None)
+            for process in self._processes:
+                process.join(timeout=5)
+            if self.failure is None:
+                self._results.put(None)
+            else:
+                # The collector has already stopped, and a killed worker may have held a queue's lock when it died:
+                # don't wait on the queues at exit
+                self._tasks.cancel_join_thread()
+                self._results.cancel_join_thread()
+        else:
+            self._executor.shutdown()
+            self._pose.close()
+
+    async def serve_forever(self, host='127.0.0.1', port=8765):
+        port = await self.start(host, port)
+        print(f"Coaching service listening on {host}:{port} with {self.workers or 'in-process'} pose workers")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle(self, reader, writer):
+        session = CoachSession(next(self._ids), writer, self.hold_time)
+        self.sessions[session.session_id] = session
+        try:
+            while True:
+                kind, sequence, timestamp, payload = await read_message(reader)
+                received = time.perf_counter()
+                if kind == b'J':
+                    self._submit(session, (sequence, timestamp, payload, received))
+                elif kind == b'L':
+                    if len(payload) != LANDMARK_BYTES:
+                        write_reply(writer, {"seq": sequence, "error": "expected 33 x 4 float32 landmarks"})
+                    else:
+                        landmarks = LandmarkFrame(np.frombuffer(payload, dtype='<f4').reshape(NUM_LANDMARKS, 4)
+                                                  .astype(np.float32))
+                        self._reply(session, session.score(landmarks, sequence, timestamp, received))
+                elif kind == b'H':
+                    try:
+                        session.configure(**dict({"hold_time": self.hold_time}, **json.loads(payload or b'{}')))
+                    except (ValueError, TypeError, KeyError) as error:
+                        write_reply(writer, {"seq": sequence, "error": f"bad hello: {error!r}"})
+                elif kind == b'Q':
+                    break
+                else:
+                    write_reply(writer, {"seq": sequence, "error": f"unknown message kind {kind!r}"})
+                await writer.drain()
+        except ValueError as error:
+            # Oversized header: the stream can't be resynchronised without reading the payload, so hang up
+            write_reply(writer, {"error": str(error)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            session.closed = True
+            del self.sessions[session.session_id]
+            writer.close()
+
+    def _reply(self, session, reply):
+        if session.closed:
+            return
+        if reply.get("dropped"):
+            session.dropped += 1
+            self.dropped += 1
+        else:
+            session.requests += 1
+            self.requests += 1
+            self.latencies.append(reply["latency_ms"])
+        write_reply(session.writer, reply)
+
+    def _submit(self, session, request):
+        if self.failure is not None:
+            write_reply(session.writer, {"seq": request[0], "error": self.failure})
+            return
+        if session.pending is not None:
+            # Overtaken before a worker was free: only the newest frame of a session is worth scoring
+            self._reply(session, {"seq": session.pending[0], "dropped": True})
+        elif not session.in_flight:
+            self._ready.append(session)
+        session.pending = request
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._free and self._ready:
+            session = self._ready.popleft()
+            if session.closed or session.pending is None:
+                continue
+            request, session.pending = session.pending, None
+            session.in_flight = True
+            self._free -= 1
+            key = next(self._keys)
+            self._in_flight[key] = (session, request)
+            jpeg = request[2]
+            if self.workers:
+                self._tasks.put((key, jpeg))
+            else:
+                future = self._loop.run_in_executor(self._executor, _infer, self._pose, jpeg, self.inference_size)
+                future.add_done_callback(lambda done, key=key: self._completed(key, done))
+
+    def _dead_worker(self):
+        # Why a worker process is gone, or None while they are all running
+        for i, process in enumerate(self._processes):
+            if not process.is_alive():
+                return f"Pose worker {i} exited with code {process.exitcode}"
+        return None
+
+    def _collect(self):
+        # Hands worker results back to the event loop, and checks on the workers while none arrive
+        while True:
+            try:
+                result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                error = None if self._stopping else self._dead_worker()
+                if error is not None:
+                    self._loop.call_soon_threadsafe(self._fail, error)
+                    break
+                continue
+            if result is None:
+                break
+            self._loop.call_soon_threadsafe(self._complete, *result)
+
+    def _fail(self, error):
+        # A worker died holding requests we can't tell apart from the others' (tasks share one queue): answer
+        # everything waiting on inference with the error and stop taking clients
+        self.failure = error
+        print(error)
+        waiting = [(session, request[0]) for session, request in self._in_flight.values()]
+        waiting += [(session, session.pending[0]) for session in self.sessions.values() if session.pending]
+        self._in_flight.clear()
+        self._ready.clear()
+        for session, sequence in waiting:
+            session.pending = None
+            session.in_flight = False
+            if not session.closed:
+                write_reply(session.writer, {"seq": sequence, "error": error})
+        if self.server is not None:
+            self.server.close()
+
+    def _completed(self, key, future):
+        error = future.exception()
+        if error is not None:
+            self._complete(key, None, None, f"inference failed: {error!r}")
+        else:
+            self._complete(key, *future.result())
+
+    def _complete(self, key, frame_size, data, error=None):
+        # The worker is free again whatever happened, and the request gets its one reply
+        session, (sequence, timestamp, _, received) = self._in_flight.pop(key)
+        self._free += 1
+        session.in_flight = False
+        if error is not None:
+            if not session.closed:
+                write_reply(session.writer, {"seq": sequence, "error": error})
+        else:
+            if frame_size is not None:
+                session.frame_size = frame_size
+            self._reply(session, session.score(None if data is None else LandmarkFrame(data), sequence, timestamp,
+                                               received))
+        if session.pending is not None and not session.closed:
+            self._ready.append(session)
+        self._dispatch()
+
+    def stats(self):
+        latencies = np.asarray(self.latencies, dtype=np.float64)
+        p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (0.0, 0.0)
+        return {
+            "sessions": len(self.sessions),
+            "workers": self.workers,
+            "requests": self.requests,
+            "dropped": self.dropped,
+            "latency_p50_ms": round(float(p50), 2),
+            "latency_p95_ms": round(float(p95), 2),
+        }
+
+
+def load_clip(source, fps=None, quality=80):
+    # A clip pre-encoded as (offset seconds, kind, payload) messages, so replaying it costs the client no CPU.
+    # Videos become JPEG frames; .lmk recordings become landmark messages on their own timestamps
+    if isinstance(source, str) and os.path.isdir(source):
+        recording = LandmarkRecording(source)
+        timestamps = recording.timestamps - recording.timestamps[0] if len(recording) else []
+        messages = [(float(timestamps[i]), b'L', recording.frame(i).data.astype('<f4').tobytes())
+                    for i in range(len(recording)) if recording.present[i]]
+        return messages, recording.frame_size
+    cap = open_source(source)
+    interval = 1 / (fps or cap.get(cv2.CAP_PROP_FPS) or 30)
+    messages, frame_size = [], None
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_size = frame.shape[:2]
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        messages.append((len(messages) * interval, b'J', jpeg.tobytes()))
+    cap.release()
+    return messages, frame_size
+
+
+async def replay(host, port, messages, frame_size=None, hold_time=3, steps='stance', speed=1.0):
+    # One client replaying a pre-loaded clip in real time; returns its round-trip latencies and scoring rate
+    reader, writer = await asyncio.open_connection(host, port)
+    hello = {"hold_time": hold_time, "steps": steps}
+    if frame_size:
+        hello["frame_size"] = list(frame_size)
+    write_message(writer, b'H', 0, 0.0, json.dumps(hello).encode())
+    sent = {}
+    round_trips, scored, dropped, errors, last = [], 0, 0, 0, {}
+
+    async def receive():
+        nonlocal scored, dropped, errors, last
+        for _ in range(len(messages)):
+            reply = await read_reply(reader)
+            round_trips.append(time.perf_counter() - sent.pop(reply["seq"]))
+            if reply.get("dropped"):
+                dropped += 1
+            elif "error" in reply:
+                errors += 1
+            else:
+                scored += 1
+                last = reply
+
+    receiver = asyncio.create_task(receive())
+    start = time.perf_counter()
+    for sequence, (offset, kind, payload) in enumerate(messages, start=1):
+        delay = offset / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent[sequence] = time.perf_counter()
+        write_message(writer, kind, sequence, time.time(), payload)
+        await writer.drain()
+    await receiver
+    duration = time.perf_counter() - start
+    write_message(writer, b'Q', 0, 0.0)
+    await writer.drain()
+    writer.close()
+    round_trips = np.asarray(round_trips) * 1e3
+    p50, p95 = np.percentile(round_trips, [50, 95]) if len(round_trips) else (0.0, 0.0)
+    return {
+        "sent": len(messages),
+        "scored": scored,
+        "dropped": dropped,
+        "errors": errors,
+        "sent_fps": round(len(messages) / duration, 2) if duration else 0.0,
+        "scored_fps": round(scored / duration, 2) if duration else 0.0,
+        "round_trip_p50_ms": round(float(p50), 2),
+        "round_trip_p95_ms": round(float(p95), 2),
+        "completed_steps": last.get("completed_steps", 0),
+    }
+
+
+async def load_test(sources, clients=4, fps=None, speed=1.0, hold_time=3, **service_options):
+    # Starts a service on localhost and runs `clients` replaying clients against it, all in this process
+    clips = [load_clip(source, fps) for source in sources]
+    service = CoachService(hold_time=hold_time, **service_options)
+    port = await service.start('127.0.0.1', 0)
+    try:
+        results = await asyncio.gather(*(replay('127.0.0.1', port, *clips[i % len(clips)], hold_time=hold_time,
+                                                speed=speed) for i in range(clients)))
+    finally:
+        await service.stop()
+    for i, result in enumerate(results):
+        result["client"] = i
+        result["source"] = sources[i % len(sources)]
+    # A session counts as served if at least 90% of what it sent was scored rather than overtaken
+    served = sum(result["scored"] >= 0.9 * result["sent"] for result in results)
+    summary = dict(service.stats(), sessions=clients, served_sessions=served,
+                   sessions_per_core=round(served / (os.cpu_count() or 1), 2))
+    return results, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Network coaching service and a local load-testing client")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="accept coaching clients over TCP")
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=8765)
+    load = commands.add_parser('loadtest', help="replay clips from several local clients against an in-process service")
+    load.add_argument('sources', nargs='+', help="video files or .lmk landmark recordings, assigned round robin")
+    load.add_argument('--clients', type=int, default=4)
+    load.add_argument('--fps', type=float, default=None, help="replay videos at this rate instead of their own")
+    load.add_argument('--speed', type=float, default=1.0, help="replay faster (>1) or slower than real time")
+    for command in (serve, load):
+        command.add_argument('--workers', type=int, default=None,
+                             help="pose worker processes (default: CPU count - 1; 0 infers on a thread in-process)")
+        command.add_argument('--inference-size', type=int, default=640)
+        command.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2))
+        command.add_argument('--hold-time', type=float, default=3)
+    args = parser.parse_args()
+    service_options = dict(workers=args.workers, inference_size=args.inference_size,
+                           model_complexity=args.model_complexity)
+    if args.command == 'serve':
+        service = CoachService(hold_time=args.hold_time, **service_options)
+        try:
+            asyncio.run(service.serve_forever(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        results, summary = asyncio.run(load_test(args.sources, clients=args.clients, fps=args.fps, speed=args.speed,
+                                                 hold_time=args.hold_time, **service_options))
+        for result in results:
+            print(result)
+        print(summary)
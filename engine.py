@@ -0,0 +1,71 @@
+import threading
+import numpy as np
+
+# One MediaPipe Pose per distinct set of options, created on first use and shared by every module in the process
+_lock = threading.Lock()
+_engines = {}
+_warmups = {}
+
+
+def _key(options):
+    return tuple(sorted(options.items()))
+
+
+def _create(key, options):
+    with _lock:
+        pose = _engines.get(key)
+        if pose is None:
+            import mediapipe as mp
+            pose = _engines[key] = mp.solutions.pose.Pose(**options)
+    return pose
+
+
+def get_pose(**options):
+    key = _key(options)
+    # Pose isn't safe to call from two threads at once, so never hand it out mid warm-up
+    warmup = _warmups.get(key)
+    if warmup is not None and warmup is not threading.current_thread():
+        warmup.join()
+    return _create(key, options)
+
+
+def create_pose(**options):
+    # A Pose outside the shared set, for callers that need tracking state of their own. The caller closes it
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(**options)
+
+
+def warm_up(background=True, **options):
+    # Builds the model and pushes one blank frame through it, so the first real frame doesn't pay for graph setup
+    def run():
+        _create(_key(options), options).process(np.zeros((256, 256, 3), dtype=np.uint8))
+
+    if not background:
+        run()
+        return None
+    key = _key(options)
+    with _lock:
+        thread = _warmups.get(key)
+        if thread is None:
+            thread = _warmups[key] = threading.Thread(target=run, name='pose-warmup', daemon=True)
+            thread.start()
+    return thread
+
+
+def wait_until_ready(timeout=None, **options):
+    thread = _warmups.get(_key(options))
+    if thread is not None:
+        thread.join(timeout)
+
+
+def close():
+    # Warm-ups are joined outside the lock, since they take it to create their engine
+    with _lock:
+        threads = list(_warmups.values())
+    for thread in threads:
+        thread.join()
+    with _lock:
+        for pose in _engines.values():
+            pose.close()
+        _engines.clear()
+        _warmups.clear()
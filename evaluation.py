@@ -1,53 +1,91 @@
+import argparse
 import cv2
-import mediapipe as mp
 import time
-from utils import load_ideal_keypoints, generate_feedback, check_feet_alignment, check_shoulder_width, check_foot_angles, check_knee_bend
+from analytics import AnalyticsStore, SessionStats
+from buffers import FrameRing
+from engine import get_pose
+from instrumentation import DISABLED
+from landmarks import LandmarkFrame
+from recording import LandmarkRecorder
+from rendering import draw_label
+from scheduler import AdaptiveInference
+from sources import add_source_arguments, open_source, source_label
+from steps import EVALUATION_STEPS, STANCE_FEEDBACK, StepMachine
 
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
 
-ideal_keypoints = load_ideal_keypoints()
+class StanceEvaluation:
+    # The evaluation steps one frame at a time, with the current step and its feedback drawn on the frame
+    def __init__(self, hold_time=5, stats=None, timer=DISABLED):  # Hold each position for at least 5 seconds
+        self.machine = StepMachine(EVALUATION_STEPS, hold_time=hold_time, stats=stats)
+        self.timer = timer
 
-def evaluate_stance():
-    cap = cv2.VideoCapture(0)
-    hold_time = 5  # Hold each position for at least 5 seconds
-    start_time = None
-    steps = [
-        ("Toe-Heel Alignment", check_feet_alignment),
-        ("Shoulder Width", check_shoulder_width),
-        ("Foot Angles", check_foot_angles),
-        ("Knee Bend", check_knee_bend)
-    ]
-    current_step = 0
+    def update(self, frame, keypoints, now):
+        # True once every step has been held
+        if keypoints is None:
+            self.timer.count('no_pose_landmarks')
+            return False
+        result = self.machine.update(frame, keypoints, now)
+        self.timer.lap('check')
+        if self.machine.done:
+            return True
+        feedback = STANCE_FEEDBACK.messages(self.machine.features)
+        draw_label(frame, f'Current Step: {result.step_name}', (10, 30), 0.5, (0, 255, 0), 1)
+        for i, message in enumerate(feedback):
+            draw_label(frame, message, (10, 60 + i * 20), 0.5, (0, 255, 0), 1)
+        self.timer.lap('text')
+        return False
 
+
+def evaluate_stance(record_path=None, timer=DISABLED, latency_budget_ms=None, analytics_path=None, athlete=None,
+                    source=0, max_side=None, stride=1):
+    cap = open_source(source, max_side=max_side, stride=stride)
+    pose = get_pose()
+    recorder = None
+    if record_path is not None:
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        recorder = LandmarkRecorder(record_path, frame_size=frame_size)
+    adaptive = AdaptiveInference(pose, budget_ms=latency_budget_ms) if latency_budget_ms else None
+    stats = SessionStats(athlete=athlete, program='evaluation', source=source_label(source)) if analytics_path else None
+    evaluation = StanceEvaluation(stats=stats, timer=timer)
+
+    frames, rgb = FrameRing(1), FrameRing(1)
     while cap.isOpened():
-        ret, frame = cap.read()
+        timer.begin_frame()
+        ret, frame = frames.read(cap)
         if not ret:
             break
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(image)
-        if results.pose_landmarks:
-            current_keypoints = [(lm.x, lm.y, lm.z) for lm in results.pose_landmarks.landmark]
-            step_name, check_function = steps[current_step]
-            if check_function(current_keypoints):
-                if start_time is None:
-                    start_time = time.time()
-                elif time.time() - start_time >= hold_time:
-                    current_step += 1
-                    start_time = None
-                    if current_step >= len(steps):
-                        break
-            else:
-                start_time = None
-            feedback = generate_feedback(ideal_keypoints, current_keypoints)
-            cv2.putText(frame, f'Current Step: {step_name}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
-            for i, message in enumerate(feedback):
-                cv2.putText(frame, message, (10, 60 + i * 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+        timer.lap('capture')
+        now = time.time()
+        if adaptive is not None:
+            current_keypoints = adaptive.process_frame(frame)
+        else:
+            image = rgb.to_rgb(frame)
+            timer.lap('convert')
+            results = pose.process(image)
+            current_keypoints = LandmarkFrame.from_results(results)
+        timer.lap('inference')
+        if recorder is not None:
+            recorder.append(current_keypoints, now)
+        timer.lap('landmarks')
+        if evaluation.update(frame, current_keypoints, now):
+            break
+        timer.end_frame(frame)
         cv2.imshow('Evaluation', frame)
-        if cv2.waitKey(10) & 0xFF == ord('q'):
+        key = cv2.waitKey(10)
+        timer.lap('display')
+        if key & 0xFF == ord('q'):
             break
+    if recorder is not None:
+        recorder.close()
+    if stats is not None:
+        with AnalyticsStore(analytics_path) as store:
+            store.add(stats.record([step.name for step in evaluation.machine.steps]))
+    timer.dump()
     cap.release()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    evaluate_stance()
+    parser = argparse.ArgumentParser(description="Evaluate your stance step by step")
+    add_source_arguments(parser)
+    args = parser.parse_args()
+    evaluate_stance(source=args.source, max_side=args.max_side, stride=args.stride)
@@ -0,0 +1,84 @@
+import numpy as np
+from landmarks import as_keypoint_array
+from utils import frame_size, mp_pose, pixel_point
+
+L = mp_pose.PoseLandmark
+
+# Every feature is built from the direction and length of these landmark-to-landmark vectors, so one gather,
+# one arctan2 and one hypot cover a whole frame (or batch)
+_VECTOR_STARTS = [L.RIGHT_HEEL, L.RIGHT_SHOULDER,  # Foot line, shoulders
+                  L.LEFT_KNEE, L.LEFT_KNEE, L.RIGHT_KNEE, L.RIGHT_KNEE,  # Knee to hip and to ankle
+                  L.LEFT_FOOT_INDEX, L.RIGHT_FOOT_INDEX,  # Toe to heel
+                  L.NOSE, L.NOSE, L.LEFT_SHOULDER, L.RIGHT_SHOULDER]  # Chin to wrist, shoulder to elbow
+_VECTOR_ENDS = [L.LEFT_FOOT_INDEX, L.LEFT_SHOULDER,
+                L.LEFT_HIP, L.LEFT_ANKLE, L.RIGHT_HIP, L.RIGHT_ANKLE,
+                L.LEFT_HEEL, L.RIGHT_HEEL,
+                L.LEFT_WRIST, L.RIGHT_WRIST, L.LEFT_ELBOW, L.RIGHT_ELBOW]
+# Only these landmarks are ever looked at, so only they are gathered and converted to pixels
+_LANDMARKS = sorted(set(_VECTOR_STARTS) | set(_VECTOR_ENDS))
+_COLUMN = {landmark: i for i, landmark in enumerate(_LANDMARKS)}
+_STARTS = np.array([_COLUMN[landmark] for landmark in _VECTOR_STARTS])
+_ENDS = np.array([_COLUMN[landmark] for landmark in _VECTOR_ENDS])
+# Interior angle at each knee (ankle direction minus hip direction) and of each foot against the horizontal
+_INTERIOR = np.zeros((len(_VECTOR_STARTS), 4))
+_INTERIOR[[3, 5], [0, 1]] = 1
+_INTERIOR[[2, 4, 6, 7], [0, 1, 2, 3]] = -1
+
+FEATURE_NAMES = (
+    'foot_line_angle', 'foot_line_angle_px', 'foot_line_tilt', 'foot_line_tilt_px',
+    'foot_distance', 'foot_distance_px', 'shoulder_width', 'shoulder_width_px',
+    'left_knee_angle', 'right_knee_angle', 'front_foot_angle', 'back_foot_angle',
+    'left_hand_height', 'right_hand_height', 'left_elbow_offset', 'right_elbow_offset',
+)
+
+# Features worth comparing against the ideal pose: joint and foot angles, in degrees
+ANGLE_FEATURES = ('left_knee_angle', 'right_knee_angle', 'front_foot_angle', 'back_foot_angle', 'foot_line_tilt')
+
+
+class PoseFeatures:
+    # Every derived quantity the steps look at, computed once per frame (or once for a whole batch of frames).
+    # Pixel features use the truncated pixel coordinates the checks in utils have always used
+    def __init__(self, keypoints, frame):
+        keypoints = as_keypoint_array(keypoints)
+        h, w = frame_size(frame)
+        self.keypoints = keypoints
+        self.size = (h, w)
+        points = keypoints[..., _LANDMARKS, :2].astype(np.float64)
+        self.pixels = (points * (w, h)).astype(np.int32)
+        # Normalized and pixel coordinates side by side, so both systems share every vectorized call below
+        coordinates = np.concatenate([points, self.pixels], axis=-1, dtype=np.float64)
+        vectors = coordinates.take(_ENDS, axis=-2) - coordinates.take(_STARTS, axis=-2)
+        directions = np.arctan2(vectors[..., 1::2], vectors[..., 0::2])
+
+        # Written straight into one (..., len(FEATURE_NAMES)) block, in FEATURE_NAMES order
+        columns = np.empty(keypoints.shape[:-2] + (len(FEATURE_NAMES),))
+        foot_line_angles = np.degrees(directions[..., 0, :], out=columns[..., 0:2])
+        np.minimum(np.abs(foot_line_angles), np.abs(foot_line_angles - 180), out=columns[..., 2:4])
+        lengths = columns[..., 4:8].reshape(columns.shape[:-1] + (2, 2))  # A view, so hypot fills columns in place
+        np.hypot(vectors[..., :2, 0::2], vectors[..., :2, 1::2], out=lengths)
+        interior = np.abs(np.degrees(directions[..., 1] @ _INTERIOR))
+        np.minimum(interior, 360 - interior, out=columns[..., 8:12])  # Folded into 0-180
+        columns[..., 12:14] = vectors[..., 8:10, 3]  # Hand heights above the chin, in pixels
+        np.abs(vectors[..., 10:12, 2], out=columns[..., 14:16])  # Elbow offsets from the shoulders, in pixels
+        # Single frames get plain floats, which keeps the per-rule comparisons cheap
+        if columns.ndim == 1:
+            self.values = dict(zip(FEATURE_NAMES, columns.tolist()))
+        else:
+            self.values = dict(zip(FEATURE_NAMES, np.moveaxis(columns, -1, 0)))
+
+    @property
+    def batched(self):
+        return self.keypoints.ndim == 3
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def pixel(self, landmark):
+        return pixel_point(self.pixels[_COLUMN[landmark]])
+
+
+def largest_deviation(features, ideal, names=ANGLE_FEATURES):
+    # The angle feature furthest from the ideal pose, as (name, signed difference in degrees)
+    deltas = {name: float(features[name] - ideal[name]) for name in names}
+    name = max(deltas, key=lambda n: abs(deltas[n]))
+    return name, deltas[name]
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+import cv2
+from engine import get_pose, warm_up
+from landmarks import LandmarkFrame
+from scheduler import InferenceJob
+
+# Thread-pool sizes read by native libraries when they first start; only libraries loaded after limit_threads()
+# pick them up
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+
+def parse_cores(spec):
+    # '0-3,6' -> [0, 1, 2, 3, 6]
+    cores = set()
+    for part in str(spec).split(','):
+        first, _, last = part.strip().partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return sorted(cores)
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def session_cores(slot, per_session, cores=None):
+    # The cores for the `slot`-th of several sessions on one host, each getting `per_session` of them in turn
+    cores = available_cores() if cores is None else cores
+    start = slot * per_session % len(cores)
+    return [cores[(start + i) % len(cores)] for i in range(min(per_session, len(cores)))]
+
+
+def limit_threads(threads):
+    # Caps OpenCV's worker pool (resizes, colour conversion and drawing in utils and overlay) and the pools of
+    # native libraries that haven't started yet. MediaPipe sizes its own pool from the machine, so pin_to_cores()
+    # is what actually bounds inference
+    cv2.setNumThreads(threads)
+    for variable in THREAD_VARIABLES:
+        os.environ.setdefault(variable, str(threads))
+    return threads
+
+
+def pin_to_cores(cores):
+    # Restricts every thread of this process, and any it starts later, to `cores`. Returns the cores in effect,
+    # or None where the platform can't pin
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = set(cores)
+    try:
+        threads = [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        threads = [0]
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cores)
+        except OSError:
+            pass  # The thread exited in the meantime
+    return sorted(os.sched_getaffinity(0))
+
+
+def host_load():
+    # Runnable processes per core this process may use, averaged over the last minute; above 1 means contention
+    if not hasattr(os, 'getloadavg'):
+        return None
+    return os.getloadavg()[0] / len(available_cores())
+
+
+def apply_limits(threads=None, cores=None):
+    # Thread caps and pinning for one coaching process; call before the model and the frame source start their
+    # threads. `cores` is a list or a '0-3,6' spec
+    if cores is not None:
+        cores = pin_to_cores(parse_cores(cores) if isinstance(cores, str) else cores)
+        if threads is None and cores:
+            threads = len(cores)
+    if threads is not None:
+        limit_threads(threads)
+    return {"threads": threads, "cores": cores}
+
+
+class CpuGovernor:
+    # Keeps inference within this process's share of the CPU so several stations on one host each hold their frame
+    # rate. Over budget it infers on every Nth frame only, carrying the last landmarks forward, and past max_stride
+    # switches to a lighter model (loaded in the background first); with headroom on a host that isn't contended,
+    # it steps back the other way. Same process_frame / prepare / finish interface as AdaptiveInference, which it
+    # can wrap. `pose_options` are the engine options `pose` was created with (model_complexity alone by default);
+    # the other models share them, and the starting model is looked up with exactly those, so stepping back to it
+    # finds the same engine instead of loading a second copy. In the pipelined loop prepare runs on the capture
+    # thread and finish on the inference thread, so the cadence and model state are kept under a lock
+    def __init__(self, pose=None, target_fps=15.0, model_complexity=1, min_complexity=0, max_stride=4,
+                 cpu_share=0.8, tune_every=30, retry_after=30.0, adaptive=None, pose_options=None):
+        self.target_fps = target_fps
+        self.budget = cpu_share / target_fps  # Inference time allowed per frame
+        self.model_complexity = model_complexity
+        self.max_complexity = model_complexity
+        self.min_complexity = min_complexity
+        self.max_stride = max_stride
+        self.tune_every = tune_every
+        self.retry_after = retry_after
+        self.adaptive = adaptive
+        self.pose_options = {'model_complexity': model_complexity} if pose_options is None else dict(pose_options)
+        self.pose = pose if pose is not None else get_pose(**self.pose_options)
+        if adaptive is not None:
+            adaptive.pose = self.pose
+        self.stride = 1
+        self.latest = None
+        self._frame_index = 0
+        self._latency_ema = None  # Seconds per inference with the current model
+        self._since_tune = 0
+        self._pending = None  # (complexity, warm-up thread) while a lighter or heavier model loads
+        # complexity -> (latency, when measured) for models switched away from, so a model that didn't fit isn't
+        # brought straight back; forgotten after retry_after seconds in case the host has quietened down
+        self._measured = {}
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+        self.model_switches = 0
+        self._lock = threading.Lock()
+
+    def _options(self, complexity):
+        if complexity == self.max_complexity:
+            return self.pose_options
+        return dict(self.pose_options, model_complexity=complexity)
+
+    def _switch_when_ready(self):
+        complexity, thread = self._pending
+        if thread.is_alive():
+            return
+        self._pending = None
+        if self._latency_ema is not None:
+            self._measured[self.model_complexity] = (self._latency_ema, time.monotonic())
+        self.pose = get_pose(**self._options(complexity))
+        if self.adaptive is not None:
+            self.adaptive.pose = self.pose
+        self.model_complexity = complexity
+        self.model_switches += 1
+        self._latency_ema = None  # The new model's cost has to be measured afresh
+        self._since_tune = 0
+
+    def _request_model(self, complexity):
+        if self._pending is None:
+            self._pending = (complexity, warm_up(**self._options(complexity)))
+
+    def prepare(self, frame):
+        # An InferenceJob, or None on frames between inferences
+        with self._lock:
+            if self._pending is not None:
+                self._switch_when_ready()
+            self._frame_index += 1
+            if self.latest is not None and self._frame_index % self.stride:
+                self.skipped_frames += 1
+                return None
+        if self.adaptive is not None:
+            return self.adaptive.prepare(frame)
+        h, w = frame.shape[:2]
+        return InferenceJob(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), 0, 0, w, h, w, h)
+
+    def run(self, job):
+        if self.adaptive is not None:
+            return self.adaptive.run(job)
+        return self.pose.process(job.image)
+
+    def finish(self, job, results, latency):
+        if self.adaptive is not None:
+            landmarks = self.adaptive.finish(job, results, latency)
+        else:
+            landmarks = LandmarkFrame.from_results(results)
+        with self._lock:
+            self.latest = landmarks
+            self.inferred_frames += 1
+            self._tune(latency)
+        return landmarks
+
+    def process_frame(self, frame):
+        job = self.prepare(frame)
+        if job is None:
+            return self.latest
+        start = time.perf_counter()
+        results = self.run(job)
+        return self.finish(job, results, time.perf_counter() - start)
+
+    @property
+    def cost(self):
+        # Inference seconds per displayed frame: one inference's latency spread over the frames it covers
+        return self._latency_ema / self.stride if self._latency_ema is not None else None
+
+    def _fits(self, complexity):
+        # Whether a heavier model would stay within budget at the current cadence, as far as we last measured
+        latency, measured_at = self._measured.get(complexity, (0.0, -float('inf')))
+        return time.monotonic() - measured_at > self.retry_after or latency / self.stride < 0.8 * self.budget
+
+    def _tune(self, latency):
+        self._latency_ema = latency if self._latency_ema is None else 0.9 * self._latency_ema + 0.1 * latency
+        self._since_tune += 1
+        if self._since_tune < self.tune_every:
+            return
+        self._since_tune = 0
+        if self.cost > self.budget:
+            if self.stride < self.max_stride:
+                self.stride += 1
+            elif self.model_complexity > self.min_complexity:
+                self._request_model(self.model_complexity - 1)
+        elif self.cost < 0.5 * self.budget and (host_load() or 0) < 1:
+            # Back the way it came: the heavier model first, then full cadence
+            if self.model_complexity < self.max_complexity and self._fits(self.model_complexity + 1):
+                self._request_model(self.model_complexity + 1)
+            elif self.stride > 1:
+                self.stride -= 1
+
+    def stats(self):
+        load = host_load()
+        with self._lock:
+            return {
+                "model_complexity": self.model_complexity,
+                "stride": self.stride,
+                "inferred_frames": self.inferred_frames,
+                "skipped_frames": self.skipped_frames,
+                "model_switches": self.model_switches,
+                "cost_ms": round(self.cost * 1e3, 3) if self.cost is not None else None,
+                "host_load": round(load, 2) if load is not None else None,
+            }
+
+
+def add_governor_arguments(parser):
+    parser.add_argument('--threads', type=int, default=None,
+                        help="cap OpenCV and native thread pools at this many threads (default: one per pinned core)")
+    parser.add_argument('--cores', metavar='LIST', help="pin this session to these cores, e.g. 0-1 or 2,3")
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help="hold this frame rate by lowering inference cadence and model size under load")
@@ -0,0 +1,140 @@
+import json
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+
+# Latency histogram bucket upper edges, in milliseconds
+HISTOGRAM_EDGES_MS = (1, 2, 4, 8, 16, 33, 66, 133, float('inf'))
+
+
+class _Stage:
+    def __init__(self, window):
+        self.durations = np.zeros(window, dtype=np.float64)
+        self.count = 0
+
+    def add(self, duration):
+        self.durations[self.count % len(self.durations)] = duration
+        self.count += 1
+
+    def recent(self):
+        return self.durations[:min(self.count, len(self.durations))]
+
+
+class StageTimer:
+    # Per-stage rolling latency windows for the frame loops. When disabled every method returns immediately,
+    # so loops can call it unconditionally.
+    def __init__(self, enabled=False, window=300, hud=False, dump_interval=None, dump_file=None):
+        self.enabled = enabled
+        self.window = window
+        self.hud = enabled and hud
+        self.dump_interval = dump_interval
+        self.dump_file = dump_file
+        self.stages = {}
+        self.events = {}
+        self._lock = threading.Lock()
+        self._lap_start = None
+        self._frame_start = None
+        self._frame_times = _Stage(window)
+        self._last_dump = time.perf_counter()
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        # End-to-end frame time is measured start to start, so it includes display and key polling
+        if self._frame_start is not None:
+            self._frame_times.add(now - self._frame_start)
+        self._frame_start = self._lap_start = now
+
+    def lap(self, name):
+        # Records the time since the previous lap (or begin_frame) under `name`
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._lap_start is not None:
+            self.record(name, now - self._lap_start)
+        self._lap_start = now
+
+    def record(self, name, duration):
+        # Thread-safe, for stages timed on other threads (e.g. the pipelined capture and inference stages)
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = _Stage(self.window)
+            stage.add(duration)
+
+    def count(self, event):
+        if not self.enabled:
+            return
+        self.events[event] = self.events.get(event, 0) + 1
+
+    def end_frame(self, frame=None):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.hud and frame is not None:
+            self.draw_hud(frame)
+        if self.dump_interval is not None and now - self._last_dump >= self.dump_interval:
+            self._last_dump = now
+            self.dump()
+
+    def fps(self):
+        recent = self._frame_times.recent()
+        return float(len(recent) / recent.sum()) if recent.sum() else 0.0
+
+    def stats(self):
+        with self._lock:
+            stages = {name: stage.recent().copy() for name, stage in self.stages.items()}
+            counts = {name: stage.count for name, stage in self.stages.items()}
+        summary = {}
+        for name, durations in stages.items():
+            if not len(durations):
+                continue
+            milliseconds = durations * 1e3
+            p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+            histogram = np.searchsorted(HISTOGRAM_EDGES_MS, milliseconds)
+            summary[name] = {
+                "count": counts[name],
+                "mean_ms": round(float(milliseconds.mean()), 3),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "histogram": np.bincount(histogram, minlength=len(HISTOGRAM_EDGES_MS)).tolist(),
+            }
+        return {
+            "time": round(time.time(), 3),
+            "frames": self._frame_times.count,
+            "fps": round(self.fps(), 2),
+            "stages": summary,
+            "events": dict(self.events),
+            "histogram_edges_ms": [edge if edge != float('inf') else None for edge in HISTOGRAM_EDGES_MS],
+        }
+
+    def dump(self):
+        if not self.enabled:
+            return
+        line = json.dumps(self.stats())
+        if self.dump_file is None:
+            print(line, file=sys.stdout, flush=True)
+        else:
+            with open(self.dump_file, 'a') as f:
+                f.write(line + "\n")
+
+    def draw_hud(self, frame):
+        h, w = frame.shape[:2]
+        lines = [f"{self.fps():5.1f} fps"]
+        with self._lock:
+            for name, stage in self.stages.items():
+                recent = stage.recent()
+                if len(recent):
+                    lines.append(f"{name}: {np.median(recent) * 1e3:5.1f} ms")
+        for i, text in enumerate(lines):
+            cv2.putText(frame, text, (w - 230, 20 + i * 18), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 255), 1,
+                        cv2.LINE_AA)
+
+
+DISABLED = StageTimer(enabled=False)
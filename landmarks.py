@@ -0,0 +1,121 @@
+import numpy as np
+
+NUM_LANDMARKS = 33
+# Landmark order after a horizontal flip: each left landmark trades places with its right counterpart
+MIRROR_INDEX = [0, 4, 5, 6, 1, 2, 3, 8, 7, 10, 9, 12, 11, 14, 13, 16, 15, 18, 17, 20, 19, 22, 21,
+                24, 23, 26, 25, 28, 27, 30, 29, 32, 31]
+
+
+class LandmarkFrame:
+    # One pose as a single (33, 4) float32 block: x, y, z and visibility per landmark.
+    __slots__ = ('data',)
+
+    def __init__(self, data=None):
+        if data is None:
+            data = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self.data = data
+
+    @classmethod
+    def from_results(cls, results):
+        if not results.pose_landmarks:
+            return None
+        frame = cls()
+        frame.fill(results.pose_landmarks)
+        return frame
+
+    @classmethod
+    def from_keypoints(cls, keypoints, visibility=None):
+        frame = cls()
+        frame.points[:] = np.asarray(keypoints, dtype=np.float32)[:, :3]
+        frame.visibility[:] = 1.0 if visibility is None else visibility
+        return frame
+
+    def fill(self, pose_landmarks):
+        self.data[:] = [(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark]
+        return self
+
+    @property
+    def points(self):
+        return self.data[:, :3]
+
+    @property
+    def visibility(self):
+        return self.data[:, 3]
+
+    def copy(self):
+        return LandmarkFrame(self.data.copy())
+
+    def to_keypoints(self):
+        return [tuple(p) for p in self.points.tolist()]
+
+    def __array__(self, dtype=None, copy=None):
+        points = self.points
+        if dtype is not None:
+            points = points.astype(dtype)
+        return points.copy() if copy else points
+
+    def __len__(self):
+        return NUM_LANDMARKS
+
+    def __getitem__(self, index):
+        return self.points[index]
+
+    def __iter__(self):
+        return iter(self.points)
+
+
+def as_keypoint_array(keypoints):
+    if isinstance(keypoints, LandmarkFrame):
+        return keypoints.points
+    if isinstance(keypoints, np.ndarray) and keypoints.dtype.kind == 'f':
+        # Any float array (including float16 memory-mapped recordings) is used as-is, without a copy
+        return keypoints
+    if isinstance(keypoints, (list, tuple)) and keypoints and isinstance(keypoints[0], LandmarkFrame):
+        return stack_frames(keypoints)
+    return np.asarray(keypoints, dtype=np.float32)
+
+
+def stack_frames(frames):
+    points = np.empty((len(frames), NUM_LANDMARKS, 3), dtype=np.float32)
+    for i, frame in enumerate(frames):
+        points[i] = as_keypoint_array(frame)
+    return points
+
+
+class LandmarkRing:
+    # Fixed-capacity history of landmark frames; the oldest frame is overwritten once full
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, NUM_LANDMARKS, 4), dtype=np.float32)
+        self.timestamps = np.full(capacity, -np.inf)
+        self.count = 0
+        self._next = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def push(self, frame, timestamp=-np.inf):
+        self.data[self._next] = frame.data if isinstance(frame, LandmarkFrame) else frame
+        self.timestamps[self._next] = timestamp
+        self._next = (self._next + 1) % self.capacity
+        self.count += 1
+
+    def clear(self):
+        self.timestamps[:] = -np.inf
+        self.count = 0
+        self._next = 0
+
+    def ordered(self):
+        # Oldest to newest, as a (len, 33, 4) array
+        if self.count < self.capacity:
+            return self.data[:self.count]
+        return np.roll(self.data, -self._next, axis=0)
+
+    def since(self, start):
+        # Mask over the raw slots (not ordered) for frames pushed at or after `start`
+        return self.timestamps >= start
+
+    def latest(self):
+        if not self.count:
+            return None
+        return LandmarkFrame(self.data[(self._next - 1) % self.capacity])
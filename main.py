@@ -1,19 +1,37 @@
-import calibration
-import overlay
-import evaluation
+import argparse
+from engine import warm_up
+from governor import add_governor_arguments, apply_limits
+from instrumentation import DISABLED, StageTimer
+from orchestrator import SessionOrchestrator
+from sources import add_source_arguments
 
 
-def main():
+def main(timer=DISABLED, analytics_path=None, athlete=None, source=0, max_side=None, stride=1,
+         latency_budget_ms=None, threads=None, cores=None, target_fps=None):
     print("Starting Virtual Boxing Coach...")
-    print("Step 1: Calibrate the system by capturing your ideal stance.")
-    calibration.capture_video_and_save_keypoints()
-
-    print("Step 2: Show overlay to align yourself with the ideal stance.")
-    overlay.show_overlay_and_capture()
-
-    print("Step 3: Evaluate your stance and provide feedback.")
-    evaluation.evaluate_stance()
+    apply_limits(threads, cores)
+    warm_up()
+    # One source, pose engine and window for calibration, overlay and evaluation alike
+    session = SessionOrchestrator(source, max_side, stride, timer, analytics_path=analytics_path, athlete=athlete,
+                                  latency_budget_ms=latency_budget_ms, target_fps=target_fps)
+    session.run()
+    print("Time per stage: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in session.stage_times.items()))
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Virtual Boxing Coach")
+    parser.add_argument('--profile', action='store_true', help="time each stage of the frame loops")
+    parser.add_argument('--hud', action='store_true', help="with --profile, draw fps and stage timings on screen")
+    parser.add_argument('--stats-interval', type=float, default=5.0, help="seconds between stats dumps")
+    parser.add_argument('--stats-file', help="append stats as JSON lines to this file instead of stdout")
+    parser.add_argument('--analytics', metavar='DB', help="add this session's outcomes to a SQLite analytics store")
+    parser.add_argument('--athlete', help="who is training, for per-athlete analytics")
+    parser.add_argument('--adaptive', metavar='BUDGET_MS', type=float,
+                        help="crop, downscale and skip still frames to keep inference within this latency budget")
+    add_source_arguments(parser)
+    add_governor_arguments(parser)
+    args = parser.parse_args()
+    main(StageTimer(enabled=args.profile, hud=args.hud, dump_interval=args.stats_interval, dump_file=args.stats_file),
+         analytics_path=args.analytics, athlete=args.athlete, source=args.source, max_side=args.max_side,
+         stride=args.stride, latency_budget_ms=args.adaptive, threads=args.threads, cores=args.cores,
+         target_fps=args.target_fps)
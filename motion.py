@@ -0,0 +1,190 @@
+import argparse
+from collections import namedtuple
+import numpy as np
+from landmarks import NUM_LANDMARKS, LandmarkFrame, as_keypoint_array
+from recording import LandmarkRecording
+from stance_library import normalize_pose
+from utils import mp_pose
+
+L = mp_pose.PoseLandmark
+PHASES = ('step-in', 'guard-raise', 'set')
+
+# One live frame's place in the reference motion. `similarity` is 1 for a perfect copy and falls towards 0 as the
+# mean joint distance along the alignment grows past `tolerance` torso lengths; `worst_joints` maps each phase passed
+# so far to its (landmark, mean distance) pairs, worst first
+MotionScore = namedtuple('MotionScore', ['similarity', 'cost', 'progress', 'reference_index', 'phase',
+                                         'worst_joints', 'finished'])
+
+
+def _visibility(keypoints, min_visibility):
+    if isinstance(keypoints, LandmarkFrame):
+        return keypoints.visibility >= min_visibility
+    keypoints = np.asarray(keypoints)
+    if keypoints.shape[-1] == 4:
+        return keypoints[..., 3] >= min_visibility
+    return np.ones(keypoints.shape[:-1], dtype=bool)
+
+
+class MotionReference:
+    # A recorded movement, such as getting into stance, as poses in torso units (see stance_library.normalize_pose),
+    # so the athlete's position and size in the frame don't matter. Frames are split into named phases, equal
+    # lengths by default, or ending at the given frame indices
+    def __init__(self, keypoints, aspect=4 / 3, phases=PHASES, phase_ends=None, min_visibility=0.5):
+        keypoints = np.asarray(as_keypoint_array(keypoints), dtype=np.float32)
+        self.poses = normalize_pose(keypoints, aspect)
+        self.visible = _visibility(keypoints, min_visibility)
+        self.phases = tuple(phases)
+        if phase_ends is None:
+            phase_ends = np.linspace(0, len(self.poses), len(self.phases) + 1)[1:]
+        self.phase_of = np.searchsorted(np.asarray(phase_ends), np.arange(len(self.poses)), side='right')
+        self.phase_of = np.minimum(self.phase_of, len(self.phases) - 1)
+
+    def __len__(self):
+        return len(self.poses)
+
+    @classmethod
+    def from_recording(cls, path, start=0, stop=None, fps=15.0, **options):
+        # The frames of a .lmk recording with a pose in them, resampled to `fps` so the reference advances about one
+        # frame per live frame at the rate the coach runs inference
+        recording = LandmarkRecording(path)
+        present = np.flatnonzero(recording.present[start:stop]) + start
+        if not len(present):
+            raise ValueError(f"No poses in {path}")
+        timestamps = recording.timestamps[present]
+        if fps:
+            grid = np.arange(timestamps[0], timestamps[-1] + 1e-9, 1 / fps)
+            present = present[np.unique(np.minimum(np.searchsorted(timestamps, grid), len(present) - 1))]
+        keypoints = np.concatenate([recording.points[present], recording.visibility_scores()[present, :, None]],
+                                   axis=-1)
+        frame_size = recording.frame_size
+        aspect = frame_size[1] / frame_size[0] if frame_size else 4 / 3
+        return cls(keypoints, aspect, **options)
+
+
+class MotionMatcher:
+    # Aligns the live landmark stream to a reference motion with dynamic time warping, one frame at a time. Each
+    # live frame moves the alignment 0, 1 or 2 reference frames on, so every cell depends only on the previous
+    # column and a whole column is a few array operations over joints. Only a band of `band` reference frames
+    # around the current alignment is computed and kept, so the cost per frame doesn't grow with the reference or
+    # the history
+    def __init__(self, reference, aspect=4 / 3, band=32, tolerance=0.3, min_visibility=0.5, top_joints=3):
+        self.reference = reference
+        self.aspect = aspect
+        self.band = band
+        self.tolerance = tolerance
+        self.min_visibility = min_visibility
+        self.top_joints = top_joints
+        self.reset()
+
+    def reset(self):
+        # Before the first frame, a single unreachable cell: every alignment has to start fresh
+        phases = len(self.reference.phases)
+        self._lo = 0
+        self._cost = np.full(1, np.inf)  # Accumulated cost of the best alignment ending at each band cell
+        self._steps = np.ones(1)  # Live frames in that alignment
+        # Per-joint distance sums and visible counts along each cell's alignment, by phase
+        self._joint_error = np.zeros((1, phases, NUM_LANDMARKS))
+        self._joint_count = np.zeros((1, phases, NUM_LANDMARKS))
+        self.frames = 0
+        self._last_keypoints = None
+
+    def _best_cell(self):
+        # The band cell whose alignment has the lowest mean cost. A fresh start on the current frame only counts if
+        # nothing else is reachable, or one good frame would pull the band back off a long alignment
+        mean_cost = self._cost / self._steps
+        if self._lo == 0 and len(mean_cost) > 1 and np.isfinite(mean_cost[1:]).any():
+            return 1 + int(np.argmin(mean_cost[1:]))
+        return int(np.argmin(mean_cost))
+
+    def _window(self):
+        # Reference frames computed for the next live frame: the band around the best alignment so far, reaching at
+        # least two frames past it for the largest step
+        best = self._lo + self._best_cell()
+        lo = max(0, best - self.band // 2)
+        return lo, min(len(self.reference), max(lo + self.band, best + 3))
+
+    def update(self, keypoints):
+        # Adds one live pose and returns the MotionScore. The pipelined loop hands the same landmarks to every frame
+        # until the next inference; those repeats are not new frames of the movement
+        if keypoints is self._last_keypoints:
+            return self.score()
+        self._last_keypoints = keypoints
+        reference = self.reference
+        lo, hi = self._window()
+        cells = np.arange(lo, hi)
+
+        # Distances from this pose to every reference frame in the band, per joint: (band, 33)
+        query = normalize_pose(keypoints, self.aspect)
+        visible = _visibility(keypoints, self.min_visibility) & reference.visible[lo:hi]
+        distances = np.linalg.norm(reference.poses[lo:hi] - query, axis=-1) * visible
+        frame_cost = distances.sum(axis=-1) / np.maximum(visible.sum(axis=-1), 1)
+
+        # Each cell continues the cheapest of its predecessors in the previous column: the same reference frame,
+        # one back or two back
+        predecessors = cells[:, None] - np.arange(3) - self._lo
+        valid = (predecessors >= 0) & (predecessors < len(self._cost))
+        predecessors = np.where(valid, predecessors, 0)
+        candidates = np.where(valid, self._cost[predecessors], np.inf)
+        previous = predecessors[np.arange(len(cells)), np.argmin(candidates, axis=1)]
+        carried = self._cost[previous]
+        # The first reference frame always starts afresh, so the athlete can begin the movement whenever they like
+        fresh = cells == 0
+        cost = np.where(fresh, frame_cost, carried + frame_cost)
+        steps = np.where(fresh, 1, self._steps[previous] + 1)
+        joint_error = np.where(fresh[:, None, None], 0, self._joint_error[previous])
+        joint_count = np.where(fresh[:, None, None], 0, self._joint_count[previous])
+        rows, phase = np.arange(len(cells)), reference.phase_of[lo:hi]
+        joint_error[rows, phase] += distances
+        joint_count[rows, phase] += visible
+
+        self._lo, self._cost, self._steps = lo, cost, steps
+        self._joint_error, self._joint_count = joint_error, joint_count
+        self.frames += 1
+        return self.score()
+
+    def score(self):
+        # The best alignment so far, or None before the first live frame
+        if not self.frames:
+            return None
+        cell = self._best_cell()
+        index = self._lo + cell
+        cost = float(self._cost[cell] / self._steps[cell])
+        reference = self.reference
+        phase = int(reference.phase_of[index])
+        errors = self._joint_error[cell] / np.maximum(self._joint_count[cell], 1)
+        worst_joints = {}
+        for p in range(phase + 1):
+            seen = self._joint_count[cell, p] > 0
+            order = [j for j in np.argsort(-errors[p]) if seen[j]][:self.top_joints]
+            worst_joints[reference.phases[p]] = [(L(int(j)), float(errors[p, j])) for j in order]
+        return MotionScore(float(np.exp(-cost / self.tolerance)), cost, (index + 1) / len(reference), index,
+                           reference.phases[phase], worst_joints, index == len(reference) - 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a recorded stance entry against a reference recording")
+    parser.add_argument('reference', help=".lmk recording of the reference movement")
+    parser.add_argument('attempt', help=".lmk recording to grade")
+    parser.add_argument('--fps', type=float, default=15, help="rate both recordings are compared at")
+    parser.add_argument('--band', type=int, default=32, help="reference frames searched around the alignment")
+    args = parser.parse_args()
+    reference = MotionReference.from_recording(args.reference, fps=args.fps)
+    attempt = LandmarkRecording(args.attempt)
+    size = attempt.frame_size
+    matcher = MotionMatcher(reference, aspect=size[1] / size[0] if size else 4 / 3, band=args.band)
+    score, next_time = None, -np.inf
+    for i in range(len(attempt)):
+        frame = attempt.frame(i)
+        if frame is None or attempt.timestamps[i] < next_time:
+            continue
+        next_time = attempt.timestamps[i] + 1 / args.fps
+        score = matcher.update(frame)
+        if score.finished:
+            break
+    if score is None:
+        print("No poses in the attempt.")
+    else:
+        print(f"Similarity {score.similarity:.0%} (mean joint distance {score.cost:.3f} torso lengths), "
+              f"{score.progress:.0%} of the reference reached")
+        for phase, joints in score.worst_joints.items():
+            print(f"  {phase}: " + ", ".join(f"{joint.name.lower()} {error:.2f}" for joint, error in joints))
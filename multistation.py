@@ -0,0 +1,264 @@
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from buffers import FrameRing, SharedFrameRing
+from engine import create_pose
+from governor import apply_limits, session_cores
+from landmarks import LandmarkFrame
+from rendering import draw_text
+from sources import open_source, parse_source
+from steps import StepMachine
+from utils import draw_keypoints_with_lines
+
+
+def _pose_worker(tasks, results, model_complexity, ring_spec, cores=None):
+    # Each worker process serves a fixed set of streams, with a Pose per stream: MediaPipe tracks from the last
+    # frame it saw, which has to be the same station's. Images arrive in shared memory; the task only names the
+    # slot. One inference at a time per worker, so OpenCV gets one thread and the worker stays on its own cores if
+    # it was given some
+    apply_limits(threads=1, cores=cores)
+    poses = {}
+    ring = SharedFrameRing(*ring_spec)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        stream_id, sequence, slot, shape = task
+        pose = poses.get(stream_id)
+        if pose is None:
+            pose = poses[stream_id] = create_pose(model_complexity=model_complexity)
+        start = time.perf_counter()
+        landmarks = LandmarkFrame.from_results(pose.process(ring.view(slot, shape)))
+        results.put((stream_id, sequence, None if landmarks is None else landmarks.data,
+                     time.perf_counter() - start))
+    for pose in poses.values():
+        pose.close()
+    ring.close()
+
+
+def prepare_image(frame, inference_size):
+    # BGR frame to the RGB model input, downscaled so its longest side is at most inference_size
+    h, w = frame.shape[:2]
+    scale = inference_size / max(h, w)
+    if scale < 1:
+        frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+class Stream:
+    def __init__(self, stream_id, source, hold_time):
+        self.stream_id = stream_id
+        self.source = parse_source(source)
+        self.machine = StepMachine(hold_time=hold_time)
+        self.lock = threading.Lock()
+        self.frame = None
+        self.frame_time = None
+        self.frame_sequence = 0
+        self.dispatched_sequence = 0  # Nothing to dispatch until the first frame arrives
+        self.dispatched_time = None
+        self.slot = None  # Shared-memory slot holding the frame being inferred
+        self.display = FrameRing(1)
+        self.in_flight = False
+        self.last_dispatch = 0.0
+        self.landmarks = None
+        self.result = None
+        self.ended = False
+        self.inferred = 0
+        self.started = None
+
+    def capture(self, stop_event):
+        # The stream keeps only its newest frame itself, so there is nothing to gain from decoding ahead
+        cap = open_source(self.source, prefetch=0)
+        # Files stand in for cameras, so they are paced to their own frame rate
+        pace = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30) if isinstance(self.source, str) else 0
+        # A frame stays the stream's latest until the next read completes; readers take it under the lock
+        frames = FrameRing(2)
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = frames.read(cap)
+            if not ret:
+                break
+            with self.lock:
+                self.frame = frame
+                self.frame_time = time.time()
+                self.frame_sequence += 1
+            if pace:
+                time.sleep(max(0.0, pace - (time.perf_counter() - start)))
+        cap.release()
+        self.ended = True
+
+    def fps(self):
+        if self.started is None:
+            return 0.0
+        return self.inferred / max(time.time() - self.started, 1e-6)
+
+
+class MultiStationServer:
+    def __init__(self, sources, workers=None, target_fps=15, inference_size=640, hold_time=3, show=False,
+                 model_complexity=1, pin=False):
+        self.streams = [Stream(i, source, hold_time) for i, source in enumerate(sources)]
+        # A stream always goes to the same worker, so there is no use for more workers than streams
+        self.workers = min(workers or max(1, multiprocessing.cpu_count() - 1), len(self.streams))
+        self.min_interval = 1 / target_fps if target_fps else 0
+        self.target_fps = target_fps
+        self.inference_size = inference_size
+        self.show = show
+        self.model_complexity = model_complexity
+        self.pin = pin  # Give each worker a core of its own, leaving the first for capture and dispatch
+        self.stop_event = threading.Event()
+
+    def _worker_of(self, stream):
+        return stream.stream_id % self.workers
+
+    def _next_stream(self, now, busy):
+        # Least recently served stream with a fresh frame and an idle worker, held to its fps cap so no station
+        # starves the others
+        ready = [stream for stream in self.streams
+                 if not stream.in_flight and self._worker_of(stream) not in busy
+                 and stream.frame_sequence > stream.dispatched_sequence
+                 and now - stream.last_dispatch >= self.min_interval]
+        return min(ready, key=lambda stream: stream.last_dispatch, default=None)
+
+    def _dispatch(self, tasks, ring):
+        busy = {self._worker_of(stream) for stream in self.streams if stream.in_flight}
+        while len(busy) < self.workers:
+            now = time.time()
+            stream = self._next_stream(now, busy)
+            if stream is None:
+                return
+            # At most one frame per worker is in flight, so a slot is always free here unless a worker has hung
+            slot = ring.acquire(timeout=5)
+            if slot is None:
+                raise RuntimeError("No free frame slot: a pose worker has stopped answering")
+            with stream.lock:
+                sequence, frame_time = stream.frame_sequence, stream.frame_time
+                shape = ring.put_rgb(slot, stream.frame)
+            stream.slot = slot
+            stream.in_flight = True
+            stream.dispatched_sequence = sequence
+            stream.dispatched_time = frame_time
+            stream.last_dispatch = now
+            if stream.started is None:
+                stream.started = now
+            worker = self._worker_of(stream)
+            tasks[worker].put((stream.stream_id, sequence, slot, shape))
+            busy.add(worker)
+
+    def _apply(self, stream_id, data, ring):
+        stream = self.streams[stream_id]
+        ring.release(stream.slot)
+        stream.in_flight = False
+        stream.inferred += 1
+        stream.landmarks = None if data is None else LandmarkFrame(data)
+        if stream.landmarks is None or stream.machine.done:
+            return
+        step_before = stream.machine.current_step
+        # Hold times run on the capture clock of the frame that was actually scored
+        stream.result = stream.machine.update(stream.frame.shape, stream.landmarks, stream.dispatched_time)
+        if stream.machine.current_step != step_before:
+            print(f"[station {stream_id}] completed {stream.result.step_name}")
+
+    def _render(self, stream):
+        with stream.lock:
+            if stream.frame is None:
+                return
+            frame = stream.display.get(stream.frame.shape)
+            np.copyto(frame, stream.frame)
+        if stream.landmarks is not None:
+            draw_keypoints_with_lines(frame, stream.landmarks)
+        if stream.machine.done:
+            text = "Congrats! You're in a perfect boxing stance!"
+        elif stream.result is not None:
+            text = f"{stream.result.step_name}: {stream.machine.feedback_text(stream.result) or ''}"
+        else:
+            text = stream.machine.steps[stream.machine.current_step].name
+        draw_text(frame, text, (10, 30), 0.5, (0, 255, 0), 1)
+        cv2.putText(frame, f"{stream.fps():.1f} fps", (10, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1,
+                    cv2.LINE_AA)
+        cv2.imshow(f"Station {stream.stream_id}", frame)
+
+    def run(self, duration=None):
+        context = multiprocessing.get_context('spawn')
+        tasks, results = [context.Queue() for _ in range(self.workers)], context.Queue()
+        ring = SharedFrameRing(self.workers, (self.inference_size, self.inference_size, 3))
+        workers = [context.Process(target=_pose_worker, daemon=True,
+                                   args=(tasks[i], results, self.model_complexity, ring.spec(),
+                                         session_cores(i + 1, 1) if self.pin else None))
+                   for i in range(self.workers)]
+        for worker in workers:
+            worker.start()
+        captures = [threading.Thread(target=stream.capture, args=(self.stop_event,), daemon=True)
+                    for stream in self.streams]
+        for thread in captures:
+            thread.start()
+
+        started = time.time()
+        try:
+            while not self.stop_event.is_set():
+                # A worker that died would leave its streams in flight for good
+                for i, worker in enumerate(workers):
+                    if not worker.is_alive():
+                        raise RuntimeError(f"Pose worker {i} exited with code {worker.exitcode}")
+                self._dispatch(tasks, ring)
+                try:
+                    stream_id, _, data, _ = results.get(timeout=0.005)
+                    self._apply(stream_id, data, ring)
+                    while True:
+                        stream_id, _, data, _ = results.get_nowait()
+                        self._apply(stream_id, data, ring)
+                except queue.Empty:
+                    pass
+                if self.show:
+                    for stream in self.streams:
+                        self._render(stream)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                # Ended, and the last frame it produced (if any) has been scored
+                finished = all(stream.ended and not stream.in_flight
+                               and stream.dispatched_sequence >= stream.frame_sequence for stream in self.streams)
+                if finished or (duration is not None and time.time() - started >= duration):
+                    break
+        finally:
+            self.stop_event.set()
+            for worker_tasks in tasks:
+                worker_tasks.put(None)
+            for worker in workers:
+                worker.join(timeout=5)
+            ring.close()
+            if self.show:
+                cv2.destroyAllWindows()
+        return self.stats()
+
+    def stats(self):
+        return [{
+            "station": stream.stream_id,
+            "source": stream.source,
+            "fps": round(stream.fps(), 2),
+            "below_target": bool(self.target_fps and stream.fps() < 0.9 * self.target_fps),
+            "completed_steps": stream.machine.current_step,
+            "completed": stream.machine.done,
+        } for stream in self.streams]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coach several stations from one host")
+    parser.add_argument('sources', nargs='+', help="camera indices or video files, one per station")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="pose worker processes, at most one per station (default: CPU count - 1)")
+    parser.add_argument('--fps', type=float, default=15, help="inference rate to hold for every station")
+    parser.add_argument('--inference-size', type=int, default=640, help="longest side of frames sent to workers")
+    parser.add_argument('--hold-time', type=float, default=3)
+    parser.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2))
+    parser.add_argument('--duration', type=float, default=None, help="stop after this many seconds")
+    parser.add_argument('--show', action='store_true', help="open one window per station")
+    parser.add_argument('--pin', action='store_true', help="pin each pose worker to a core of its own")
+    args = parser.parse_args()
+    server = MultiStationServer(args.sources, workers=args.workers, target_fps=args.fps,
+                                inference_size=args.inference_size, hold_time=args.hold_time, show=args.show,
+                                model_complexity=args.model_complexity, pin=args.pin)
+    for station in server.run(args.duration):
+        print(station)
@@ -0,0 +1,128 @@
+import time
+import cv2
+from analytics import AnalyticsStore, SessionStats
+from buffers import FrameRing
+from calibration import Calibration, save_keypoints
+from engine import get_pose
+from evaluation import StanceEvaluation
+from governor import CpuGovernor
+from instrumentation import DISABLED
+from landmarks import LandmarkFrame
+from overlay import IdealPoseOverlay
+from rendering import draw_label
+from scheduler import AdaptiveInference
+from sources import open_source, source_label
+from utils import load_ideal_keypoints
+
+WINDOW_NAME = 'Boxing Coach'
+STAGES = ('calibration', 'alignment', 'evaluation')
+ANNOUNCEMENTS = {
+    'calibration': "Step 1: Calibrate the system by capturing your ideal stance.",
+    'alignment': "Step 2: Show overlay to align yourself with the ideal stance.",
+    'evaluation': "Step 3: Evaluate your stance and provide feedback.",
+}
+
+
+class SessionOrchestrator:
+    # Calibration, overlay and evaluation as stages of one frame loop. The source, pose engine and window stay open
+    # from the first frame to the last, and the calibrated stance reaches the overlay in memory (it is still saved
+    # for later sessions). n moves on to the next stage, q ends the session
+    def __init__(self, source=0, max_side=None, stride=1, timer=DISABLED, analytics_path=None, athlete=None,
+                 ideal_keypoints_path='ideal_keypoints.pkl', latency_budget_ms=None, target_fps=None):
+        self.source = source
+        self.max_side = max_side
+        self.stride = stride
+        self.timer = timer
+        self.analytics_path = analytics_path
+        self.ideal_keypoints_path = ideal_keypoints_path
+        self.latency_budget_ms = latency_budget_ms
+        self.target_fps = target_fps
+        self.calibration = Calibration(timer=timer)
+        self.overlay = None
+        self.stats = None
+        if analytics_path is not None:
+            self.stats = SessionStats(athlete=athlete, program='evaluation', source=source_label(source))
+        self.evaluation = StanceEvaluation(stats=self.stats, timer=timer)
+        self.stage = None
+        self.stage_times = {}  # Seconds spent in each stage
+
+    def _enter(self, stage):
+        now = time.time()
+        if self.stage is not None:
+            self.stage_times[self.stage] = now - self._stage_started
+        self.stage, self._stage_started = stage, now
+        if stage is not None:
+            print(ANNOUNCEMENTS[stage])
+
+    def _finish_calibration(self):
+        keypoints, quality = self.calibration.result()
+        if keypoints is None:
+            print("No landmarks detected during calibration; using the saved ideal stance.")
+            keypoints = load_ideal_keypoints(self.ideal_keypoints_path)
+        else:
+            save_keypoints(keypoints, quality, self.ideal_keypoints_path)
+        self.overlay = IdealPoseOverlay(keypoints)
+
+    def advance(self):
+        # On to the next stage, or the end of the session after the last one
+        if self.stage == 'calibration':
+            self._finish_calibration()
+        index = STAGES.index(self.stage) + 1
+        self._enter(STAGES[index] if index < len(STAGES) else None)
+
+    def render(self, frame, keypoints, now):
+        # Draws the current stage on the frame; True once the stage is finished
+        if self.stage == 'calibration':
+            return self.calibration.update(frame, keypoints)
+        if self.stage == 'alignment':
+            self.overlay.apply(frame)
+            self.timer.lap('overlay')
+            draw_label(frame, "Line up with the skeleton, then press n", (10, 30), 0.7, (255, 0, 0), 2)
+            return False
+        return self.evaluation.update(frame, keypoints, now)
+
+    def run(self):
+        # Returns True if every evaluation step was completed
+        timer = self.timer
+        cap = open_source(self.source, max_side=self.max_side, stride=self.stride)
+        pose = get_pose()  # Warmed up by main() while the source opens
+        adaptive = AdaptiveInference(pose, budget_ms=self.latency_budget_ms) if self.latency_budget_ms else None
+        if self.target_fps:
+            adaptive = CpuGovernor(pose, self.target_fps, adaptive=adaptive, pose_options={})
+        frames, rgb = FrameRing(1), FrameRing(1)
+        self._enter(STAGES[0])
+        try:
+            while self.stage is not None and cap.isOpened():
+                timer.begin_frame()
+                ret, frame = frames.read(cap)
+                if not ret:
+                    break
+                timer.lap('capture')
+                now = time.time()
+                if adaptive is not None:
+                    current_keypoints = adaptive.process_frame(frame)
+                else:
+                    image = rgb.to_rgb(frame)
+                    timer.lap('convert')
+                    current_keypoints = LandmarkFrame.from_results(pose.process(image))
+                timer.lap('inference')
+                done = self.render(frame, current_keypoints, now)
+                timer.end_frame(frame)
+                cv2.imshow(WINDOW_NAME, frame)
+                key = cv2.waitKey(1) & 0xFF
+                timer.lap('display')
+                if key == ord('q'):
+                    break
+                if done or key == ord('n'):
+                    self.advance()
+        finally:
+            reached_evaluation = self.stage == 'evaluation' or 'evaluation' in self.stage_times
+            self._enter(None)
+            timer.dump()
+            cap.release()
+            cv2.destroyAllWindows()
+        if self.stats is not None and reached_evaluation:
+            with AnalyticsStore(self.analytics_path) as store:
+                store.add(self.stats.record([step.name for step in self.evaluation.machine.steps]))
+        return self.evaluation.machine.done
+
@@ -1,33 +1,85 @@
+import argparse
 import cv2
-import pickle
 import numpy as np
-from utils import draw_keypoints
+from buffers import FrameRing
+from features import PoseFeatures
+from instrumentation import DISABLED
+from sources import add_source_arguments, open_source
+from utils import draw_keypoints_with_lines, load_ideal_keypoints
 
 
-def load_ideal_keypoints(filename='ideal_keypoints.pkl'):
-    with open(filename, 'rb') as f:
-        return pickle.load(f)
+class IdealPoseOverlay:
+    # The ideal skeleton never changes between frames, so it is rasterized once per resolution and
+    # only its own pixels are blended into each frame
+    def __init__(self, ideal_keypoints, alpha=0.5):
+        self.alpha = alpha
+        self.set_ideal_keypoints(ideal_keypoints)
 
+    def set_ideal_keypoints(self, ideal_keypoints):
+        self.ideal_keypoints = np.array(ideal_keypoints, dtype=np.float32)
+        self._size = None
+        self._indices = None
+        self._colors = None
+        self.ideal_features = None
 
-ideal_keypoints = load_ideal_keypoints()
+    def _rasterize(self, h, w):
+        layer = np.zeros((h, w, 3), dtype=np.uint8)
+        draw_keypoints_with_lines(layer, self.ideal_keypoints)
+        mask = layer.any(axis=2)
+        self._indices = np.flatnonzero(mask)
+        # Pre-scaled layer colours, so compositing is one multiply-add per masked pixel
+        self._colors = layer.reshape(-1, 3)[self._indices].astype(np.float32) * self.alpha
+        # Scratch space for the masked pixels, so compositing a frame allocates nothing
+        self._gathered = np.empty((len(self._indices), 3), dtype=np.uint8)
+        self._blended = np.empty((len(self._indices), 3), dtype=np.float64)
+        # Ideal-pose geometry at this resolution, so live frames are compared against it without recomputing it
+        self.ideal_features = PoseFeatures(self.ideal_keypoints, (h, w))
+        self._size = (h, w)
 
+    def apply(self, frame):
+        h, w = frame.shape[:2]
+        if self._size != (h, w):
+            self._rasterize(h, w)
+        if not frame.flags.c_contiguous:
+            frame[:] = self.apply(np.ascontiguousarray(frame))
+            return frame
+        pixels = frame.reshape(-1, 3)
+        blended = np.multiply(np.take(pixels, self._indices, axis=0, out=self._gathered), 1 - self.alpha,
+                              out=self._blended)
+        blended += self._colors
+        blended += 0.5  # Never exceeds 255.5, so the truncating store below rounds without a clip
+        pixels[self._indices] = blended
+        return frame
 
-def show_overlay_and_capture():
-    cap = cv2.VideoCapture(0)
+
+def show_overlay_and_capture(timer=DISABLED, ideal_keypoints=None, source=0, max_side=None, stride=1):
+    if ideal_keypoints is None:
+        ideal_keypoints = load_ideal_keypoints()
+    cap = open_source(source, max_side=max_side, stride=stride)
+    overlay = IdealPoseOverlay(ideal_keypoints)
+    frames = FrameRing(1)
     while cap.isOpened():
-        ret, frame = cap.read()
+        timer.begin_frame()
+        ret, frame = frames.read(cap)
         if not ret:
             break
-        overlay_frame = frame.copy()
-        draw_keypoints(overlay_frame, ideal_keypoints)
-        combined_frame = cv2.addWeighted(frame, 0.5, overlay_frame, 0.5, 0)
+        timer.lap('capture')
+        combined_frame = overlay.apply(frame)
+        timer.lap('overlay')
+        timer.end_frame(combined_frame)
         cv2.imshow('Overlay', combined_frame)
 
-        if cv2.waitKey(10) & 0xFF == ord('n'):
+        key = cv2.waitKey(10)
+        timer.lap('display')
+        if key & 0xFF == ord('n'):
             break
+    timer.dump()
     cap.release()
     cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
-    show_overlay_and_capture()
+    parser = argparse.ArgumentParser(description="Show the ideal stance over the camera picture")
+    add_source_arguments(parser)
+    args = parser.parse_args()
+    show_overlay_and_capture(source=args.source, max_side=args.max_side, stride=args.stride)
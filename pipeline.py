@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from buffers import FrameRing
+from instrumentation import DISABLED
+from landmarks import LandmarkFrame
+
+
+def put_latest(q, item):
+    # Bounded hand-off that replaces a stale item instead of blocking; returns True if something was dropped
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+
+class PosePipeline:
+    def __init__(self, cap, pose, render_queue_size=2, on_landmarks=None, timer=DISABLED, adaptive=None):
+        self.cap = cap
+        self.pose = pose
+        self.adaptive = adaptive
+        self.on_landmarks = on_landmarks
+        self.timer = timer
+        self.inference_queue = queue.Queue(maxsize=1)
+        self.render_queue = queue.Queue(maxsize=render_queue_size)
+        self.stop_event = threading.Event()
+        self.capture_ended = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = (None, None)
+        self._threads = []
+        self.captured_frames = 0
+        self.inferred_frames = 0
+        self.dropped_inference_frames = 0
+        self.dropped_render_frames = 0
+        # A captured frame can sit in the render queue, be drawn on, and be on screen while the next one is read;
+        # its RGB copy can be queued and being inferred while the next one is converted
+        self._frames = FrameRing(render_queue_size + 3)
+        self._rgb = FrameRing(3)
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._capture, name='coach-capture', daemon=True),
+            threading.Thread(target=self._inference, name='coach-inference', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        # Waits for both threads, so the capture can be released afterwards without a read still in flight
+        self.stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def latest_landmarks(self):
+        with self._lock:
+            return self._latest
+
+    def _capture(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self._frames.read(self.cap)
+            if not ret:
+                break
+            capture_time = time.time()
+            self.captured_frames += 1
+            converted = time.perf_counter()
+            # Convert here so the render stage can draw on the BGR frame while inference reads its own copy
+            if self.adaptive is not None:
+                job = self.adaptive.prepare(frame)
+            else:
+                job = self._rgb.to_rgb(frame)
+            self.timer.record('capture', converted - start)
+            self.timer.record('convert', time.perf_counter() - converted)
+            if job is not None and put_latest(self.inference_queue, (job, capture_time)):
+                self.dropped_inference_frames += 1
+            if put_latest(self.render_queue, (frame, capture_time)):
+                self.dropped_render_frames += 1
+        self.capture_ended.set()
+        put_latest(self.render_queue, None)
+
+    def _inference(self):
+        while not self.stop_event.is_set():
+            try:
+                job, capture_time = self.inference_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            if self.adaptive is not None:
+                # The scheduler may swap models under load or move the crop, so it runs the model itself
+                results = self.adaptive.run(job)
+                keypoints = self.adaptive.finish(job, results, time.perf_counter() - start)
+            else:
+                results = self.pose.process(job)
+                keypoints = LandmarkFrame.from_results(results)
+            self.timer.record('inference', time.perf_counter() - start)
+            self.inferred_frames += 1
+            if self.on_landmarks is not None:
+                self.on_landmarks(keypoints, capture_time)
+            with self._lock:
+                self._latest = (keypoints, capture_time)
+
+    def frames(self):
+        # Yields (frame, latest landmarks, capture time of those landmarks) until capture ends or stop() is called.
+        # Can be called again for the next phase on the same capture; once capture has ended it yields nothing
+        while not self.stop_event.is_set():
+            try:
+                item = self.render_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.capture_ended.is_set():
+                    break
+                continue
+            if item is None:
+                break
+            frame, _ = item
+            keypoints, landmarks_time = self.latest_landmarks()
+            yield frame, keypoints, landmarks_time
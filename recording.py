@@ -0,0 +1,137 @@
+import json
+import os
+import numpy as np
+from landmarks import LandmarkFrame, NUM_LANDMARKS
+
+# A recording is a directory of flat column files, each appended in chunks:
+#   points.f16      (N, 33, 3) float16 x, y, z
+#   visibility.u8   (N, 33) uint8 visibility scaled to 0-255
+#   timestamps.f64  (N,) float64 seconds
+#   present.u8      (N,) uint8, 0 where no pose was detected
+#   meta.json       format version and frame size as (height, width)
+FORMAT_VERSION = 1
+COLUMNS = {
+    'points': ('points.f16', np.float16, (NUM_LANDMARKS, 3)),
+    'visibility': ('visibility.u8', np.uint8, (NUM_LANDMARKS,)),
+    'timestamps': ('timestamps.f64', np.float64, ()),
+    'present': ('present.u8', np.uint8, ()),
+}
+
+
+def _column_frames(path, filename, dtype, shape):
+    filename = os.path.join(path, filename)
+    if not os.path.exists(filename):
+        return 0
+    return os.path.getsize(filename) // (np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int)))
+
+
+class LandmarkRecorder:
+    def __init__(self, path, frame_size=None, chunk_size=256):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"version": FORMAT_VERSION, "num_landmarks": NUM_LANDMARKS, "frame_size": frame_size}
+            with open(meta_path, 'w') as f:
+                json.dump(self.meta, f)
+        self._chunk = {name: np.zeros((chunk_size,) + shape, dtype=dtype)
+                       for name, (_, dtype, shape) in COLUMNS.items()}
+        self._pending = 0
+        self.frames_written = 0
+
+    def append(self, keypoints, timestamp):
+        i = self._pending
+        if keypoints is None:
+            self._chunk['points'][i] = 0
+            self._chunk['visibility'][i] = 0
+            self._chunk['present'][i] = 0
+        else:
+            if not isinstance(keypoints, LandmarkFrame):
+                keypoints = LandmarkFrame.from_keypoints(keypoints)
+            self._chunk['points'][i] = keypoints.points
+            self._chunk['visibility'][i] = np.clip(keypoints.visibility * 255 + 0.5, 0, 255)
+            self._chunk['present'][i] = 1
+        self._chunk['timestamps'][i] = timestamp
+        self._pending += 1
+        if self._pending == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        for name, (filename, _, _) in COLUMNS.items():
+            with open(os.path.join(self.path, filename), 'ab') as f:
+                f.write(self._chunk[name][:self._pending].tobytes())
+        self.frames_written += self._pending
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LandmarkRecording:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported landmark recording version: {self.meta.get('version')}")
+        # A partially flushed chunk only counts up to the shortest column
+        self.frames = min(_column_frames(path, filename, dtype, shape) for filename, dtype, shape in COLUMNS.values())
+        self._columns = {}
+        for name, (filename, dtype, shape) in COLUMNS.items():
+            if self.frames:
+                self._columns[name] = np.memmap(os.path.join(path, filename), dtype=dtype, mode='r',
+                                                shape=(self.frames,) + shape)
+            else:
+                self._columns[name] = np.zeros((0,) + shape, dtype=dtype)
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def frame_size(self):
+        return self.meta.get("frame_size")
+
+    @property
+    def points(self):
+        return self._columns['points']
+
+    @property
+    def visibility(self):
+        return self._columns['visibility']
+
+    @property
+    def timestamps(self):
+        return self._columns['timestamps']
+
+    @property
+    def present(self):
+        return self._columns['present'].view(bool)
+
+    def visibility_scores(self, start=0, stop=None):
+        return self.visibility[start:stop].astype(np.float32) / 255
+
+    def frame(self, index):
+        if not self.present[index]:
+            return None
+        data = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        data[:, :3] = self.points[index]
+        data[:, 3] = self.visibility[index] / 255
+        return LandmarkFrame(data)
+
+    def chunks(self, size=4096):
+        # (points, timestamps, present) views over consecutive slices of the recording
+        for start in range(0, self.frames, size):
+            stop = start + size
+            yield self.points[start:stop], self.timestamps[start:stop], self.present[start:stop]
@@ -0,0 +1,55 @@
+from functools import lru_cache
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class TextSprite:
+    # One string rasterized once. Its anti-aliased coverage becomes per-pixel weights, so drawing it again is a
+    # single integer blend over the text's bounding box instead of another pass through the font renderer
+    def __init__(self, text, scale=0.5, color=(0, 255, 0), thickness=1, font=FONT):
+        (width, height), baseline = cv2.getTextSize(text, font, scale, thickness)
+        pad = thickness + 1  # Anti-aliasing bleeds a pixel past the reported size
+        self.anchor = (pad, pad + height)  # Where the text origin sits inside the sprite
+        coverage = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(coverage, text, self.anchor, font, scale, 255, thickness, cv2.LINE_AA)
+        weights = np.repeat(coverage[:, :, None], 3, axis=2).astype(np.uint16)
+        self.inverse = 255 - weights
+        # Colour pre-multiplied by coverage, plus the rounding term, so each draw is one multiply-add and a divide
+        self.colors = weights * np.array(color, dtype=np.uint16) + 127
+
+    def draw(self, frame, org):
+        sprite_h, sprite_w = self.inverse.shape[:2]
+        frame_h, frame_w = frame.shape[:2]
+        x0, y0 = org[0] - self.anchor[0], org[1] - self.anchor[1]
+        # Clip against the frame edges
+        left, top = max(0, -x0), max(0, -y0)
+        right, bottom = min(sprite_w, frame_w - x0), min(sprite_h, frame_h - y0)
+        if left >= right or top >= bottom:
+            return frame
+        region = frame[y0 + top:y0 + bottom, x0 + left:x0 + right]
+        inverse, colors = self.inverse[top:bottom, left:right], self.colors[top:bottom, left:right]
+        region[:] = (region * inverse + colors) // 255
+        return frame
+
+
+@lru_cache(maxsize=512)
+def text_sprite(text, scale=0.5, color=(0, 255, 0), thickness=1):
+    return TextSprite(text, scale, color, thickness)
+
+
+def draw_label(frame, text, org, scale=0.5, color=(0, 255, 0), thickness=1):
+    # Drop-in for cv2.putText(..., FONT_HERSHEY_SIMPLEX, ..., LINE_AA) for strings drawn over and over: instructions,
+    # step names, fixed feedback. Each is rasterized once and only blended after that. Text that changes from frame
+    # to frame (numbers, ids) goes through draw_text instead, or it would rasterize anyway and churn the cache
+    if not text:
+        return frame
+    return text_sprite(text, scale, tuple(color), thickness).draw(frame, org)
+
+
+def draw_text(frame, text, org, scale=0.5, color=(0, 255, 0), thickness=1):
+    # Same arguments as draw_label, for text that is rarely the same twice
+    if not text:
+        return frame
+    return cv2.putText(frame, text, org, FONT, scale, color, thickness, cv2.LINE_AA)
@@ -0,0 +1,86 @@
+from collections import namedtuple
+import numpy as np
+from utils import join_feedback
+
+# One threshold on one feature. Bounds are inclusive unless `strict`, which makes the upper bound exclusive, and
+# are multiplied by `relative_to` (another feature) when set, e.g. foot distance in shoulder widths
+Rule = namedtuple('Rule', ['feature', 'low', 'high', 'too_low', 'too_high', 'relative_to', 'strict'],
+                  defaults=(-np.inf, np.inf, None, None, None, False))
+
+# Per-rule outcome: the value was below the range, above it, or (neither) inside it
+RuleOutcome = namedtuple('RuleOutcome', ['below', 'above'])
+
+
+def evaluate_rule(rule, features):
+    # Plain bools for a single frame, boolean arrays for a batch
+    value = features.values[rule.feature]
+    if rule.relative_to:
+        scale = features.values[rule.relative_to]
+        low, high = rule.low * scale, rule.high * scale
+    else:
+        low, high = rule.low, rule.high
+    return RuleOutcome(value < low, value >= high if rule.strict else value > high)
+
+
+class Step:
+    # A coaching step as data: the rules that must all pass, what to say for each failure, and optionally which
+    # cues to draw. With `first_failure_only`, later rules stay quiet until the earlier ones pass
+    def __init__(self, name, rules, instruction, success=None, first_failure_only=False, draw=None):
+        self.name = name
+        self.rules = rules
+        self.instruction = instruction
+        self.success = success
+        self.first_failure_only = first_failure_only
+        self.draw = draw
+
+    def outcomes(self, features):
+        return [evaluate_rule(rule, features) for rule in self.rules]
+
+    def _fired(self, outcomes):
+        # Single frame: the messages that fire, in rule order
+        fired = []
+        correct = True
+        for rule, (below, above) in zip(self.rules, outcomes):
+            if below or above:
+                text = rule.too_low if below else rule.too_high
+                if text and (correct or not self.first_failure_only):
+                    fired.append(text)
+                correct = False
+        if correct and self.success is not None:
+            fired.append(self.success)
+        return correct, fired
+
+    def _masks(self, outcomes):
+        # Batch: the same messages as _fired, each with the mask of frames it fires on
+        messages = []
+        earlier_passed = True
+        for rule, (below, above) in zip(self.rules, outcomes):
+            gate = earlier_passed if self.first_failure_only else True
+            messages.append((gate & below, rule.too_low))
+            messages.append((gate & above, rule.too_high))
+            earlier_passed = earlier_passed & ~(below | above)
+        if self.success is not None:
+            messages.append((earlier_passed, self.success))
+        return earlier_passed, [(mask, text) for mask, text in messages if text]
+
+    def evaluate(self, features, outcomes=None):
+        # Returns (correct, feedback); both are per-frame arrays when the features cover a batch
+        if outcomes is None:
+            outcomes = self.outcomes(features)
+        if features.batched:
+            correct, messages = self._masks(outcomes)
+            return correct, join_feedback(messages)
+        correct, fired = self._fired(outcomes)
+        return correct, " ".join(fired)
+
+    def messages(self, features):
+        # The fired messages for a single frame, as a list
+        return self._fired(self.outcomes(features))[1]
+
+    def apply(self, frame, features):
+        # Score the step and, for a single frame on a real image, draw its cues
+        outcomes = self.outcomes(features)
+        correct, feedback = self.evaluate(features, outcomes)
+        if self.draw is not None and isinstance(frame, np.ndarray) and frame.ndim == 3 and not features.batched:
+            self.draw(frame, features, outcomes)
+        return correct, feedback
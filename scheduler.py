@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+from landmarks import LandmarkFrame
+
+# One prepared inference: the RGB model input plus where it sits in the full frame (pixels)
+InferenceJob = namedtuple('InferenceJob', ['image', 'x0', 'y0', 'crop_w', 'crop_h', 'frame_w', 'frame_h'])
+
+TARGET_SIZES = (640, 480, 384, 320, 256)
+
+
+def landmark_box(landmarks, frame_w, frame_h, margin=0.25, min_visibility=0.5):
+    # Pixel (x0, y0, w, h) around the visible landmarks, padded by `margin` of their extent on each side; None if
+    # too few are visible or the box would be too small to infer on
+    points = landmarks.points[landmarks.visibility >= min_visibility]
+    if len(points) < 4:
+        return None
+    x_min, y_min = points[:, :2].min(axis=0)
+    x_max, y_max = points[:, :2].max(axis=0)
+    pad_x, pad_y = (x_max - x_min) * margin, (y_max - y_min) * margin
+    x0 = int(max(0.0, x_min - pad_x) * frame_w)
+    y0 = int(max(0.0, y_min - pad_y) * frame_h)
+    x1 = int(np.ceil(min(1.0, x_max + pad_x) * frame_w))
+    y1 = int(np.ceil(min(1.0, y_max + pad_y) * frame_h))
+    if x1 - x0 < 32 or y1 - y0 < 32:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+def to_frame_coordinates(landmarks, job):
+    # Crop-normalized landmarks from an InferenceJob back to the full frame, in place; z shares x's scale in MediaPipe
+    landmarks.data[:, 0] = (landmarks.data[:, 0] * job.crop_w + job.x0) / job.frame_w
+    landmarks.data[:, 1] = (landmarks.data[:, 1] * job.crop_h + job.y0) / job.frame_h
+    landmarks.data[:, 2] *= job.crop_w / job.frame_w
+    return landmarks
+
+
+class AdaptiveInference:
+    # Runs pose on a downscaled crop around the last landmarks, skips frames with little motion and
+    # tunes input size and skipping to keep inference inside a latency budget. In the pipelined loop prepare() runs
+    # on the capture thread and run() / finish() on the inference thread; what they share is behind a lock
+    def __init__(self, pose, budget_ms=25.0, target_sizes=TARGET_SIZES, margin=0.25, motion_threshold=2.0,
+                 max_skip=4, tune_every=30, min_visibility=0.5):
+        self.pose = pose
+        self.budget = budget_ms / 1000
+        self.target_sizes = target_sizes
+        self.size_index = 0
+        self.margin = margin
+        self.motion_threshold = motion_threshold
+        self.base_max_skip = max_skip
+        self.max_skip = max_skip
+        self.tune_every = tune_every
+        self.min_visibility = min_visibility
+        self.latest = None
+        self._lock = threading.Lock()
+        self._box = None  # The crop prepared frames are cut from
+        self._inferred_box = None  # The crop the model last ran on
+        self._reference_thumbnail = None
+        self._skipped_in_row = 0
+        self._latency_ema = None
+        self._since_tune = 0
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+
+    @property
+    def target_size(self):
+        return self.target_sizes[self.size_index]
+
+    def _thumbnail(self, frame):
+        return cv2.resize(frame, (64, 36), interpolation=cv2.INTER_NEAREST)
+
+    def _roi(self, latest, frame_w, frame_h):
+        # The crop stays put while the athlete stays well inside it, so the model's tracking keeps referring to the
+        # same image. It is re-anchored around the landmarks when they reach its edge or fill too little of it, and
+        # goes back to the full frame when they are lost
+        tight = None if latest is None else landmark_box(latest, frame_w, frame_h, 0.05, self.min_visibility)
+        box = self._box
+        if tight is None:
+            box = None
+        elif box is None or not _contains(box, tight) or tight[2] * tight[3] < 0.25 * box[2] * box[3]:
+            box = landmark_box(latest, frame_w, frame_h, self.margin, self.min_visibility)
+        self._box = box or (0, 0, frame_w, frame_h)
+        return self._box
+
+    def prepare(self, frame):
+        # Returns an InferenceJob, or None when the frame is skipped and the previous landmarks carry forward
+        with self._lock:
+            latest, max_skip, target_size = self.latest, self.max_skip, self.target_size
+        thumbnail = self._thumbnail(frame)
+        if latest is not None and self._reference_thumbnail is not None and self._skipped_in_row < max_skip:
+            motion = cv2.absdiff(thumbnail, self._reference_thumbnail).mean()
+            if motion < self.motion_threshold:
+                self._skipped_in_row += 1
+                self.skipped_frames += 1
+                return None
+        self._skipped_in_row = 0
+        self._reference_thumbnail = thumbnail
+
+        frame_h, frame_w = frame.shape[:2]
+        x0, y0, crop_w, crop_h = self._roi(latest, frame_w, frame_h)
+        crop = frame[y0:y0 + crop_h, x0:x0 + crop_w]
+        scale = target_size / max(crop_w, crop_h)
+        if scale < 1:
+            crop = cv2.resize(crop, (max(1, int(crop_w * scale)), max(1, int(crop_h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        return InferenceJob(image, x0, y0, crop_w, crop_h, frame_w, frame_h)
+
+    def run(self, job):
+        # Inference on a prepared job. When the crop has moved, the model's tracking region belongs to the old one,
+        # so it starts over with detection
+        box = job[1:5]
+        if box != self._inferred_box:
+            reset = getattr(self.pose, 'reset', None)
+            if reset is not None and self._inferred_box is not None:
+                reset()
+            self._inferred_box = box
+        return self.pose.process(job.image)
+
+    def finish(self, job, results, latency):
+        landmarks = LandmarkFrame.from_results(results)
+        if landmarks is not None:
+            to_frame_coordinates(landmarks, job)
+        with self._lock:
+            self.latest = landmarks
+            self.inferred_frames += 1
+            self._tune(latency)
+        return landmarks
+
+    def process_frame(self, frame):
+        job = self.prepare(frame)
+        if job is None:
+            return self.latest
+        start = time.perf_counter()
+        results = self.run(job)
+        return self.finish(job, results, time.perf_counter() - start)
+
+    def _tune(self, latency):
+        self._latency_ema = latency if self._latency_ema is None else 0.9 * self._latency_ema + 0.1 * latency
+        self._since_tune += 1
+        if self._since_tune < self.tune_every:
+            return
+        self._since_tune = 0
+        if self._latency_ema > self.budget:
+            # Over budget: shrink the model input first, then lean harder on motion gating
+            if self.size_index < len(self.target_sizes) - 1:
+                self.size_index += 1
+            else:
+                self.max_skip = min(self.max_skip + 1, 4 * self.base_max_skip + 1)
+        elif self._latency_ema < 0.5 * self.budget:
+            if self.max_skip > self.base_max_skip:
+                self.max_skip -= 1
+            elif self.size_index > 0:
+                self.size_index -= 1
+
+    def stats(self):
+        return {
+            "target_size": self.target_size,
+            "max_skip": self.max_skip,
+            "inferred_frames": self.inferred_frames,
+            "skipped_frames": self.skipped_frames,
+            "latency_ms": round(self._latency_ema * 1e3, 3) if self._latency_ema is not None else None,
+        }
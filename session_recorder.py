@@ -0,0 +1,178 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from landmarks import LandmarkFrame
+from recording import LandmarkRecorder
+
+# A session is a directory written by one background thread:
+#   video.mp4             annotated frames, downsampled to at most max_fps
+#   video_timestamps.f64  (N,) float64 capture time of each written video frame
+#   landmarks/            raw landmarks as a LandmarkRecorder recording
+#   events.jsonl          one JSON object per step/feedback event: {"t": ..., "event": ..., ...}
+#   session.json          written on close: counts of written, skipped and dropped frames
+_STOP = object()
+
+
+def _jsonable(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class SessionRecorder:
+    # Frames, landmarks and events are queued here and written on a writer thread, so a slow disk or encoder never
+    # stalls the coaching loop. Frames are the only thing that may be lost: they are downsampled to max_fps and
+    # dropped outright while max_pending_frames are still waiting. Landmarks and events are always written
+    def __init__(self, directory, max_fps=15, max_pending_frames=8, max_pending_events=4096, scale=1.0,
+                 landmarks_path=None, frame_size=None, fourcc='mp4v'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.max_fps = max_fps
+        self.min_interval = 1 / max_fps if max_fps else 0
+        self.max_pending_frames = max_pending_frames
+        self.scale = scale
+        self.fourcc = fourcc
+        self.landmarks = LandmarkRecorder(landmarks_path or os.path.join(directory, 'landmarks'),
+                                          frame_size=frame_size)
+        self._queue = queue.Queue(maxsize=max_pending_frames + max_pending_events)
+        self._lock = threading.Lock()
+        self._pending_frames = 0
+        self._last_frame_time = None
+        self._last_step = None
+        self._writer = None
+        self._video_timestamps = open(os.path.join(directory, 'video_timestamps.f64'), 'ab')
+        self._events = open(os.path.join(directory, 'events.jsonl'), 'a')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._closed = False
+        self.frames_written = 0
+        self.frames_skipped = 0  # Downsampled away before queueing
+        self.frames_dropped = 0  # Refused because the writer was behind
+        self.events_written = 0
+        self.errors = []
+        self._thread.start()
+
+    # Producer side: called from the coaching loop (and, for landmarks, the inference thread)
+
+    def add_frame(self, frame, timestamp=None):
+        # Returns True if the frame was queued. Never blocks: late frames are skipped, and frames arriving while the
+        # writer is behind are dropped
+        if self._closed:
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        if self._last_frame_time is not None and timestamp - self._last_frame_time < self.min_interval:
+            self.frames_skipped += 1
+            return False
+        with self._lock:
+            if self._pending_frames >= self.max_pending_frames:
+                self.frames_dropped += 1
+                return False
+            self._pending_frames += 1
+        self._last_frame_time = timestamp
+        # The caller goes on drawing into and reusing its frame, so the writer gets its own copy
+        if self.scale != 1:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        self._queue.put(('frame', timestamp, frame))
+        return True
+
+    def append(self, keypoints, timestamp):
+        # Same signature as LandmarkRecorder.append, so a session can stand in for one
+        if isinstance(keypoints, LandmarkFrame):
+            keypoints = keypoints.copy()
+        self._put(('landmarks', timestamp, keypoints))
+
+    def event(self, name, timestamp=None, **fields):
+        self._put(('event', time.time() if timestamp is None else timestamp, dict(event=name, **fields)))
+
+    def log_step(self, result, timestamp=None, done=False):
+        # Only changes are logged: a new step, a flipped verdict or different feedback, plus each completion
+        state = (result.step_name, result.correct, result.feedback)
+        if state != self._last_step:
+            self.event('feedback', timestamp, step=result.step_name, correct=result.correct, feedback=result.feedback)
+            self._last_step = state
+        if result.remaining_time is not None and result.remaining_time <= 0:
+            self.event('step_completed', timestamp, step=result.step_name)
+            self._last_step = None
+        if done:
+            self.event('all_steps_completed', timestamp)
+
+    def _put(self, item):
+        if self._closed:
+            return
+        # Blocks only if thousands of events are waiting, i.e. the disk has stalled; events are never dropped
+        self._queue.put(item)
+
+    # Writer side
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            try:
+                self._write(*item)
+            except Exception as error:
+                # Keep draining so producers never block on a dead writer
+                self.errors.append(repr(error))
+            finally:
+                if item[0] == 'frame':
+                    with self._lock:
+                        self._pending_frames -= 1
+            if self._queue.empty():
+                self._events.flush()
+        self._finish()
+
+    def _write(self, kind, timestamp, payload):
+        if kind == 'frame':
+            if self._writer is None:
+                h, w = payload.shape[:2]
+                self._writer = cv2.VideoWriter(os.path.join(self.directory, 'video.mp4'),
+                                               cv2.VideoWriter_fourcc(*self.fourcc), self.max_fps or 30, (w, h))
+            self._writer.write(payload)
+            self._video_timestamps.write(np.float64(timestamp).tobytes())
+            self.frames_written += 1
+        elif kind == 'landmarks':
+            self.landmarks.append(payload, timestamp)
+        else:
+            record = {"t": timestamp}
+            record.update((key, _jsonable(value)) for key, value in payload.items())
+            self._events.write(json.dumps(record) + "\n")
+            self.events_written += 1
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.release()
+        self.landmarks.close()
+        self._video_timestamps.close()
+        self._events.close()
+        with open(os.path.join(self.directory, 'session.json'), 'w') as f:
+            json.dump(self.stats(), f, indent=2)
+
+    def stats(self):
+        return {
+            "frames_written": self.frames_written,
+            "frames_skipped": self.frames_skipped,
+            "frames_dropped": self.frames_dropped,
+            "landmark_frames": self.landmarks.frames_written,
+            "events_written": self.events_written,
+            "errors": self.errors,
+        }
+
+    def close(self, timeout=None):
+        # Writes out everything already queued, then finalizes the files. Safe to call more than once
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
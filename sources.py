@@ -0,0 +1,259 @@
+import glob
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from buffers import FrameRing
+from synthetic import SyntheticCapture
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def parse_source(source):
+    return int(source) if str(source).isdigit() else source
+
+
+def source_label(source):
+    # How a session's frames arrived, for analytics: 'camera' for a camera index, otherwise the source itself
+    source = parse_source(source)
+    if isinstance(source, int):
+        return 'camera'
+    return source if isinstance(source, str) else type(source).__name__
+
+
+def _fit(shape, max_side):
+    # (width, height) with the longest side at most max_side, or None if the frame is already small enough
+    h, w = shape[:2]
+    scale = max_side / max(h, w) if max_side else 1
+    return (int(w * scale), int(h * scale)) if scale < 1 else None
+
+
+class ImageSequence:
+    # cv2.VideoCapture look-alike over a directory (or glob) of still images, played in name order
+    def __init__(self, pattern, fps=30.0):
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            paths = glob.glob(pattern)
+        self.paths = sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self._index = 0
+        self._opened = bool(self.paths)
+        self._size = cv2.imread(self.paths[0]).shape[:2] if self.paths else (0, 0)
+
+    def isOpened(self):
+        return self._opened
+
+    def grab(self):
+        if not self._opened or self._index >= len(self.paths):
+            return False
+        self._index += 1
+        return True
+
+    def read(self, image=None):
+        if not self._opened or self._index >= len(self.paths):
+            return False, None
+        frame = cv2.imread(self.paths[self._index])
+        self._index += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_HEIGHT: self._size[0], cv2.CAP_PROP_FRAME_WIDTH: self._size[1],
+                cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_POS_FRAMES: self._index,
+                cv2.CAP_PROP_FRAME_COUNT: len(self.paths)}.get(prop, 0)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._index = int(min(max(value, 0), len(self.paths)))
+            return True
+        return False
+
+    def release(self):
+        self._opened = False
+
+
+class PrefetchingSource:
+    # Decodes ahead on a background thread, keeping every `stride`-th frame downscaled so its longest side is at
+    # most max_side. Files and image sequences queue up to `prefetch` frames and never drop one; live cameras keep
+    # only the newest frame so the coach never works from a stale picture. Same interface as cv2.VideoCapture
+    def __init__(self, capture, max_side=None, stride=1, prefetch=4, live=False):
+        self.capture = capture
+        self.max_side = max_side
+        self.stride = max(1, int(stride))
+        self.live = live
+        self._queue = queue.Queue(maxsize=1 if live else prefetch)
+        # Decoded frames sit in the queue, and one more is handed out while the next is decoded
+        self._frames = FrameRing(self._queue.maxsize + 3)
+        self._full_size = FrameRing(1)  # Decode target when frames are downscaled afterwards
+        self._lock = threading.Lock()
+        self._seek_to = None
+        self._generation = 0
+        self._position = int(capture.get(cv2.CAP_PROP_POS_FRAMES) or 0)
+        self._ended = False
+        self._stop = threading.Event()
+        self.dropped_frames = 0
+        self._thread = threading.Thread(target=self._decode, name='frame-source', daemon=True)
+        self._thread.start()
+
+    def _skip(self):
+        # Skip the frames between strides without decoding them where the backend allows it. They come after the
+        # frame kept, so playback and seeks land on the frame asked for
+        for _ in range(self.stride - 1):
+            if not self.capture.grab():
+                break
+
+    def _next_frame(self):
+        position = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES) or 0)
+        if not self.max_side:
+            ret, frame = self._frames.read(self.capture)
+            if ret:
+                self._skip()
+            return ret, frame, position
+        ret, frame = self._full_size.read(self.capture)
+        if not ret:
+            return False, None, None
+        self._skip()
+        size = _fit(frame.shape, self.max_side)
+        if size is None:
+            output = self._frames.get(frame.shape)
+            np.copyto(output, frame)
+        else:
+            output = cv2.resize(frame, size, dst=self._frames.get((size[1], size[0], 3)),
+                                interpolation=cv2.INTER_AREA)
+        return True, output, position
+
+    def _decode(self):
+        while not self._stop.is_set():
+            with self._lock:
+                seek_to, self._seek_to = self._seek_to, None
+                generation = self._generation
+            if seek_to is not None:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, seek_to)
+            ret, frame, position = self._next_frame()
+            item = (generation, frame, position) if ret else (generation, None, None)
+            while not self._stop.is_set():
+                try:
+                    if self.live:
+                        # Replace a frame nobody has taken yet rather than wait for the reader
+                        try:
+                            self._queue.get_nowait()
+                            self.dropped_frames += 1
+                        except queue.Empty:
+                            pass
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self._seek_to is not None:
+                        break
+            if not ret:
+                # End of stream: wait for a seek (or stop) before decoding again
+                while not self._stop.is_set() and self._seek_to is None:
+                    self._stop.wait(0.05)
+
+    def isOpened(self):
+        return not self._ended and self.capture.isOpened()
+
+    def read(self, image=None):
+        # Like cv2.VideoCapture, (False, None) at the end of the stream, and again on every read after it until a
+        # seek, rather than waiting on a decoder that has nothing more to give
+        if self._ended:
+            return False, None
+        while True:
+            try:
+                generation, frame, position = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    self._ended = True  # Released, or the decoder died
+                    return False, None
+                continue
+            if generation == self._generation:
+                break
+        if frame is None:
+            self._ended = True
+            return False, None
+        self._ended = False
+        self._position = position + self.stride
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def grab(self):
+        ret, _ = self.read()
+        return ret
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self._position
+        value = self.capture.get(prop)
+        if prop == cv2.CAP_PROP_FPS:
+            return value / self.stride if value else value
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT) and self.max_side:
+            size = _fit((self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT), self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                        self.max_side)
+            if size is not None:
+                return size[0] if prop == cv2.CAP_PROP_FRAME_WIDTH else size[1]
+        return value
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return self.capture.set(prop, value)
+        # Seeking throws away whatever was decoded ahead
+        with self._lock:
+            self._seek_to = int(value)
+            self._generation += 1
+            self._position = int(value)
+        self._ended = False
+        return True
+
+    def release(self):
+        # The decoder notices the stop flag within one read; the capture can only go once it is out of read()
+        self._stop.set()
+        self._thread.join()
+        self.capture.release()
+
+
+def open_source(source=0, max_side=None, stride=1, prefetch=4, start=0, fps=None):
+    # Any frame source from one spec: a camera index, a video file, a directory or glob of images, or
+    # 'synthetic[:WIDTHxHEIGHT]'. Objects that already look like a capture are used as they are, wrapped only if
+    # asked to prefetch, downscale or stride. prefetch=0 decodes on the caller's thread instead
+    source = parse_source(source)
+    live = isinstance(source, int)
+    if hasattr(source, 'read'):
+        capture = source
+        if not (max_side or stride > 1 or prefetch):
+            return capture
+    elif live:
+        capture = cv2.VideoCapture(source)
+    elif str(source).startswith('synthetic'):
+        _, _, size = str(source).partition(':')
+        width, height = (int(v) for v in (size or '640x480').lower().split('x'))
+        capture = SyntheticCapture(size=(height, width), fps=fps or 30.0)
+    elif os.path.isdir(source) or glob.has_magic(source):
+        capture = ImageSequence(source, fps=fps or 30.0)
+    else:
+        capture = cv2.VideoCapture(source)
+    if start:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if not prefetch:
+        return capture
+    return PrefetchingSource(capture, max_side=max_side, stride=stride, prefetch=prefetch, live=live)
+
+
+def add_source_arguments(parser):
+    # The same --source, --max-side and --stride flags for every entry point
+    parser.add_argument('--source', default='0',
+                        help="camera index, video file, image directory or glob, or synthetic[:WxH] (default: 0)")
+    parser.add_argument('--max-side', type=int, default=None,
+                        help="downscale frames at decode time so their longest side is at most this")
+    parser.add_argument('--stride', type=int, default=1, help="keep every Nth frame of the source")
+
+
+def source_from_args(args):
+    return open_source(args.source, max_side=args.max_side, stride=args.stride)
@@ -0,0 +1,273 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from buffers import FrameRing
+from engine import create_pose
+from instrumentation import DISABLED, StageTimer
+from landmarks import LandmarkFrame
+from rendering import draw_text
+from scheduler import InferenceJob, landmark_box, to_frame_coordinates
+from sources import add_source_arguments, source_from_args
+from steps import StepMachine
+from utils import draw_keypoints_with_lines
+
+WINDOW_NAME = 'Sparring Coach'
+COLORS = ((0, 255, 0), (0, 165, 255), (255, 0, 255), (255, 255, 0))
+
+
+def box_iou(a, b):
+    # Intersection over union of two (x0, y0, w, h) boxes
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    overlap = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - overlap
+    return overlap / union if union else 0.0
+
+
+def _grow(box, factor, frame_w, frame_h):
+    # The box widened by `factor` of its size on every side, clipped to the frame
+    x, y, w, h = box
+    x0, y0 = max(0, int(x - w * factor)), max(0, int(y - h * factor))
+    x1, y1 = min(frame_w, int(x + w * (1 + factor))), min(frame_h, int(y + h * (1 + factor)))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class HogDetector:
+    # OpenCV's built-in people detector on a downscaled frame. It only has to find athletes nobody is tracking
+    # yet, so it runs every few frames rather than on each one
+    def __init__(self, width=320, min_score=0.3):
+        self.width = width
+        self.min_score = min_score
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def __call__(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.width / w)
+        small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1 \
+            else frame
+        boxes, scores = self.hog.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        return [tuple(int(v / scale) for v in box) for box, score in zip(boxes, np.ravel(scores))
+                if score >= self.min_score]
+
+
+class Athlete:
+    # One tracked person: a stable id, the pixel box pose runs on next, and a step machine of their own. Each
+    # athlete has their own Pose, since MediaPipe carries tracking state from one frame to the next
+    def __init__(self, athlete_id, box, pose, hold_time=3):
+        self.id = athlete_id
+        self.box = box
+        self.pose = pose
+        self.machine = StepMachine(hold_time=hold_time)
+        self.landmarks = None
+        self.result = None
+        self.missed = 0  # Frames in a row without landmarks
+        self._input = FrameRing(1)
+
+    @property
+    def color(self):
+        return COLORS[self.id % len(COLORS)]
+
+    def _job(self, rgb, target_size):
+        frame_h, frame_w = rgb.shape[:2]
+        x0, y0, w, h = self.box
+        crop = rgb[y0:y0 + h, x0:x0 + w]
+        scale = target_size / max(w, h)
+        if scale < 1:
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            image = cv2.resize(crop, size, dst=self._input.get((size[1], size[0], 3)), interpolation=cv2.INTER_AREA)
+        else:
+            image = self._input.get(crop.shape)
+            np.copyto(image, crop)  # MediaPipe needs a contiguous image
+        return InferenceJob(image, x0, y0, w, h, frame_w, frame_h)
+
+    def infer(self, rgb, target_size, margin):
+        # Pose on this athlete's crop of the shared RGB frame; the box then follows the landmarks. Runs on a pool
+        # thread, one per athlete
+        job = self._job(rgb, target_size)
+        landmarks = LandmarkFrame.from_results(self.pose.process(job.image))
+        if landmarks is None:
+            self.landmarks = None
+            self.missed += 1
+            # Look a little wider for someone who moved out of the box
+            self.box = _grow(self.box, 0.1, job.frame_w, job.frame_h)
+            return None
+        self.landmarks = to_frame_coordinates(landmarks, job)
+        self.missed = 0
+        self.box = landmark_box(landmarks, job.frame_w, job.frame_h, margin) or self.box
+        return landmarks
+
+
+class SparringCoach:
+    # Coaches up to `max_athletes` people in one frame. Tracked athletes are inferred on crops around their last
+    # landmarks, all cut from one colour-converted frame and run in parallel, and the detector only looks for
+    # newcomers every `detect_every` frames, so each extra athlete costs one small crop rather than a full frame
+    def __init__(self, max_athletes=2, hold_time=3, detector=None, detect_every=15, target_size=256, margin=0.25,
+                 max_missed=10, duplicate_iou=0.5, model_complexity=1, timer=DISABLED):
+        self.max_athletes = max_athletes
+        self.hold_time = hold_time
+        self.detector = detector if detector is not None else HogDetector()
+        self.detect_every = detect_every
+        self.target_size = target_size
+        self.margin = margin
+        self.max_missed = max_missed
+        self.duplicate_iou = duplicate_iou
+        self.model_complexity = model_complexity
+        self.timer = timer
+        self.athletes = []
+        self.finished = []  # Athletes no longer tracked, in the order they were lost
+        self._next_id = 0
+        self._idle_poses = []
+        self._since_detect = detect_every
+        self._rgb = FrameRing(1)
+        self._executor = ThreadPoolExecutor(max_workers=max_athletes, thread_name_prefix='sparring-pose')
+        self.detections = 0
+
+    def _pose(self):
+        if self._idle_poses:
+            return self._idle_poses.pop()
+        return create_pose(model_complexity=self.model_complexity)
+
+    def _drop(self, athlete):
+        self.athletes.remove(athlete)
+        self.finished.append(athlete)
+        reset = getattr(athlete.pose, 'reset', None)
+        if reset is not None:
+            reset()  # Forget the last person's position before tracking someone else
+        self._idle_poses.append(athlete.pose)
+
+    def _add(self, box):
+        athlete = Athlete(self._next_id, box, self._pose(), self.hold_time)
+        self._next_id += 1
+        self.athletes.append(athlete)
+        return athlete
+
+    def _detect(self, frame):
+        h, w = frame.shape[:2]
+        self._since_detect = 0
+        self.detections += 1
+        boxes = [_grow(box, 0.1, w, h) for box in self.detector(frame)]
+        if not boxes and not self.athletes:
+            # The detector misses crouched or partly visible people; with nobody tracked, let pose search the frame
+            boxes = [(0, 0, w, h)]
+        for box in boxes:
+            if len(self.athletes) >= self.max_athletes:
+                break
+            if all(box_iou(box, athlete.box) < 0.3 for athlete in self.athletes):
+                self._add(box)
+
+    def _prune(self):
+        for athlete in list(self.athletes):
+            if athlete.missed > self.max_missed:
+                self._drop(athlete)
+        # Two trackers that locked onto the same person: the newer one goes
+        for athlete in sorted(self.athletes, key=lambda a: -a.id):
+            if any(other.id < athlete.id and box_iou(other.box, athlete.box) > self.duplicate_iou
+                   for other in self.athletes):
+                self._drop(athlete)
+
+    def update(self, frame, now):
+        # Tracks, infers and scores every athlete in the frame; returns the athletes still being coached
+        timer = self.timer
+        if len(self.athletes) < self.max_athletes and self._since_detect >= self.detect_every:
+            self._detect(frame)
+            timer.lap('detect')
+        self._since_detect += 1
+        rgb = self._rgb.to_rgb(frame)
+        timer.lap('convert')
+        if len(self.athletes) == 1:
+            self.athletes[0].infer(rgb, self.target_size, self.margin)
+        else:
+            list(self._executor.map(lambda athlete: athlete.infer(rgb, self.target_size, self.margin),
+                                    self.athletes))
+        timer.lap('inference')
+        self._prune()
+        for athlete in self.athletes:
+            if athlete.landmarks is not None and not athlete.machine.done:
+                athlete.result = athlete.machine.update(frame, athlete.landmarks, now)
+            elif athlete.landmarks is None:
+                timer.count('no_pose_landmarks')
+        timer.lap('check')
+        return self.athletes
+
+    def render(self, frame):
+        for athlete in self.athletes:
+            x, y, w, h = athlete.box
+            cv2.rectangle(frame, (x, y), (x + w, y + h), athlete.color, 1)
+            if athlete.landmarks is not None:
+                draw_keypoints_with_lines(frame, athlete.landmarks, athlete.color)
+            label_y = max(20, y - 30)
+            if athlete.machine.done:
+                draw_text(frame, f"Athlete {athlete.id}: all steps done!", (x, label_y), 0.5, athlete.color, 2)
+            elif athlete.result is not None:
+                draw_text(frame, f"Athlete {athlete.id}: {athlete.result.step_name}", (x, label_y), 0.5,
+                          athlete.color, 1)
+                feedback = athlete.machine.feedback_text(athlete.result)
+                if feedback:
+                    draw_text(frame, feedback, (x, label_y + 18), 0.45, (0, 0, 255), 1)
+            else:
+                draw_text(frame, f"Athlete {athlete.id}", (x, label_y), 0.5, athlete.color, 1)
+        self.timer.lap('draw')
+        return frame
+
+    def summary(self):
+        return [{
+            "athlete": athlete.id,
+            "completed_steps": athlete.machine.current_step,
+            "completed": athlete.machine.done,
+            "tracking": athlete in self.athletes,
+        } for athlete in sorted(self.finished + self.athletes, key=lambda a: a.id)]
+
+    def close(self):
+        self._executor.shutdown()
+        for athlete in list(self.athletes):
+            self._drop(athlete)
+        for pose in self._idle_poses:
+            pose.close()
+        self._idle_poses = []
+
+
+def run(cap, coach, timer=DISABLED, show=True):
+    frames = FrameRing(1)
+    while cap.isOpened():
+        timer.begin_frame()
+        ret, frame = frames.read(cap)
+        if not ret:
+            break
+        timer.lap('capture')
+        coach.update(frame, time.time())
+        coach.render(frame)
+        timer.end_frame(frame)
+        if show:
+            cv2.imshow(WINDOW_NAME, frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            timer.lap('display')
+    return coach.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coach several boxers sharing one camera")
+    add_source_arguments(parser)
+    parser.add_argument('--athletes', type=int, default=2, help="most people to coach at once")
+    parser.add_argument('--hold-time', type=float, default=3)
+    parser.add_argument('--detect-every', type=int, default=15, help="frames between searches for new athletes")
+    parser.add_argument('--inference-size', type=int, default=256, help="longest side of each athlete's crop")
+    parser.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2))
+    parser.add_argument('--no-show', action='store_true', help="score without opening a window")
+    parser.add_argument('--profile', action='store_true', help="time each stage of the frame loop")
+    args = parser.parse_args()
+    timer = StageTimer(enabled=args.profile)
+    coach = SparringCoach(args.athletes, args.hold_time, detect_every=args.detect_every,
+                          target_size=args.inference_size, model_complexity=args.model_complexity, timer=timer)
+    cap = source_from_args(args)
+    try:
+        for athlete in run(cap, coach, timer, show=not args.no_show):
+            print(athlete)
+    finally:
+        coach.close()
+        cap.release()
+        cv2.destroyAllWindows()
+        timer.dump()
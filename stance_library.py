@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import pickle
+from collections import namedtuple
+import numpy as np
+from landmarks import MIRROR_INDEX, NUM_LANDMARKS, LandmarkFrame, as_keypoint_array
+from utils import mp_pose
+
+L = mp_pose.PoseLandmark
+_HIPS = [L.LEFT_HIP, L.RIGHT_HIP]
+_SHOULDERS = [L.LEFT_SHOULDER, L.RIGHT_SHOULDER]
+FIELDS = ('name', 'athlete', 'stance', 'coach')
+MIRRORED_STANCE = {'orthodox': 'southpaw', 'southpaw': 'orthodox'}
+MIN_VISIBLE_JOINTS = 8  # Fewer visible joints than this and every reference is about as close as any other
+
+
+def normalize_pose(keypoints, aspect=1.0):
+    # (..., 33, 2) pose in torso units: hip midpoint at the origin, hips-to-shoulders pointing straight up (-y) with
+    # length 1. `aspect` is the frame's width / height, which makes x and y the same unit before rotating
+    points = np.array(as_keypoint_array(keypoints)[..., :2], dtype=np.float32)
+    points[..., 0] *= aspect
+    hips = points[..., _HIPS, :].mean(axis=-2, keepdims=True)
+    torso = points[..., _SHOULDERS, :].mean(axis=-2, keepdims=True) - hips
+    length = np.linalg.norm(torso, axis=-1, keepdims=True)
+    length = np.where(length > 1e-6, length, 1)
+    ux, uy = np.moveaxis(torso / length, -1, 0)
+    x, y = np.moveaxis(points - hips, -1, 0)
+    # The rotation taking the torso direction (ux, uy) to (0, -1)
+    return np.stack([-uy * x + ux * y, -ux * x - uy * y], axis=-1) / length
+
+
+def mirror_pose(normalized):
+    # The other stance of a normalized pose: flipped left to right, with left and right landmarks swapped
+    mirrored = normalized[..., MIRROR_INDEX, :].copy()
+    mirrored[..., 0] *= -1
+    return mirrored
+
+
+class StanceMatch(namedtuple('StanceMatch', ['index', 'distance', 'deviations', 'keypoints'] + list(FIELDS))):
+    # One reference and how far the query is from it: `distance` is the RMS joint deviation and `deviations` the
+    # per-joint distances (NaN where the query joint wasn't visible), both in torso lengths
+    __slots__ = ()
+
+    @property
+    def worst_landmark(self):
+        # The visible joint furthest from the reference, or None if no joint was visible
+        if np.isnan(self.deviations).all():
+            return None
+        return L(int(np.nanargmax(self.deviations)))
+
+    def aligned(self, tolerance=0.35):
+        # Every visible joint within `tolerance` torso lengths of the reference, and at least one visible
+        if np.isnan(self.deviations).all():
+            return False
+        return bool(np.nanmax(self.deviations) <= tolerance)
+
+
+class StanceLibrary:
+    # Reference stances for many athletes in one matrix. Matching uses the squared-distance expansion
+    # |r - q|^2 = |r|^2 - 2 r.q + |q|^2, so scoring a frame against every reference is two matrix-vector products
+    def __init__(self):
+        self._added = []
+        self.poses = np.zeros((0, NUM_LANDMARKS, 2), dtype=np.float32)
+        self.keypoints = np.zeros((0, NUM_LANDMARKS, 3), dtype=np.float32)
+        self.metadata = {field: np.zeros(0, dtype=object) for field in FIELDS}
+        self._norms = np.zeros((0, NUM_LANDMARKS), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.poses) + len(self._added)
+
+    def add(self, name, keypoints, aspect=4 / 3, athlete=None, stance='orthodox', coach=None, mirror=False):
+        # `keypoints` are raw normalized image coordinates from a frame of the given aspect ratio; with `mirror`,
+        # the opposite stance is added too
+        keypoints = np.asarray(as_keypoint_array(keypoints), dtype=np.float32)[:, :3]
+        pose = normalize_pose(keypoints, aspect)
+        self._added.append((pose, keypoints, (name, athlete, stance, coach)))
+        if mirror:
+            flipped = keypoints[MIRROR_INDEX].copy()
+            flipped[:, 0] = 1 - flipped[:, 0]
+            self._added.append((mirror_pose(pose), flipped,
+                                (name, athlete, MIRRORED_STANCE.get(stance, stance), coach)))
+
+    def _build(self):
+        # References are stacked into the index on the first search after adding, not one row at a time
+        if not self._added:
+            return
+        poses, keypoints, metadata = zip(*self._added)
+        self.poses = np.concatenate([self.poses, np.stack(poses)])
+        self.keypoints = np.concatenate([self.keypoints, np.stack(keypoints)])
+        for field, values in zip(FIELDS, zip(*metadata)):
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            self.metadata[field] = np.concatenate([self.metadata[field], column])
+        self._norms = np.einsum('njk,njk->nj', self.poses, self.poses)
+        self._added = []
+
+    def select(self, **filters):
+        # Indices of the references matching every given field, e.g. athlete='sam', stance='southpaw'
+        self._build()
+        mask = np.ones(len(self.poses), dtype=bool)
+        for field, value in filters.items():
+            if value is not None:
+                mask &= self.metadata[field] == value
+        return np.flatnonzero(mask)
+
+    def distances(self, keypoints, aspect=4 / 3, rows=None, min_visibility=0.5):
+        # RMS joint distance (torso lengths) from the query to every reference in `rows`: (M,) for one pose,
+        # (K, M) for a batch. Joints the camera couldn't see are left out of the comparison
+        self._build()
+        rows = np.arange(len(self.poses)) if rows is None else rows
+        query = normalize_pose(keypoints, aspect)
+        weights = _visibility_weights(keypoints, query.shape[:-1], min_visibility)
+        weighted = weights[..., None] * query
+        flat = self.poses[rows].reshape(len(rows), -1)
+        squared = (self._norms[rows] @ weights.T - 2 * flat @ weighted.reshape(weighted.shape[:-2] + (-1,)).T
+                   + (weighted * query).sum(axis=(-2, -1)))
+        squared /= np.maximum(weights.sum(axis=-1), 1)
+        return np.sqrt(np.maximum(squared, 0)).T
+
+    def match(self, keypoints, aspect=4 / 3, k=1, min_visibility=0.5, min_joints=MIN_VISIBLE_JOINTS, **filters):
+        # The k closest references to one pose, best first, among those matching `filters`. Nothing if fewer
+        # than `min_joints` joints of the pose are visible
+        rows = self.select(**filters)
+        if not len(rows):
+            return []
+        query = normalize_pose(keypoints, aspect)
+        visible = _visibility_weights(keypoints, query.shape[:-1], min_visibility) > 0
+        if visible.sum() < min_joints:
+            return []
+        distances = self.distances(keypoints, aspect, rows, min_visibility)
+        k = min(k, len(rows))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        matches = []
+        for position in nearest:
+            index = int(rows[position])
+            deviations = np.linalg.norm(self.poses[index] - query, axis=-1)
+            deviations[~visible] = np.nan
+            matches.append(StanceMatch(index, float(distances[position]), deviations, self.keypoints[index],
+                                       *(self.metadata[field][index] for field in FIELDS)))
+        return matches
+
+    def best(self, keypoints, aspect=4 / 3, min_visibility=0.5, min_joints=MIN_VISIBLE_JOINTS, **filters):
+        matches = self.match(keypoints, aspect, 1, min_visibility, min_joints, **filters)
+        return matches[0] if matches else None
+
+    def save(self, path):
+        self._build()
+        metadata = json.dumps({field: self.metadata[field].tolist() for field in FIELDS})
+        np.savez(library_path(path), poses=self.poses, keypoints=self.keypoints, metadata=np.array(metadata))
+
+    @classmethod
+    def load(cls, path):
+        library = cls()
+        with np.load(library_path(path)) as data:
+            library.poses = data['poses']
+            library.keypoints = data['keypoints']
+            metadata = json.loads(str(data['metadata']))
+        for field in FIELDS:
+            column = np.empty(len(library.poses), dtype=object)
+            column[:] = metadata[field]
+            library.metadata[field] = column
+        library._norms = np.einsum('njk,njk->nj', library.poses, library.poses)
+        return library
+
+    def add_pickle(self, path, aspect=4 / 3, mirror=True, **fields):
+        # An old single-pose reference file such as ideal_keypoints.pkl, named after the file
+        with open(path, 'rb') as f:
+            keypoints = pickle.load(f)
+        self.add(os.path.splitext(os.path.basename(path))[0], keypoints, aspect, mirror=mirror, **fields)
+
+    @classmethod
+    def from_pickles(cls, paths, aspect=4 / 3, mirror=True, **fields):
+        library = cls()
+        for path in paths:
+            library.add_pickle(path, aspect, mirror, **fields)
+        return library
+
+
+def library_path(path):
+    # np.savez adds .npz to a name without it, so save, load and the existence check all go through this
+    path = os.fspath(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+def _visibility_weights(keypoints, shape, min_visibility):
+    if isinstance(keypoints, LandmarkFrame):
+        return (keypoints.visibility >= min_visibility).astype(np.float32)
+    keypoints = np.asarray(keypoints)
+    if keypoints.shape[-1] == 4:
+        return (keypoints[..., 3] >= min_visibility).astype(np.float32)
+    return np.ones(shape, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and inspect a library of reference stances")
+    parser.add_argument('library', help=".npz library file, created if missing")
+    parser.add_argument('--add', nargs='*', default=[], metavar='PKL', help="reference pose pickles to add")
+    parser.add_argument('--athlete')
+    parser.add_argument('--coach')
+    parser.add_argument('--stance', default='orthodox', choices=sorted(MIRRORED_STANCE))
+    parser.add_argument('--aspect', type=float, default=4 / 3, help="width / height of the frames the poses came from")
+    parser.add_argument('--mirror', action='store_true', help="also add each pose's opposite stance")
+    args = parser.parse_args()
+    library = StanceLibrary.load(args.library) if os.path.exists(library_path(args.library)) else StanceLibrary()
+    for path in args.add:
+        library.add_pickle(path, args.aspect, args.mirror, athlete=args.athlete, stance=args.stance, coach=args.coach)
+    if args.add:
+        library.save(args.library)
+    library.select()  # Builds the index
+    print(f"{len(library)} references")
+    for field in ('athlete', 'stance', 'coach'):
+        values, counts = np.unique(library.metadata[field].astype(str), return_counts=True)
+        print(f"  {field}: " + ", ".join(f"{value} ({count})" for value, count in zip(values, counts)))
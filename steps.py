@@ -0,0 +1,189 @@
+from collections import namedtuple
+import cv2
+from features import L, PoseFeatures
+from landmarks import LandmarkFrame
+from rules import Rule, Step
+from temporal import HoldWindow, OneEuroFilter
+from utils import (BACK_FOOT_ANGLE, FEET_APART, FOOT_LINE_MAX_TILT, FOOT_POSITION_APART, FRONT_FOOT_ANGLE,
+                   LEFT_KNEE_ANGLE, MAX_ELBOW_OFFSET, MAX_HAND_HEIGHT, RIGHT_KNEE_ANGLE, STANCE_APART, STANCE_MAX_TILT)
+
+RED, GREEN, BLUE = (0, 0, 255), (0, 255, 0), (255, 0, 0)
+
+
+def _failed(outcome):
+    return bool(outcome.below or outcome.above)
+
+
+def _draw_foot_position_box(frame, features, outcomes):
+    h, _ = features.size
+    left_toe, right_heel = features.pixel(L.LEFT_FOOT_INDEX), features.pixel(L.RIGHT_HEEL)
+    left_shoulder, right_shoulder = features.pixel(L.LEFT_SHOULDER), features.pixel(L.RIGHT_SHOULDER)
+    shoulder_width = features['shoulder_width_px']
+    alignment, distance = outcomes
+
+    cv2.line(frame, left_toe, right_heel, RED if _failed(alignment) else GREEN, 2)
+    distance_color = RED if _failed(distance) else GREEN
+    cv2.line(frame, left_shoulder, right_shoulder, BLUE, 2)  # Draw shoulder line
+    cv2.line(frame, left_toe, right_heel, distance_color, 2)  # Draw foot distance line
+
+    # Angled lines from the shoulders to the ground, pointing outwards
+    angle_offset = 0.8
+    left_shoulder_ground = (int(left_shoulder[0] + shoulder_width * angle_offset), h)
+    right_shoulder_ground = (int(right_shoulder[0] - shoulder_width * angle_offset), h)
+    cv2.line(frame, left_shoulder, left_shoulder_ground, GREEN, 1)
+    cv2.line(frame, right_shoulder, right_shoulder_ground, GREEN, 1)
+
+    # Lines from the feet to the corresponding shoulder line
+    cv2.line(frame, left_toe, (left_shoulder_ground[0], left_toe[1]), distance_color, 1)
+    cv2.line(frame, right_heel, (right_shoulder_ground[0], right_heel[1]), distance_color, 1)
+
+
+def _draw_arrows(frame, cues):
+    for fired, start, (dx, dy) in cues:
+        if fired:
+            cv2.arrowedLine(frame, start, (start[0] + dx, start[1] + dy), RED, 5, tipLength=0.5)
+
+
+def _draw_foot_angle_cues(frame, features, outcomes):
+    left_toe, right_toe = features.pixel(L.LEFT_FOOT_INDEX), features.pixel(L.RIGHT_FOOT_INDEX)
+    front, back = outcomes
+    _draw_arrows(frame, [(front.below, left_toe, (50, 0)), (front.above, left_toe, (-50, 0)),
+                         (back.below, right_toe, (50, 0)), (back.above, right_toe, (-50, 0))])
+
+
+def _draw_knee_cues(frame, features, outcomes):
+    _draw_arrows(frame, [(_failed(outcome), features.pixel(knee), (0, 50))
+                         for outcome, knee in zip(outcomes, (L.LEFT_KNEE, L.RIGHT_KNEE))])
+
+
+def _draw_hands_and_chin_cues(frame, features, outcomes):
+    landmarks = (L.LEFT_WRIST, L.RIGHT_WRIST, L.LEFT_ELBOW, L.RIGHT_ELBOW)
+    directions = ((0, -50), (0, -50), (50, 0), (-50, 0))
+    _draw_arrows(frame, [(_failed(outcome), features.pixel(landmark), direction)
+                         for outcome, landmark, direction in zip(outcomes, landmarks, directions)])
+
+
+FOOT_ANGLE_RULES = [
+    Rule('front_foot_angle', *FRONT_FOOT_ANGLE, "Rotate front foot right", "Rotate front foot left"),
+    Rule('back_foot_angle', *BACK_FOOT_ANGLE, "Rotate back foot right", "Rotate back foot left"),
+]
+KNEE_BEND_RULES = [
+    Rule('left_knee_angle', *LEFT_KNEE_ANGLE, *["Bend your left knee more (make sure your facing forward)"] * 2),
+    Rule('right_knee_angle', *RIGHT_KNEE_ANGLE, *["Bend your right knee more (make sure your facing forward)"] * 2),
+]
+# Feet 10-20% wider than the shoulders, in normalized coordinates
+SHOULDER_WIDTH_RULE = Rule('foot_distance', *FEET_APART, relative_to='shoulder_width')
+
+STEPS = [
+    Step("1. Feet Alignment", [
+        Rule('foot_line_tilt_px', high=FOOT_LINE_MAX_TILT, too_high="Adjust Feet", strict=True),
+        Rule('foot_distance_px', *FOOT_POSITION_APART, "Widen feet a bit more", "Stance too wide",
+             relative_to='shoulder_width_px'),
+    ], "Align your front foot toe with your back foot heel and keep feet a bit wider than shoulder-width apart.",
+        success="Correct Alignment and Distance", first_failure_only=True, draw=_draw_foot_position_box),
+    Step("2. Foot Positioning", FOOT_ANGLE_RULES,
+         "Point your front foot 20-30 degrees and your back foot 50-90 degrees.", draw=_draw_foot_angle_cues),
+    Step("3. Knee Bend", KNEE_BEND_RULES, "Bend knees a bit by sticking out your butt.", draw=_draw_knee_cues),
+    Step("4. Hands and Chin", [
+        Rule('left_hand_height', high=MAX_HAND_HEIGHT, too_high="Raise your left hand", strict=True),
+        Rule('right_hand_height', high=MAX_HAND_HEIGHT, too_high="Raise your right hand", strict=True),
+        Rule('left_elbow_offset', high=MAX_ELBOW_OFFSET, too_high="Tuck your left elbow closer to your body",
+             strict=True),
+        Rule('right_elbow_offset', high=MAX_ELBOW_OFFSET, too_high="Tuck your right elbow closer to your body",
+             strict=True),
+    ], "Raise your hands and tuck your chin.", draw=_draw_hands_and_chin_cues),
+]
+
+# The shorter sequence evaluation.evaluate_stance walks through
+EVALUATION_STEPS = [
+    Step("Toe-Heel Alignment", [Rule('foot_line_tilt', high=FOOT_LINE_MAX_TILT, strict=True), SHOULDER_WIDTH_RULE],
+         "Toe-Heel Alignment"),
+    Step("Shoulder Width", [SHOULDER_WIDTH_RULE], "Shoulder Width"),
+    Step("Foot Angles", FOOT_ANGLE_RULES, "Foot Angles", draw=_draw_foot_angle_cues),
+    Step("Knee Bend", KNEE_BEND_RULES, "Knee Bend", draw=_draw_knee_cues),
+]
+
+# General stance advice shown alongside the current step
+STANCE_FEEDBACK = Step("Stance", [
+    Rule('foot_line_tilt', high=STANCE_MAX_TILT, too_high="Align your front foot toe with your back foot heel.",
+         strict=True),
+    Rule('foot_distance', *STANCE_APART, *["Keep feet slightly more than shoulder-width apart."] * 2,
+         relative_to='shoulder_width'),
+], "Keep your feet aligned and apart.")
+
+StepResult = namedtuple('StepResult', ['step_name', 'step_feedback', 'correct', 'feedback', 'remaining_time'])
+StepStatus = namedtuple('StepStatus', ['step_name', 'correct', 'feedback'])
+
+
+class StepMachine:
+    def __init__(self, steps=STEPS, hold_time=3, smoothing=True, window=1.0, pass_ratio=0.8, max_jitter=0.02,
+                 min_hold=0.3, score_all=True, stats=None):
+        self.steps = steps
+        self.stats = stats  # An analytics.SessionStats to count this session's attempts, failures and feedback
+        self.score_all = score_all
+        self.features = None
+        self.board = []  # StepStatus for every step on the last frame, when score_all is set
+        self.hold_time = hold_time  # Hold each position for at least this many seconds
+        self.current_step = 0
+        self.step_start_time = None
+        self.completion_times = []
+        self.smoother = OneEuroFilter() if smoothing else None
+        self.hold = HoldWindow(window=window, pass_ratio=pass_ratio, max_jitter=max_jitter, min_duration=min_hold)
+
+    @property
+    def done(self):
+        return self.current_step >= len(self.steps)
+
+    def update(self, frame, keypoints, now):
+        # `now` comes from the caller so recorded sessions can be replayed on their own clock
+        if self.smoother is not None:
+            if isinstance(keypoints, LandmarkFrame):
+                keypoints = self.smoother.filter_frame(keypoints, now)
+            else:
+                keypoints = self.smoother(keypoints, now)
+        # Geometry is extracted once and shared by every step's rules
+        self.features = PoseFeatures(keypoints, frame)
+        correct, feedback = self.steps[self.current_step].apply(frame, self.features)
+        if self.score_all:
+            self.board = [StepStatus(step.name, correct, feedback) if i == self.current_step
+                          else StepStatus(step.name, *step.evaluate(self.features))
+                          for i, step in enumerate(self.steps)]
+        return self.advance(correct, feedback, now, keypoints)
+
+    def advance(self, correct, feedback, now, keypoints=None):
+        # Apply an already computed check result, e.g. one scored in bulk over a recording. A hold is judged on the
+        # recent window rather than this frame alone, so a single jittery frame doesn't restart it
+        position = self.current_step
+        step = self.steps[position]
+        step_name, step_feedback = step.name, step.instruction
+        self.hold.push(now, correct, keypoints)
+        if self.step_start_time is None:
+            if correct:
+                self.step_start_time = now
+        elif not correct and not self.hold.holding(now, self.step_start_time):
+            self.step_start_time = None
+
+        remaining_time = None
+        if self.step_start_time is not None:
+            elapsed_time = now - self.step_start_time
+            remaining_time = self.hold_time - int(elapsed_time)
+            if remaining_time <= 0:
+                if correct and self.hold.stable(now, self.step_start_time):
+                    self.current_step += 1
+                    self.step_start_time = None
+                    self.completion_times.append(now)
+                    self.hold.clear()
+                else:
+                    # Long enough, but this frame fails or the joints are still moving: keep asking for the hold
+                    remaining_time = 1
+        result = StepResult(step_name, step_feedback, bool(correct), feedback, remaining_time)
+        if self.stats is not None:
+            self.stats.observe(position, result, now)
+        return result
+
+    def feedback_text(self, result):
+        if not result.correct:
+            return result.feedback
+        if result.remaining_time > 0:
+            return f"{result.feedback}. Hold for {result.remaining_time} seconds..."
+        return None
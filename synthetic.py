@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+from landmarks import MIRROR_INDEX, NUM_LANDMARKS
+
+# An orthodox guard, in normalized image coordinates, that passes every step check at 640x480
+STANCE_TEMPLATE = np.array([
+    (0.500, 0.200, -0.20),  # nose
+    (0.505, 0.190, -0.19), (0.510, 0.190, -0.19), (0.515, 0.190, -0.19),  # left eye inner, eye, outer
+    (0.495, 0.190, -0.19), (0.490, 0.190, -0.19), (0.485, 0.190, -0.19),  # right eye inner, eye, outer
+    (0.525, 0.200, -0.10), (0.475, 0.200, -0.10),  # ears
+    (0.508, 0.215, -0.18), (0.492, 0.215, -0.18),  # mouth
+    (0.560, 0.320, -0.05), (0.440, 0.320, -0.05),  # shoulders
+    (0.570, 0.420, -0.10), (0.430, 0.420, -0.10),  # elbows
+    (0.540, 0.240, -0.25), (0.460, 0.240, -0.25),  # wrists
+    (0.535, 0.230, -0.27), (0.465, 0.230, -0.27),  # pinkies
+    (0.530, 0.225, -0.28), (0.470, 0.225, -0.28),  # index fingers
+    (0.532, 0.235, -0.27), (0.468, 0.235, -0.27),  # thumbs
+    (0.540, 0.550, 0.00), (0.460, 0.550, 0.00),  # hips
+    (0.565, 0.700, -0.05), (0.425, 0.705, 0.05),  # knees
+    (0.560, 0.870, 0.00), (0.435, 0.860, 0.05),  # ankles
+    (0.549, 0.921, 0.02), (0.420, 0.900, 0.07),  # heels
+    (0.576, 0.900, -0.05), (0.409, 0.861, 0.03),  # foot indices
+], dtype=np.float32)
+
+
+def synthetic_landmarks(n, noise=0.002, seed=0, template=STANCE_TEMPLATE, drift=0.0):
+    # (n, 33, 3) poses around `template` with gaussian jitter and an optional slow random-walk sway
+    rng = np.random.default_rng(seed)
+    points = np.broadcast_to(template, (n, NUM_LANDMARKS, 3)).astype(np.float32)
+    points = points + rng.normal(0, noise, points.shape).astype(np.float32)
+    if drift:
+        sway = np.cumsum(rng.normal(0, drift, (n, 1, 3)), axis=0).astype(np.float32)
+        sway[..., 2] = 0
+        points += sway
+    return points
+
+
+def mirror_stance(template=STANCE_TEMPLATE):
+    # Southpaw version of a stance: flip horizontally and swap left/right landmarks
+    mirrored = template.copy()
+    mirrored[:, 0] = 1 - mirrored[:, 0]
+    return mirrored[MIRROR_INDEX]
+
+
+class _Landmark:
+    __slots__ = ('x', 'y', 'z', 'visibility')
+
+    def __init__(self, x, y, z, visibility):
+        self.x, self.y, self.z, self.visibility = x, y, z, visibility
+
+
+class _PoseLandmarks:
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class _Results:
+    def __init__(self, pose_landmarks):
+        self.pose_landmarks = pose_landmarks
+
+
+class SyntheticPose:
+    # Stands in for mp.solutions.pose.Pose, returning MediaPipe-shaped results from a landmark sequence
+    def __init__(self, landmarks=None, visibility=0.99, detection_rate=1.0, seed=0):
+        self.landmarks = synthetic_landmarks(300, seed=seed) if landmarks is None else landmarks
+        self.visibility = visibility
+        self.detection_rate = detection_rate
+        self._rng = np.random.default_rng(seed)
+        self._index = 0
+
+    def process(self, image):
+        points = self.landmarks[self._index % len(self.landmarks)]
+        self._index += 1
+        if self.detection_rate < 1 and self._rng.random() > self.detection_rate:
+            return _Results(None)
+        return _Results(_PoseLandmarks([_Landmark(float(x), float(y), float(z), self.visibility)
+                                        for x, y, z in points.tolist()]))
+
+    def close(self):
+        pass
+
+
+class SyntheticCapture:
+    # cv2.VideoCapture look-alike that yields noisy frames with a moving bar, for runs without a camera
+    def __init__(self, frames=None, size=(480, 640), fps=30.0, seed=0):
+        self.frames = frames
+        self.size = size
+        self.fps = fps
+        self._rng = np.random.default_rng(seed)
+        self._background = self._rng.integers(0, 255, size + (3,), dtype=np.uint8)
+        self._index = 0
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self, image=None):
+        if not self._opened or (self.frames is not None and self._index >= self.frames):
+            return False, None
+        h, w = self.size
+        if image is None or image.shape != (h, w, 3):
+            image = np.empty((h, w, 3), dtype=np.uint8)
+        image[:] = self._background
+        x = (self._index * 8) % w
+        image[:, x:x + 16] = 255
+        self._index += 1
+        return True, image
+
+    def grab(self):
+        ret = self._opened and (self.frames is None or self._index < self.frames)
+        self._index += ret
+        return ret
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_HEIGHT: self.size[0], cv2.CAP_PROP_FRAME_WIDTH: self.size[1],
+                cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_POS_FRAMES: self._index}.get(prop, 0)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._index = max(0, int(value))
+            return True
+        return False
+
+    def release(self):
+        self._opened = False
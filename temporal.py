@@ -0,0 +1,115 @@
+import numpy as np
+from landmarks import NUM_LANDMARKS, LandmarkFrame, LandmarkRing
+
+
+def _smoothing_factor(dt, cutoff):
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    # One-Euro filter over all 33 landmarks at once: heavy smoothing while a joint is still, less lag when it moves.
+    # Cutoffs are in Hz and speeds in normalized image units per second
+    def __init__(self, min_cutoff=1.0, beta=5.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._points = None
+        self._speed = None
+        self._time = None
+
+    def __call__(self, points, now):
+        points = np.asarray(points, dtype=np.float32)[..., :3]
+        if self._points is None:
+            self._points = points.copy()
+            self._speed = np.zeros_like(points)
+            self._time = now
+            return self._points.copy()
+        if now <= self._time:
+            # The same landmarks handed over again (e.g. rendered twice); nothing new to filter
+            return self._points.copy()
+        dt = now - self._time
+        speed = (points - self._points) / dt
+        self._speed += _smoothing_factor(dt, self.d_cutoff) * (speed - self._speed)
+        cutoff = self.min_cutoff + self.beta * np.abs(self._speed)
+        self._points += _smoothing_factor(dt, cutoff) * (points - self._points)
+        self._time = now
+        return self._points.copy()
+
+    def filter_frame(self, landmarks, now):
+        # Filtered copy of a LandmarkFrame; visibility passes through untouched
+        filtered = landmarks.copy()
+        filtered.points[:] = self(landmarks.points, now)
+        return filtered
+
+
+def filter_sequence(points, timestamps, present=None, **params):
+    # Filter a whole (N, 33, 3) recording in time order; frames without a pose keep their raw values
+    one_euro = OneEuroFilter(**params)
+    filtered = np.array(points[..., :3], dtype=np.float32)
+    for i in range(len(filtered)):
+        if present is None or present[i]:
+            filtered[i] = one_euro(filtered[i], float(timestamps[i]))
+    return filtered
+
+
+class HoldWindow:
+    # Recent landmark frames and check outcomes for the step being held. A hold survives the odd failing frame
+    # as long as most recent frames pass, and only completes once the joints have settled. For its first
+    # `min_duration` seconds a hold has too few frames for a pass fraction to mean anything, so it isn't judged
+    def __init__(self, window=1.0, pass_ratio=0.8, max_jitter=0.02, min_visibility=0.5, capacity=256,
+                 min_duration=0.3):
+        self.window = window
+        self.pass_ratio = pass_ratio
+        self.min_duration = min_duration
+        self.max_jitter = max_jitter
+        self.min_visibility = min_visibility
+        self.frames = LandmarkRing(capacity)
+        self.passed = np.zeros(capacity, dtype=bool)
+        self.has_points = np.zeros(capacity, dtype=bool)
+
+    def clear(self):
+        self.frames.clear()
+
+    def push(self, now, correct, keypoints=None):
+        index = self.frames.count % self.frames.capacity
+        if keypoints is None:
+            self.frames.push(np.zeros((NUM_LANDMARKS, 4), dtype=np.float32), now)
+        elif isinstance(keypoints, LandmarkFrame):
+            self.frames.push(keypoints, now)
+        else:
+            data = np.ones((NUM_LANDMARKS, 4), dtype=np.float32)
+            data[:, :3] = np.asarray(keypoints)[:, :3]
+            self.frames.push(data, now)
+        self.passed[index] = bool(correct)
+        self.has_points[index] = keypoints is not None
+
+    def _recent(self, now, since):
+        return self.frames.since(max(now - self.window, since))
+
+    def pass_fraction(self, now, since=-np.inf):
+        recent = self._recent(now, since)
+        return float(self.passed[recent].mean()) if recent.any() else 0.0
+
+    def jitter(self, now, since=-np.inf):
+        # Worst per-joint spread (std of x and y) across the recent passing frames, over reliably visible joints
+        recent = self._recent(now, since) & self.passed & self.has_points
+        if recent.sum() < 2:
+            return 0.0
+        data = self.frames.data[recent]
+        visible = data[..., 3].mean(axis=0) >= self.min_visibility
+        if not visible.any():
+            return 0.0
+        spread = np.sqrt(data[:, visible, :2].var(axis=0).sum(axis=-1))
+        return float(spread.max())
+
+    def holding(self, now, since):
+        if now - since < self.min_duration:
+            return True
+        return self.pass_fraction(now, since) >= self.pass_ratio
+
+    def stable(self, now, since=-np.inf):
+        return self.jitter(now, since) <= self.max_jitter
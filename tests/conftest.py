@@ -0,0 +1,16 @@
+import os
+import pickle
+import sys
+import numpy as np
+import pytest
+
+# The modules live at the repository root and import each other by name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def ideal_keypoints():
+    # The reference stance shipped with the repository, as a (33, 3) array
+    with open(os.path.join(ROOT, 'ideal_keypoints.pkl'), 'rb') as f:
+        return np.array(pickle.load(f), dtype=np.float32)
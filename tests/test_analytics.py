@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+import pytest
+from analytics import AnalyticsStore, SessionStats
+
+
+def record(athlete, durations, started=0.0, feedback=()):
+    # A session of steps 'guard' and 'feet'; a None duration is a step that was reached but not completed
+    steps = [{"step": step, "position": i, "started": started, "completed": None if d is None else started + d,
+              "duration": d, "frames": 10, "failing_frames": 4 if d is None else 1, "hold_attempts": 1,
+              "hold_failures": int(d is None)}
+             for i, (step, d) in enumerate(zip(('guard', 'feet'), durations))]
+    return {"session": None, "athlete": athlete, "program": 'stance', "source": 'camera', "started": started,
+            "ended": started + 10, "clock_started": started, "clock_ended": started + 10,
+            "completed": None not in durations, "completed_steps": sum(d is not None for d in durations),
+            "steps": steps, "feedback": list(feedback)}
+
+
+def test_queries_read_the_totals(tmp_path):
+    with AnalyticsStore(str(tmp_path / 'a.db')) as store:
+        store.add(record('ann', [2.0, None], feedback=[['feet', 'Widen your stance', 6]]))
+        store.add(record('ann', [4.0, 3.0], started=100.0))
+        store.add(record('bob', [3.0, None], feedback=[['feet', 'Widen your stance', 2], ['guard', 'Hands up', 1]]))
+        store.flush()
+        assert store.median_duration('guard') == 3.0
+        assert store.median_duration('feet') == 3.0
+        assert store.median_duration('jab') is None
+        failures = store.step_failures()
+        assert [row["step"] for row in failures] == ['feet', 'guard']
+        assert failures[0]["not_completed"] == 2
+        assert store.top_feedback()[0] == {"step": 'feet', "message": 'Widen your stance', "frames": 8, "sessions": 2}
+        assert [row["duration"] for row in store.athlete_steps('ann', 'guard')] == [2.0, 4.0]
+
+
+def test_stores_sharing_a_database_keep_sessions_apart(tmp_path):
+    path = str(tmp_path / 'a.db')
+    first, second = AnalyticsStore(path), AnalyticsStore(path)
+    for i in range(3):
+        first.add(record('ann', [1.0 + i, 1.0]))
+        first.flush()
+        second.add(record('bob', [10.0 + i, 1.0]))
+        second.flush()
+    ids = [row[0] for row in first.connection.execute("SELECT id FROM sessions")]
+    assert len(set(ids)) == 6
+    # Every step row still belongs to its own athlete's session
+    assert [row["duration"] for row in first.athlete_steps('bob', 'guard')] == [10.0, 11.0, 12.0]
+    first.close()
+    second.close()
+
+
+def test_a_failed_write_is_reported_and_later_sessions_still_land(tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'a.db'))
+    broken = record('ann', [1.0, 1.0])
+    del broken["steps"]
+    store.add(broken)
+    with pytest.raises(RuntimeError, match="could not be written"):
+        store.flush()
+    store.add(record('bob', [2.0, 2.0]))
+    store.close()
+    reopened = AnalyticsStore(str(tmp_path / 'a.db'))
+    assert [row["duration"] for row in reopened.athlete_steps('bob', 'guard')] == [2.0]
+    assert reopened.athlete_steps('ann', 'guard') == []
+    reopened.close()
+
+
+def test_sessions_on_a_media_clock_start_at_wall_clock_time(tmp_path):
+    stats = SessionStats('a.mp4', source='a.mp4')
+    before = time.time()
+    result = SimpleNamespace(step_name='guard', correct=True, feedback=None, remaining_time=None)
+    for frame in range(31):
+        stats.observe(0, result, frame / 30)
+    record = stats.record(['guard'])
+    assert before <= record["started"] <= time.time()
+    assert record["ended"] - record["started"] == pytest.approx(1.0)
+    assert (record["clock_started"], record["clock_ended"]) == (0.0, 1.0)
+    with AnalyticsStore(str(tmp_path / 'a.db')) as store:
+        store.add(record)
+        store.flush()
+        row = store.connection.execute("SELECT started, clock_started, clock_ended FROM sessions").fetchone()
+    assert row == (record["started"], 0.0, 1.0)
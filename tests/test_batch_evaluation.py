@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import batch_evaluation  # noqa: E402
+from recording import LandmarkRecorder  # noqa: E402
+
+
+class FadingPose:
+    # Finds the athlete for its first few frames only, like a tracker that drifts off: what it returns depends on
+    # every frame it has seen before
+    created = []
+    keypoints = None
+
+    def __init__(self, **options):
+        self.calls = 0
+        self.closed = False
+        FadingPose.created.append(self)
+
+    def process(self, image):
+        self.calls += 1
+        if self.calls > 6:
+            return SimpleNamespace(pose_landmarks=None)
+        landmark = [SimpleNamespace(x=x, y=y, z=z, visibility=0.9) for x, y, z in self.keypoints.tolist()]
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=landmark))
+
+    def close(self):
+        self.closed = True
+
+
+def write_video(path, frames=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for i in range(frames):
+        writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def videos(tmp_path, monkeypatch, ideal_keypoints):
+    monkeypatch.setattr(batch_evaluation, 'create_pose', FadingPose)
+    FadingPose.created = []
+    FadingPose.keypoints = ideal_keypoints
+    batch_evaluation._init_worker(1)
+    return [write_video(tmp_path / 'a.avi'), write_video(tmp_path / 'b.avi')]
+
+
+def test_every_video_gets_a_fresh_pose(videos, tmp_path):
+    for video in videos:
+        batch_evaluation._evaluate_in_worker((video, str(tmp_path), 3))
+    assert len(FadingPose.created) == 2
+    assert all(pose.closed for pose in FadingPose.created)
+
+
+def test_results_do_not_depend_on_the_order_videos_reach_a_worker(videos, tmp_path):
+    a, b = videos
+    first = batch_evaluation._evaluate_in_worker((a, str(tmp_path), 3))
+    batch_evaluation._evaluate_in_worker((b, str(tmp_path), 3))
+    again = batch_evaluation._evaluate_in_worker((a, str(tmp_path), 3))
+    assert first["detected_frames"] == again["detected_frames"] == 6
+
+
+def test_videos_sharing_a_stem_keep_separate_sessions(videos, tmp_path):
+    a = videos[0]
+    other = tmp_path / 'a.mov'
+    other.write_bytes(open(a, 'rb').read())
+    sessions = [batch_evaluation._evaluate_in_worker((path, str(tmp_path), 3))["session"] for path in (a, str(other))]
+    assert sessions == ['a.avi', 'a.mov']
+    assert (tmp_path / 'a.avi.frames.jsonl').exists() and (tmp_path / 'a.mov.frames.jsonl').exists()
+
+
+def test_recording_next_to_a_video_keeps_its_own_session(videos, tmp_path, ideal_keypoints):
+    with LandmarkRecorder(str(tmp_path / 'a.lmk'), frame_size=(48, 64)) as recorder:
+        for i in range(5):
+            recorder.append(ideal_keypoints, 100.0 + i / 30)
+    summary = batch_evaluation._evaluate_in_worker((str(tmp_path / 'a.lmk'), str(tmp_path), 3))
+    assert summary["session"] == 'a.lmk' and summary["detected_frames"] == 5
+    assert not FadingPose.created
+    assert (tmp_path / 'a.lmk.frames.jsonl').exists()
@@ -0,0 +1,41 @@
+import json
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import benchmark  # noqa: E402
+from synthetic import STANCE_TEMPLATE, SyntheticCapture, SyntheticPose, mirror_stance, synthetic_landmarks  # noqa: E402
+
+
+def test_summarize_reports_percentiles_in_milliseconds():
+    result = benchmark.summarize("x", [0.001] * 98 + [0.010, 0.020], items=4)
+    assert result["iterations"] == 100 and result["p50_ms"] == pytest.approx(1.0)
+    assert result["p99_ms"] > 9.0
+    assert result["throughput_per_s"] == pytest.approx(4 * 100 / 0.128)
+
+
+def test_synthetic_input_is_repeatable():
+    np.testing.assert_array_equal(synthetic_landmarks(5, seed=3), synthetic_landmarks(5, seed=3))
+    np.testing.assert_allclose(mirror_stance(mirror_stance()), STANCE_TEMPLATE, atol=1e-6)
+
+
+def test_synthetic_capture_and_pose_stand_in_for_a_camera_and_the_model():
+    cap = SyntheticCapture(frames=3, size=(48, 64))
+    reads = [cap.read() for _ in range(4)]
+    assert [ret for ret, _ in reads] == [True, True, True, False]
+    assert reads[0][1].shape == (48, 64, 3)
+    results = SyntheticPose(detection_rate=0.0).process(reads[0][1])
+    assert results.pose_landmarks is None
+    landmarks = SyntheticPose().process(reads[0][1]).pose_landmarks.landmark
+    assert len(landmarks) == 33
+
+
+def test_run_and_compare_against_an_earlier_report(tmp_path, capsys):
+    report = benchmark.run(iterations=5, frame_size=(48, 64), batch_size=10, only=['checks', 'steps'])
+    names = [result["name"] for result in report["results"]]
+    assert "check.check_feet_alignment.batch" in names and "steps.StepMachine.update" in names
+    assert all(result["p50_ms"] > 0 for result in report["results"])
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps(report))
+    benchmark.compare(report["results"], str(path))
+    assert "+0.0%" in capsys.readouterr().out
@@ -0,0 +1,38 @@
+import numpy as np
+from buffers import FrameRing, SharedFrameRing
+from synthetic import SyntheticCapture
+
+
+def test_frame_ring_hands_buffers_out_in_rotation():
+    ring = FrameRing(2)
+    first, second = ring.get((4, 4, 3)), ring.get((4, 4, 3))
+    assert first is not second
+    assert ring.get((4, 4, 3)) is first
+    # A new shape reallocates that slot only
+    assert ring.get((2, 2, 3)).shape == (2, 2, 3)
+
+
+def test_frame_ring_reads_into_its_buffers():
+    ring, capture = FrameRing(2), SyntheticCapture(frames=5, size=(8, 10))
+    frames = [ring.read(capture)[1] for _ in range(4)]
+    assert frames[2] is frames[0] and frames[3] is frames[1]
+    assert ring.read(capture)[0] and ring.read(capture) == (False, None)
+
+
+def test_shared_ring_is_visible_to_an_attached_ring():
+    owner = SharedFrameRing(2, (4, 6, 3))
+    try:
+        attached = SharedFrameRing(*owner.spec())
+        slot = owner.acquire()
+        frame = np.zeros((8, 12, 3), dtype=np.uint8)
+        frame[..., 0] = 200  # Blue in BGR
+        shape = owner.put_rgb(slot, frame)
+        assert shape == (4, 6, 3)
+        view = attached.view(slot, shape)
+        assert (view[..., 2] == 200).all() and (view[..., 0] == 0).all()
+        attached.close()
+        assert owner.acquire() is not None and owner.acquire(timeout=0.01) is None
+        owner.release(slot)
+        assert owner.acquire(timeout=0.01) == slot
+    finally:
+        owner.close()
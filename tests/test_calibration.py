@@ -0,0 +1,76 @@
+import warnings
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+from calibration import Calibration, calibration_quality, robust_keypoints, save_keypoints  # noqa: E402
+from landmarks import LandmarkFrame  # noqa: E402
+
+
+def samples_around(keypoints, n, noise=0.001, visibility=0.9, seed=0):
+    # (n, 33, 4) samples of a held pose with a little jitter
+    points = keypoints + np.random.default_rng(seed).normal(0, noise, (n,) + keypoints.shape)
+    return np.concatenate([points, np.full((n, len(keypoints), 1), visibility)], axis=-1).astype(np.float32)
+
+
+def test_robust_keypoints_rejects_outliers(ideal_keypoints):
+    samples = samples_around(ideal_keypoints, 60)
+    samples[::10, 0, :2] += 0.3  # A few frames with the nose far off
+    keypoints, rejected = robust_keypoints(samples)
+    np.testing.assert_allclose(keypoints[0], ideal_keypoints[0], atol=0.002)
+    assert rejected[::10, 0].all()
+
+
+def test_quality_names_the_joint_with_the_largest_spread(ideal_keypoints):
+    samples = samples_around(ideal_keypoints, 60)
+    samples[:, 15, :2] += np.random.default_rng(1).normal(0, 0.01, (60, 2))
+    keypoints, rejected = robust_keypoints(samples)
+    assert calibration_quality(samples, keypoints, rejected)["worst_joint"] == 15
+
+
+def test_quality_when_every_sample_of_a_joint_is_rejected(ideal_keypoints):
+    samples = samples_around(ideal_keypoints, 40, noise=0.002)
+    samples[:, 3:, 3] = 0.1
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        keypoints, rejected = robust_keypoints(samples)
+        quality = calibration_quality(samples, keypoints, rejected)
+    assert quality["worst_joint"] in (0, 1, 2)
+    assert quality["unconverged_joints"] == list(range(3, 33))
+    assert not np.isnan(keypoints).any()
+
+
+def test_quality_when_every_sample_is_rejected(ideal_keypoints, tmp_path):
+    samples = samples_around(ideal_keypoints, 40, noise=0.002, visibility=0.1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        keypoints, rejected = robust_keypoints(samples)
+        quality = calibration_quality(samples, keypoints, rejected)
+    assert quality["worst_joint"] is None and np.isnan(quality["joint_spread"])
+    assert len(quality["unconverged_joints"]) == 33
+    assert not np.isnan(keypoints).any()
+    save_keypoints(keypoints, quality, str(tmp_path / 'ideal.pkl'))
+    assert (tmp_path / 'ideal.pkl').exists()
+
+
+def test_calibration_stops_once_the_estimate_settles(ideal_keypoints):
+    calibration = Calibration(max_frames=600, min_frames=30, check_every=10)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    samples = samples_around(ideal_keypoints, 600, noise=0.0005)
+    frames = next(i for i in range(600)
+                  if calibration.update(frame, LandmarkFrame.from_keypoints(samples[i, :, :3], samples[i, :, 3]))) + 1
+    assert frames < 600
+    keypoints, quality = calibration.result()
+    np.testing.assert_allclose(keypoints, ideal_keypoints, atol=0.002)
+    assert quality["frames"] == len(calibration.ring)
+
+
+def test_repeated_landmarks_are_one_sample(ideal_keypoints):
+    calibration = Calibration(min_frames=30)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    samples = samples_around(ideal_keypoints, 10)
+    for i in range(10):
+        landmarks = LandmarkFrame.from_keypoints(samples[i, :, :3], samples[i, :, 3])
+        for _ in range(4):  # Carried forward over skipped frames
+            assert not calibration.update(frame, landmarks)
+    assert len(calibration.ring) == 10 and calibration.frames_seen == 40
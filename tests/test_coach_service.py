@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import queue
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import coach_service  # noqa: E402
+from coach_service import HEADER, LANDMARK_BYTES, MAX_FRAME_BYTES, read_message  # noqa: E402
+from synthetic import SyntheticPose  # noqa: E402
+
+
+async def read_from(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await read_message(reader)
+
+
+def test_read_message_rejects_oversized_payloads():
+    for kind, length in ((b'J', 0xFFFFFFFF), (b'J', MAX_FRAME_BYTES + 1), (b'L', LANDMARK_BYTES + 1)):
+        with pytest.raises(ValueError):
+            asyncio.run(read_from(HEADER.pack(kind, 1, 0.0, length)))
+
+
+def test_read_message_accepts_payloads_within_the_limit():
+    payload = bytes(LANDMARK_BYTES)
+    message = asyncio.run(read_from(HEADER.pack(b'L', 7, 1.5, len(payload)) + payload))
+    assert message == (b'L', 7, 1.5, payload)
+
+
+@pytest.fixture
+def poses(monkeypatch):
+    created = []
+
+    def create_pose(**options):
+        created.append(options)
+        return SyntheticPose()
+
+    monkeypatch.setattr(coach_service, 'create_pose', create_pose)
+    return created
+
+
+def test_workers_infer_every_frame_without_tracking(poses, monkeypatch):
+    monkeypatch.setattr(coach_service, 'limit_threads', lambda threads: None)
+    tasks, results = queue.Queue(), queue.Queue()
+    tasks.put(None)
+    coach_service._service_worker(tasks, results, 1, 640)
+    assert poses == [{"static_image_mode": True, "model_complexity": 1}]
+
+
+def jpeg():
+    return cv2.imencode('.jpg', np.zeros((48, 64, 3), dtype=np.uint8))[1].tobytes()
+
+
+def test_inference_failure_in_process_gets_an_error_reply(poses, monkeypatch):
+    real_infer = coach_service._infer
+    calls = []
+
+    def flaky_infer(pose, data, inference_size):
+        calls.append(data)
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        return real_infer(pose, data, inference_size)
+
+    monkeypatch.setattr(coach_service, '_infer', flaky_infer)
+
+    async def exchange():
+        service = coach_service.CoachService(workers=0)
+        port = await service.start('127.0.0.1', 0)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            coach_service.write_message(writer, b'J', 1, 0.0, jpeg())
+            first = await asyncio.wait_for(coach_service.read_reply(reader), 5)
+            coach_service.write_message(writer, b'J', 2, 0.1, jpeg())
+            second = await asyncio.wait_for(coach_service.read_reply(reader), 5)
+            writer.close()
+            return first, second
+        finally:
+            await service.stop()
+
+    first, second = asyncio.run(exchange())
+    assert first["seq"] == 1 and "model crashed" in first["error"]
+    assert second["seq"] == 2 and second["pose"]
+    assert poses == [{"static_image_mode": True, "model_complexity": 1}]
+
+
+def test_oversized_header_closes_the_connection(poses):
+    async def exchange():
+        service = coach_service.CoachService(workers=0)
+        port = await service.start('127.0.0.1', 0)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(HEADER.pack(b'J', 1, 0.0, 0xFFFFFFFF))
+            reply = await asyncio.wait_for(coach_service.read_reply(reader), 5)
+            rest = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return reply, rest
+        finally:
+            await service.stop()
+
+    reply, rest = asyncio.run(exchange())
+    assert "limit" in reply["error"]
+    assert rest == b''
+
+
+def _dying_worker(tasks, results, model_complexity, inference_size):
+    # A worker that exits before its model is up
+    os._exit(3)
+
+
+def test_hello_with_bad_options_gets_an_error_and_keeps_the_session(poses):
+    async def exchange():
+        service = coach_service.CoachService(workers=0)
+        port = await service.start('127.0.0.1', 0)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            replies = []
+            for seq, hello in enumerate(({"hold_time": None}, {"hold_time": -1}, {"frame_size": [480]},
+                                         {"frame_size": [480, "640"]}), start=1):
+                coach_service.write_message(writer, b'H', seq, 0.0, json.dumps(hello).encode())
+                replies.append(await asyncio.wait_for(coach_service.read_reply(reader), 5))
+            coach_service.write_message(writer, b'H', 5, 0.0, json.dumps({"hold_time": "2"}).encode())
+            coach_service.write_message(writer, b'L', 6, 0.0, bytes(LANDMARK_BYTES))
+            replies.append(await asyncio.wait_for(coach_service.read_reply(reader), 5))
+            writer.close()
+            return replies
+        finally:
+            await service.stop()
+
+    replies = asyncio.run(exchange())
+    assert all("bad hello" in reply["error"] for reply in replies[:4])
+    assert replies[4]["seq"] == 6 and "error" not in replies[4]
+
+
+def test_a_worker_that_dies_before_it_is_ready_fails_start(monkeypatch):
+    monkeypatch.setattr(coach_service, '_service_worker', _dying_worker)
+
+    async def start():
+        await coach_service.CoachService(workers=1).start('127.0.0.1', 0)
+
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        asyncio.run(asyncio.wait_for(start(), 60))
+
+
+def test_requests_held_by_a_dead_worker_get_an_error():
+    async def exchange():
+        service = coach_service.CoachService(workers=1)
+        port = await asyncio.wait_for(service.start('127.0.0.1', 0), 60)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            service._processes[0].kill()
+            coach_service.write_message(writer, b'J', 1, 0.0, jpeg())
+            first = await asyncio.wait_for(coach_service.read_reply(reader), 10)
+            coach_service.write_message(writer, b'J', 2, 0.1, jpeg())
+            second = await asyncio.wait_for(coach_service.read_reply(reader), 10)
+            writer.close()
+            return first, second, service.failure
+        finally:
+            await service.stop()
+
+    first, second, failure = asyncio.run(exchange())
+    assert first["seq"] == 1 and "exited" in first["error"]
+    assert second["seq"] == 2 and second["error"] == failure
@@ -0,0 +1,54 @@
+import sys
+import threading
+import types
+import pytest
+import engine
+
+
+class FakePose:
+    def __init__(self, **options):
+        self.options = options
+        self.closed = False
+
+    def process(self, image):
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_mediapipe(monkeypatch):
+    pose_module = types.SimpleNamespace(Pose=FakePose)
+    monkeypatch.setitem(sys.modules, 'mediapipe', types.SimpleNamespace(solutions=types.SimpleNamespace(
+        pose=pose_module)))
+    yield
+    engine.close()
+
+
+def test_get_pose_shares_one_engine_per_options():
+    assert engine.get_pose(model_complexity=0) is engine.get_pose(model_complexity=0)
+    assert engine.get_pose(model_complexity=0) is not engine.get_pose(model_complexity=1)
+
+
+def test_close_during_warm_up_does_not_deadlock():
+    options = {"model_complexity": 2}
+    key = engine._key(options)
+    for _ in range(20):
+        warmup = threading.Thread(target=engine._create, args=(key, options), daemon=True)
+        closer = threading.Thread(target=engine.close, daemon=True)
+        with engine._lock:
+            # A warm-up waiting for the lock inside _create while close() starts
+            engine._warmups[key] = warmup
+            warmup.start()
+            closer.start()
+        closer.join(timeout=5)
+        assert not closer.is_alive()
+        assert not engine._engines and not engine._warmups
+
+
+def test_close_closes_every_engine():
+    pose = engine.get_pose(model_complexity=1)
+    engine.close()
+    assert pose.closed
+    assert engine.get_pose(model_complexity=1) is not pose
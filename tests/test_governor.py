@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+import governor
+from governor import CpuGovernor, parse_cores, session_cores
+from synthetic import SyntheticPose
+
+
+def test_parse_cores_reads_ranges_and_lists():
+    assert parse_cores('0-3,6') == [0, 1, 2, 3, 6]
+    assert parse_cores(2) == [2]
+
+
+def test_sessions_take_cores_in_turn():
+    assert session_cores(0, 2, cores=[0, 1, 2, 3]) == [0, 1]
+    assert session_cores(1, 2, cores=[0, 1, 2, 3]) == [2, 3]
+    assert session_cores(2, 2, cores=[0, 1, 2, 3]) == [0, 1]
+    assert session_cores(0, 8, cores=[0, 1]) == [0, 1]
+
+
+def fake_engine(monkeypatch):
+    # Stands in for the shared engine: records the options each model is looked up with, and loads instantly
+    requested = []
+
+    def get_pose(**options):
+        requested.append(options)
+        return SyntheticPose()
+
+    def warm_up(**options):
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+        return thread
+
+    monkeypatch.setattr(governor, 'get_pose', get_pose)
+    monkeypatch.setattr(governor, 'warm_up', warm_up)
+    monkeypatch.setattr(governor, 'host_load', lambda: 0.0)
+    return requested
+
+
+def step(governor_, frames, latency):
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    for _ in range(frames):
+        job = governor_.prepare(frame)
+        if job is not None:
+            governor_.finish(job, governor_.run(job), latency)
+
+
+def test_stride_rises_over_budget_and_falls_with_headroom(monkeypatch):
+    fake_engine(monkeypatch)
+    cpu = CpuGovernor(SyntheticPose(), target_fps=10, max_stride=2, tune_every=5)
+    step(cpu, 10, latency=0.2)
+    assert cpu.stride == 2
+    step(cpu, 200, latency=0.001)
+    assert cpu.stride == 1
+
+
+def test_stepping_back_up_finds_the_starting_engine(monkeypatch):
+    requested = fake_engine(monkeypatch)
+    # Started the way the orchestrator starts it, on the pose shared under no options at all
+    cpu = CpuGovernor(SyntheticPose(), target_fps=10, max_stride=1, tune_every=5, pose_options={})
+    step(cpu, 20, latency=0.2)
+    assert cpu.model_complexity == 0
+    cpu._measured.clear()
+    step(cpu, 40, latency=0.001)
+    assert cpu.model_complexity == 1
+    assert requested == [{'model_complexity': 0}, {}]
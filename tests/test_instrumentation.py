@@ -0,0 +1,58 @@
+import json
+import numpy as np
+from instrumentation import HISTOGRAM_EDGES_MS, StageTimer
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer()
+    timer.begin_frame()
+    timer.lap('capture')
+    timer.record('inference', 0.01)
+    timer.count('no_pose_landmarks')
+    stats = timer.stats()
+    assert stats["stages"] == {} and stats["events"] == {} and stats["frames"] == 0
+
+
+def test_stats_summarize_the_recent_window():
+    timer = StageTimer(enabled=True, window=100)
+    for ms in range(1, 201):
+        timer.record('inference', ms / 1e3)
+    timer.count('no_pose_landmarks')
+    timer.count('no_pose_landmarks')
+    stats = timer.stats()
+    inference = stats["stages"]["inference"]
+    # 200 recorded, percentiles over the last 100 (101-200 ms)
+    assert inference["count"] == 200
+    assert inference["p50_ms"] == np.percentile(np.arange(101, 201), 50)
+    assert inference["histogram"] == [0] * (len(HISTOGRAM_EDGES_MS) - 2) + [33, 67]
+    assert stats["events"] == {"no_pose_landmarks": 2}
+
+
+def test_laps_and_frames():
+    timer = StageTimer(enabled=True)
+    for _ in range(3):
+        timer.begin_frame()
+        timer.lap('capture')
+        timer.lap('draw')
+    stats = timer.stats()
+    assert set(stats["stages"]) == {'capture', 'draw'} and stats["stages"]["draw"]["count"] == 3
+    assert stats["frames"] == 2 and stats["fps"] > 0
+
+
+def test_dump_appends_json_lines(tmp_path):
+    path = tmp_path / 'stats.jsonl'
+    timer = StageTimer(enabled=True, dump_file=str(path))
+    timer.record('check', 0.002)
+    timer.dump()
+    timer.dump()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2 and lines[0]["stages"]["check"]["p50_ms"] == 2.0
+    assert lines[0]["histogram_edges_ms"][-1] is None
+
+
+def test_hud_draws_into_the_frame():
+    timer = StageTimer(enabled=True, hud=True)
+    timer.record('inference', 0.02)
+    frame = np.zeros((120, 320, 3), dtype=np.uint8)
+    timer.end_frame(frame)
+    assert frame.any()
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from landmarks import LandmarkFrame, as_keypoint_array, stack_frames
+
+
+def jittered(keypoints, n, noise=0.02, seed=0):
+    return (keypoints + np.random.default_rng(seed).normal(0, noise, (n,) + keypoints.shape)).astype(np.float32)
+
+
+def test_landmark_frame_round_trips_keypoints(ideal_keypoints):
+    frame = LandmarkFrame.from_keypoints(ideal_keypoints, np.full(33, 0.5))
+    np.testing.assert_allclose(frame.points, ideal_keypoints, rtol=1e-6)
+    assert (frame.visibility == 0.5).all()
+    assert np.shares_memory(as_keypoint_array(frame), frame.data) and np.asarray(frame).shape == (33, 3)
+    assert frame.copy().data is not frame.data
+
+
+def test_keypoint_arrays_pass_through_and_frames_stack(ideal_keypoints):
+    points = jittered(ideal_keypoints, 3)
+    assert as_keypoint_array(points) is points
+    frames = [LandmarkFrame.from_keypoints(p) for p in points]
+    np.testing.assert_array_equal(stack_frames(frames), points)
+    np.testing.assert_array_equal(as_keypoint_array(frames), points)
+
+
+def test_vectorized_checks_score_a_batch_like_single_frames(ideal_keypoints):
+    pytest.importorskip("mediapipe")
+    import utils
+    points = jittered(ideal_keypoints, 50, seed=4)
+    batch = utils.check_feet_alignment(points)
+    assert list(batch) == [bool(utils.check_feet_alignment(p)) for p in points]
+    correct, feedback = utils.check_knee_bend((480, 640), points)
+    assert feedback[7] == utils.check_knee_bend((480, 640), points[7])[1]
+    assert correct[7] == utils.check_knee_bend((480, 640), points[7])[0]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+from motion import MotionMatcher, MotionReference  # noqa: E402
+from stance_library import normalize_pose  # noqa: E402
+from synthetic import STANCE_TEMPLATE, synthetic_landmarks  # noqa: E402
+
+HANDS = [13, 14, 15, 16]  # Elbows and wrists
+
+
+def guard_raise(n, seed=0):
+    # The hands rising from the hips to the chin over n frames, with a little jitter
+    poses = synthetic_landmarks(n, noise=0.002, seed=seed).copy()
+    lift = np.linspace(0.25, 0, n)[:, None]
+    poses[:, HANDS, 1] += lift
+    return poses
+
+
+def brute_force_cost(reference, attempt, aspect=4 / 3):
+    # The same recurrence over the whole table: each live frame moves 0, 1 or 2 reference frames on, and the first
+    # reference frame always starts afresh. Returns the lowest mean cost over the last column
+    query = normalize_pose(attempt, aspect)
+    cost = np.full(len(reference), np.inf)
+    steps = np.ones(len(reference))
+    for pose in query:
+        frame_cost = np.linalg.norm(reference.poses - pose, axis=-1).mean(axis=-1)
+        new_cost, new_steps = np.empty_like(cost), np.empty_like(steps)
+        for j in range(len(reference)):
+            if j == 0:
+                new_cost[j], new_steps[j] = frame_cost[j], 1
+                continue
+            options = [(cost[k], steps[k] + 1) for k in (j, j - 1, j - 2) if k >= 0]
+            best, count = min(options, key=lambda option: option[0])
+            new_cost[j], new_steps[j] = best + frame_cost[j], count
+        cost, steps = new_cost, new_steps
+    mean = cost / steps
+    # A fresh start only counts when nothing else is reachable, as in MotionMatcher
+    return mean[1:].min() if np.isfinite(mean[1:]).any() else mean[0]
+
+
+def test_banded_alignment_matches_the_full_table_when_the_band_covers_it():
+    reference = MotionReference(guard_raise(12))
+    attempt = guard_raise(9, seed=1)
+    attempt[:, HANDS, 0] += 0.03  # Off the reference a little, so the costs are not all near zero
+    matcher = MotionMatcher(reference, band=64)
+    for pose in attempt:
+        score = matcher.update(pose)
+    assert score.cost == pytest.approx(brute_force_cost(reference, attempt), rel=1e-5)
+
+
+def test_the_same_movement_at_half_speed_scores_as_a_copy():
+    reference = MotionReference(guard_raise(10))
+    matcher = MotionMatcher(reference, band=8)
+    for pose in np.repeat(guard_raise(10, seed=2), 2, axis=0):
+        score = matcher.update(pose)
+    assert score.finished and score.similarity > 0.85
+    assert list(score.worst_joints) == list(reference.phases)
+
+
+def test_a_different_pose_scores_low_and_repeats_are_not_new_frames():
+    reference = MotionReference(guard_raise(10))
+    matcher = MotionMatcher(reference)
+    assert matcher.score() is None
+    still = STANCE_TEMPLATE.copy()
+    still[HANDS, 1] -= 0.3  # Hands over the head the whole time
+    score = matcher.update(still)
+    assert matcher.update(still) == score and matcher.frames == 1
+    assert score.similarity < 0.5
@@ -0,0 +1,75 @@
+import os
+import queue
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import multistation  # noqa: E402
+from buffers import SharedFrameRing  # noqa: E402
+from synthetic import SyntheticPose  # noqa: E402
+
+
+def exiting_worker(*args):
+    # Stands in for _pose_worker in a spawned process
+    os._exit(3)
+
+
+def test_each_stream_gets_its_own_pose(monkeypatch):
+    created = []
+
+    def create_pose(**options):
+        pose = SyntheticPose()
+        created.append(pose)
+        return pose
+
+    monkeypatch.setattr(multistation, 'create_pose', create_pose)
+    monkeypatch.setattr(multistation, 'apply_limits', lambda **kwargs: None)
+    ring = SharedFrameRing(1, (8, 8, 3))
+    try:
+        tasks, results = queue.Queue(), queue.Queue()
+        for sequence, stream_id in enumerate([0, 1, 0, 1, 0]):
+            tasks.put((stream_id, sequence, 0, (8, 8, 3)))
+        tasks.put(None)
+        multistation._pose_worker(tasks, results, 1, ring.spec())
+    finally:
+        ring.close()
+    assert results.qsize() == 5
+    # Each Pose only ever saw one station's frames, in order
+    assert [pose._index for pose in created] == [3, 2]
+
+
+def test_streams_stay_on_one_worker():
+    server = multistation.MultiStationServer(['synthetic', 'synthetic', 'synthetic'], workers=2)
+    assert [server._worker_of(stream) for stream in server.streams] == [0, 1, 0]
+    assert multistation.MultiStationServer(['a.mp4'], workers=4).workers == 1
+
+
+def test_run_ends_when_a_source_never_produces_a_frame(tmp_path):
+    server = multistation.MultiStationServer([str(tmp_path / '*.png')], workers=1, inference_size=32)
+    stats = server.run(duration=20)
+    assert stats[0]["completed_steps"] == 0
+    assert server.streams[0].ended and server.streams[0].frame_sequence == 0
+
+
+def test_run_fails_when_a_worker_dies(monkeypatch):
+    monkeypatch.setattr(multistation, '_pose_worker', exiting_worker)
+    monkeypatch.syspath_prepend(os.path.dirname(__file__))
+    server = multistation.MultiStationServer(['synthetic:64x48'], workers=1, inference_size=32)
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        server.run(duration=20)
+
+
+def test_dispatch_skips_streams_whose_worker_is_busy():
+    server = multistation.MultiStationServer(['synthetic', 'synthetic', 'synthetic'], workers=2, target_fps=0)
+    for stream in server.streams:
+        stream.frame = np.zeros((8, 8, 3), dtype=np.uint8)
+        stream.frame_sequence = 1
+    ring = SharedFrameRing(2, (8, 8, 3))
+    tasks = [queue.Queue(), queue.Queue()]
+    try:
+        server._dispatch(tasks, ring)
+    finally:
+        ring.close()
+    # Streams 0 and 2 share worker 0, so only one of them goes out
+    assert [stream.in_flight for stream in server.streams].count(True) == 2
+    assert tasks[0].qsize() == 1 and tasks[1].qsize() == 1
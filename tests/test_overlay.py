@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+from overlay import IdealPoseOverlay  # noqa: E402
+from utils import draw_keypoints_with_lines  # noqa: E402
+
+
+def blended_every_frame(frame, ideal_keypoints):
+    # The overlay as it used to be drawn: the skeleton onto a copy, then a full-frame blend
+    drawn = frame.copy()
+    draw_keypoints_with_lines(drawn, ideal_keypoints)
+    return cv2.addWeighted(frame, 0.5, drawn, 0.5, 0)
+
+
+def test_cached_layer_matches_the_per_frame_blend(ideal_keypoints):
+    rng = np.random.default_rng(0)
+    overlay = IdealPoseOverlay(ideal_keypoints)
+    for size in ((480, 640), (240, 320), (480, 640)):
+        frame = rng.integers(0, 256, size + (3,), dtype=np.uint8)
+        expected = blended_every_frame(frame, ideal_keypoints)
+        result = overlay.apply(frame.copy())
+        assert np.abs(result.astype(int) - expected).max() <= 1
+        assert (result != frame).any()
+
+
+def test_non_contiguous_frames_are_blended_in_place(ideal_keypoints):
+    frame = np.random.default_rng(1).integers(0, 256, (480, 1280, 3), dtype=np.uint8)
+    expected = blended_every_frame(np.ascontiguousarray(frame[:, ::2]), ideal_keypoints)
+    view = frame[:, ::2]
+    IdealPoseOverlay(ideal_keypoints).apply(view)
+    assert np.abs(frame[:, ::2].astype(int) - expected).max() <= 1
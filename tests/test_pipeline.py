@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from pipeline import PosePipeline, put_latest
+
+
+class ThreadCheckingCapture:
+    # A camera stand-in that remembers which threads read it and whether two reads ever overlapped
+    def __init__(self, frames):
+        self.frames = frames
+        self.readers = set()
+        self.overlapped = False
+        self._reading = threading.Lock()
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        # Like cv2.VideoCapture.read, the image to fill is optional and a fresh one may come back instead
+        if not self._reading.acquire(blocking=False):
+            self.overlapped = True
+            return self._next()
+        try:
+            self.readers.add(threading.get_ident())
+            return self._next()
+        finally:
+            self._reading.release()
+
+    def _next(self):
+        time.sleep(0.002)  # About a camera's pace, so the consumer keeps up
+        if self.frames <= 0:
+            return False, None
+        self.frames -= 1
+        return True, np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class NoPose:
+    def process(self, image):
+        return SimpleNamespace(pose_landmarks=None)
+
+
+def test_put_latest_replaces_a_stale_item():
+    q = queue.Queue(maxsize=1)
+    assert not put_latest(q, 1)
+    assert put_latest(q, 2)
+    assert q.get_nowait() == 2
+
+
+def test_one_pipeline_serves_several_phases():
+    capture = ThreadCheckingCapture(frames=200)
+    pipeline = PosePipeline(capture, NoPose()).start()
+    try:
+        first = []
+        for frame, keypoints, _ in pipeline.frames():
+            first.append(frame)
+            if len(first) == 5:
+                break
+        rest = list(pipeline.frames())
+        # Capture has ended: a further phase gets nothing rather than waiting forever
+        assert list(pipeline.frames()) == []
+    finally:
+        pipeline.stop()
+    assert len(first) == 5 and rest
+    assert len(capture.readers) == 1 and not capture.overlapped
+
+
+def test_run_pipelined_leaves_a_shared_pipeline_running(monkeypatch):
+    pytest.importorskip("mediapipe")
+    import boxing_coach
+    monkeypatch.setattr(boxing_coach.cv2, 'imshow', lambda *args: None)
+    monkeypatch.setattr(boxing_coach.cv2, 'waitKey', lambda *args: -1)
+    capture = ThreadCheckingCapture(frames=1000)
+    pipeline = PosePipeline(capture, NoPose()).start()
+    try:
+        for _ in range(2):
+            rendered = []
+
+            def render(frame, keypoints, now):
+                rendered.append(frame)
+                return frame, len(rendered) == 3
+
+            assert boxing_coach.run_pipelined(capture, render, pipeline=pipeline) is not None
+            assert all(thread.is_alive() for thread in pipeline._threads)
+    finally:
+        pipeline.stop()
+    assert len(capture.readers) == 1 and not capture.overlapped
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from landmarks import LandmarkFrame
+from recording import LandmarkRecorder, LandmarkRecording
+
+
+def frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-1, 1, (n, 33, 3)).astype(np.float32)
+    visibility = rng.uniform(0, 1, (n, 33)).astype(np.float32)
+    return points, visibility
+
+
+def test_round_trip_within_float16_and_byte_precision(tmp_path):
+    points, visibility = frames(10)
+    path = str(tmp_path / 'session.lmk')
+    with LandmarkRecorder(path, frame_size=(480, 640), chunk_size=4) as recorder:
+        for i in range(10):
+            recorder.append(None if i == 3 else LandmarkFrame.from_keypoints(points[i], visibility[i]), 100.0 + i / 30)
+    recording = LandmarkRecording(path)
+    assert len(recording) == 10 and recording.frame_size == [480, 640]
+    assert isinstance(recording.points, np.memmap) and recording.points.dtype == np.float16
+    kept = np.arange(10) != 3
+    np.testing.assert_array_equal(recording.present, kept)
+    np.testing.assert_allclose(recording.points[kept], points[kept], rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(recording.visibility_scores()[kept], visibility[kept], atol=0.5 / 255 + 1e-6)
+    np.testing.assert_array_equal(recording.timestamps, 100.0 + np.arange(10) / 30)
+    assert recording.frame(3) is None
+    np.testing.assert_allclose(recording.frame(4).points, points[4], rtol=1e-3, atol=1e-3)
+
+
+def test_appending_to_an_existing_recording(tmp_path):
+    points, _ = frames(6, seed=1)
+    path = str(tmp_path / 'session.lmk')
+    with LandmarkRecorder(path, chunk_size=4) as recorder:
+        for i in range(3):
+            recorder.append(points[i], float(i))
+    with LandmarkRecorder(path, chunk_size=4) as recorder:
+        for i in range(3, 6):
+            recorder.append(points[i], float(i))
+    recording = LandmarkRecording(path)
+    np.testing.assert_array_equal(recording.timestamps, np.arange(6))
+    assert sum(len(chunk[0]) for chunk in recording.chunks(size=4)) == 6
+
+
+def test_unknown_format_version_is_refused(tmp_path):
+    path = tmp_path / 'session.lmk'
+    LandmarkRecorder(str(path)).close()
+    (path / 'meta.json').write_text('{"version": 99}')
+    with pytest.raises(ValueError):
+        LandmarkRecording(str(path))
@@ -0,0 +1,28 @@
+import cv2
+import numpy as np
+from rendering import draw_label, draw_text, text_sprite
+
+
+def frame():
+    return np.full((60, 200, 3), 40, dtype=np.uint8)
+
+
+def test_label_matches_put_text():
+    expected = cv2.putText(frame(), "Guard up", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    drawn = draw_label(frame(), "Guard up", (10, 30))
+    assert np.abs(drawn.astype(int) - expected).max() <= 2
+
+
+def test_label_clipped_at_the_frame_edge():
+    drawn = draw_label(frame(), "Guard up", (170, 5))
+    assert drawn.shape == (60, 200, 3)
+
+
+def test_per_frame_text_is_not_cached():
+    text_sprite.cache_clear()
+    for i in range(20):
+        draw_text(frame(), f"Calibrating... ({i}/20)", (10, 30))
+    assert text_sprite.cache_info().currsize == 0
+    draw_label(frame(), "Guard up", (10, 30))
+    draw_label(frame(), "Guard up", (10, 30))
+    assert text_sprite.cache_info().hits == 1
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import utils  # noqa: E402
+from features import PoseFeatures  # noqa: E402
+from rules import Rule, evaluate_rule  # noqa: E402
+from steps import EVALUATION_STEPS, STANCE_FEEDBACK, STEPS  # noqa: E402
+from synthetic import synthetic_landmarks  # noqa: E402
+
+SHAPE = (480, 640)
+
+
+def poses():
+    # Noisy enough that every check both passes and fails somewhere in the batch
+    return synthetic_landmarks(300, noise=0.02, seed=3)
+
+
+def test_rules_follow_a_batch_frame_by_frame():
+    rule = Rule('foot_distance', 1.1, 1.2, "wider", "narrower", relative_to='shoulder_width')
+    points = poses()
+    batch = evaluate_rule(rule, PoseFeatures(points, SHAPE))
+    for i in range(0, len(points), 37):
+        single = evaluate_rule(rule, PoseFeatures(points[i], SHAPE))
+        assert (single.below, single.above) == (batch.below[i], batch.above[i])
+
+
+@pytest.mark.parametrize("step, check", [
+    (STEPS[0], lambda points: utils.draw_foot_position_box(SHAPE, points)),
+    (STEPS[1], lambda points: utils.check_foot_angles(SHAPE, points)),
+    (STEPS[2], lambda points: utils.check_knee_bend(SHAPE, points)),
+    (STEPS[3], lambda points: utils.check_hands_and_chin(SHAPE, points)),
+])
+def test_steps_agree_with_the_checks_they_replaced(step, check):
+    points = poses()
+    correct, feedback = step.evaluate(PoseFeatures(points, SHAPE))
+    expected_correct, expected_feedback = check(points)
+    assert 0 < np.count_nonzero(expected_correct) < len(points)
+    np.testing.assert_array_equal(correct, expected_correct)
+    assert feedback == expected_feedback
+
+
+def test_stance_rules_agree_with_the_feet_checks():
+    points = poses()
+    features = PoseFeatures(points, SHAPE)
+    np.testing.assert_array_equal(EVALUATION_STEPS[1].evaluate(features)[0], utils.check_shoulder_width(points))
+    np.testing.assert_array_equal(EVALUATION_STEPS[0].evaluate(features)[0], utils.check_feet_alignment(points))
+    advice = STANCE_FEEDBACK.evaluate(features)[1]
+    assert advice == [" ".join(messages) for messages in utils.generate_feedback(points)]
+
+
+def test_join_feedback_for_a_frame_and_a_batch():
+    assert utils.join_feedback([(True, "a"), (False, "b"), (True, "c")]) == "a c"
+    masks = [(np.array([True, False]), "a"), (np.array([True, True]), "b")]
+    assert utils.join_feedback(masks) == ["a b", "b"]
+
+
+def test_skeleton_from_half_precision_landmarks_lands_on_the_same_pixels():
+    points = synthetic_landmarks(1, noise=0.05, seed=1)[0]
+    points[5] = np.nan
+    half, single = np.zeros(SHAPE + (3,), dtype=np.uint8), np.zeros(SHAPE + (3,), dtype=np.uint8)
+    utils.draw_keypoints_with_lines(half, points.astype(np.float16))
+    utils.draw_keypoints_with_lines(single, points.astype(np.float16).astype(np.float32))
+    np.testing.assert_array_equal(half, single)
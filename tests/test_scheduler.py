@@ -0,0 +1,63 @@
+import numpy as np
+from landmarks import LandmarkFrame
+from scheduler import AdaptiveInference, InferenceJob, landmark_box, to_frame_coordinates
+from synthetic import STANCE_TEMPLATE, SyntheticPose
+
+
+class ResettablePose(SyntheticPose):
+    def __init__(self):
+        super().__init__()
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+def pose_at(offset=(0.0, 0.0), scale=1.0):
+    points = (STANCE_TEMPLATE - [0.5, 0.5, 0]) * [scale, scale, 1] + [0.5 + offset[0], 0.5 + offset[1], 0]
+    return LandmarkFrame.from_keypoints(points.astype(np.float32), np.full(33, 0.9, dtype=np.float32))
+
+
+def test_landmark_box_pads_the_visible_landmarks():
+    x0, y0, w, h = landmark_box(pose_at(), 640, 480, margin=0)
+    assert (x0, y0) == (int(0.409 * 640), int(0.19 * 480))
+    assert landmark_box(pose_at(scale=0.05), 640, 480) is None
+
+
+def test_to_frame_coordinates_undoes_the_crop():
+    landmarks = pose_at()
+    job = InferenceJob(None, 100, 50, 320, 240, 640, 480)
+    mapped = to_frame_coordinates(LandmarkFrame(landmarks.data.copy()), job)
+    np.testing.assert_allclose(mapped.points[:, 0], (landmarks.points[:, 0] * 320 + 100) / 640, rtol=1e-6)
+    np.testing.assert_allclose(mapped.points[:, 1], (landmarks.points[:, 1] * 240 + 50) / 480, rtol=1e-6)
+
+
+def test_crop_stays_put_until_the_athlete_reaches_its_edge():
+    scheduler = AdaptiveInference(ResettablePose())
+    assert scheduler._roi(None, 640, 480) == (0, 0, 640, 480)
+    box = scheduler._roi(pose_at(), 640, 480)
+    assert box != (0, 0, 640, 480)
+    # Small moves inside the crop keep it
+    assert scheduler._roi(pose_at((0.01, 0.01)), 640, 480) == box
+    # Reaching the edge re-anchors it
+    moved = scheduler._roi(pose_at((0.15, 0.0)), 640, 480)
+    assert moved != box and moved[0] > box[0]
+    # Losing the athlete goes back to the full frame
+    assert scheduler._roi(None, 640, 480) == (0, 0, 640, 480)
+
+
+def test_model_restarts_tracking_only_when_the_crop_moves():
+    pose = ResettablePose()
+    scheduler = AdaptiveInference(pose)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    for box in [(0, 0, 640, 480), (100, 50, 300, 300), (100, 50, 300, 300), (120, 50, 300, 300)]:
+        scheduler.run(InferenceJob(image, *box, 640, 480))
+    assert pose.resets == 2
+
+
+def test_frames_without_motion_are_skipped():
+    scheduler = AdaptiveInference(SyntheticPose(), max_skip=2)
+    frame = np.full((480, 640, 3), 80, dtype=np.uint8)
+    results = [scheduler.process_frame(frame) for _ in range(7)]
+    assert scheduler.inferred_frames == 3 and scheduler.skipped_frames == 4
+    assert all(result is not None for result in results)
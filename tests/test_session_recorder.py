@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+import numpy as np
+from recording import LandmarkRecording
+from session_recorder import SessionRecorder
+
+
+def frame(value=0):
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+def test_events_reach_the_file_while_the_session_is_open(tmp_path):
+    recorder = SessionRecorder(str(tmp_path))
+    recorder.event('feedback', 1.0, step='Guard', feedback=None, correct=np.bool_(True))
+    wait_for(lambda: (tmp_path / 'events.jsonl').read_text())
+    assert json.loads((tmp_path / 'events.jsonl').read_text()) == {"t": 1.0, "event": 'feedback', "step": 'Guard',
+                                                                   "feedback": None, "correct": True}
+    recorder.close()
+
+
+def test_frames_are_dropped_instead_of_blocking_a_stalled_writer(tmp_path, monkeypatch):
+    recorder = SessionRecorder(str(tmp_path), max_fps=0, max_pending_frames=2)
+    release = threading.Event()
+    write = recorder._write
+
+    def stalled_write(*item):
+        release.wait()
+        write(*item)
+
+    monkeypatch.setattr(recorder, '_write', stalled_write)
+    start = time.perf_counter()
+    queued = [recorder.add_frame(frame(i), timestamp=i / 30) for i in range(20)]
+    assert time.perf_counter() - start < 1.0
+    # One is with the writer, two wait in the queue; everything after that is dropped
+    assert sum(queued) <= 3 and queued[:2] == [True, True]
+    for i in range(5):
+        recorder.append(None, i / 30)
+    recorder.event('all_steps_completed', 1.0)
+    release.set()
+    recorder.close()
+    stats = json.loads((tmp_path / 'session.json').read_text())
+    assert stats["frames_written"] == sum(queued) and stats["frames_dropped"] == 20 - sum(queued)
+    assert stats["landmark_frames"] == 5 and stats["events_written"] == 1
+    assert len(LandmarkRecording(str(tmp_path / 'landmarks'))) == 5
+
+
+def test_frames_above_max_fps_are_skipped(tmp_path):
+    recorder = SessionRecorder(str(tmp_path), max_fps=4, max_pending_frames=32)
+    queued = [recorder.add_frame(frame(), timestamp=i * 0.125) for i in range(32)]
+    recorder.close()
+    assert queued == [True, False] * 16 and recorder.frames_skipped == 16
+    assert (tmp_path / 'video_timestamps.f64').stat().st_size == 16 * 8
@@ -0,0 +1,139 @@
+import threading
+import time
+import cv2
+import numpy as np
+from sources import PrefetchingSource, open_source
+from synthetic import SyntheticCapture
+
+
+class CountingCapture:
+    # A capture whose frame N is filled with the value N, so tests can tell which frame they got
+    def __init__(self, frames=12, read_delay=0.0):
+        self.frames = frames
+        self.read_delay = read_delay
+        self.index = 0
+        self.opened = True
+        self.reading = False
+        self.released_while_reading = False
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, image=None):
+        self.reading = True
+        time.sleep(self.read_delay)
+        try:
+            if not self.opened or self.index >= self.frames:
+                return False, None
+            frame = np.full((4, 6, 3), self.index, dtype=np.uint8)
+            self.index += 1
+            return True, frame
+        finally:
+            self.reading = False
+
+    def grab(self):
+        if self.index >= self.frames:
+            return False
+        self.index += 1
+        return True
+
+    def get(self, prop):
+        return self.index if prop == cv2.CAP_PROP_POS_FRAMES else 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.index = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.released_while_reading = self.reading
+        self.opened = False
+
+
+def read_all(source):
+    values = []
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            return values
+        values.append(int(frame[0, 0, 0]))
+
+
+def test_reads_after_end_of_stream_return_false():
+    source = PrefetchingSource(SyntheticCapture(frames=3))
+    try:
+        assert all(source.read()[0] for _ in range(3))
+        results = []
+        reader = threading.Thread(target=lambda: results.extend(source.read() for _ in range(3)), daemon=True)
+        reader.start()
+        reader.join(timeout=2)
+        assert not reader.is_alive()
+        assert results == [(False, None)] * 3
+        assert not source.isOpened()
+    finally:
+        source.release()
+
+
+def test_seek_after_end_of_stream_plays_again():
+    source = PrefetchingSource(CountingCapture(frames=4))
+    try:
+        assert read_all(source) == [0, 1, 2, 3]
+        source.set(cv2.CAP_PROP_POS_FRAMES, 2)
+        assert read_all(source) == [2, 3]
+    finally:
+        source.release()
+
+
+def test_stride_starts_at_the_first_frame():
+    source = PrefetchingSource(CountingCapture(frames=10), stride=3)
+    try:
+        assert read_all(source) == [0, 3, 6, 9]
+    finally:
+        source.release()
+
+
+def test_seek_with_stride_lands_on_the_requested_frame():
+    source = PrefetchingSource(CountingCapture(frames=12), stride=3)
+    try:
+        source.read()
+        source.set(cv2.CAP_PROP_POS_FRAMES, 5)
+        ret, frame = source.read()
+        assert ret and frame[0, 0, 0] == 5
+        assert source.get(cv2.CAP_PROP_POS_FRAMES) == 8
+    finally:
+        source.release()
+
+
+def test_downscaled_frames_keep_stride_order():
+    source = PrefetchingSource(CountingCapture(frames=7), stride=2, max_side=3)
+    try:
+        ret, frame = source.read()
+        assert ret and frame.shape == (2, 3, 3)
+        assert [int(frame[0, 0, 0])] + read_all(source) == [0, 2, 4, 6]
+    finally:
+        source.release()
+
+
+def test_read_returns_once_the_decoder_has_stopped():
+    source = PrefetchingSource(CountingCapture(frames=1000), prefetch=1)
+    source._stop.set()
+    source._thread.join()
+    while source._queue.qsize():
+        source._queue.get()
+    assert source.read() == (False, None)
+    source.release()
+
+
+def test_release_waits_for_the_decoder():
+    capture = CountingCapture(frames=1000, read_delay=0.02)
+    source = PrefetchingSource(capture, prefetch=1)
+    source.read()
+    source.release()
+    assert not source._thread.is_alive()
+    assert not capture.released_while_reading
+
+
+def test_open_source_without_prefetch_returns_the_capture():
+    capture = SyntheticCapture(frames=2)
+    assert open_source(capture, prefetch=0) is capture
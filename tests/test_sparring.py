@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+import sparring  # noqa: E402
+from synthetic import STANCE_TEMPLATE, SyntheticPose, _Results  # noqa: E402
+
+PEOPLE = ((100, 60, 100, 380), (420, 60, 100, 380))  # x, y, w, h of each person in a 640x480 frame
+
+
+class PersonPose(SyntheticPose):
+    # Fits the stance to the bright pixels of whatever crop it is given, so like a real model its answer depends
+    # on where the crop was cut from
+    def __init__(self, **options):
+        low, high = STANCE_TEMPLATE[:, :2].min(axis=0), STANCE_TEMPLATE[:, :2].max(axis=0)
+        self.unit = (STANCE_TEMPLATE - np.append(low, 0)) / np.append(high - low, 1)
+        super().__init__()
+        self.resets = 0
+
+    def process(self, image):
+        ys, xs = np.nonzero(image[..., 0])
+        if not len(xs):
+            return _Results(None)
+        h, w = image.shape[:2]
+        points = self.unit.copy()
+        points[:, 0] = (xs.min() + points[:, 0] * (xs.max() - xs.min())) / w
+        points[:, 1] = (ys.min() + points[:, 1] * (ys.max() - ys.min())) / h
+        self.landmarks, self._index = points[None], 0
+        return super().process(image)
+
+    def reset(self):
+        self.resets += 1
+
+
+def scene(*people):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for x, y, w, h in people:
+        frame[y:y + h, x:x + w] = 255
+    return frame
+
+
+def detect(frame):
+    # Every person in view, boxed a little loosely
+    return [(x - 10, y - 10, w + 20, h + 20) for x, y, w, h in PEOPLE if frame[y + h // 2, x + w // 2, 0]]
+
+
+@pytest.fixture
+def coach(monkeypatch):
+    poses = []
+
+    def create_pose(**options):
+        poses.append(PersonPose(**options))
+        return poses[-1]
+
+    monkeypatch.setattr(sparring, 'create_pose', create_pose)
+    coach = sparring.SparringCoach(max_athletes=2, detector=detect, detect_every=5, max_missed=3)
+    coach.poses = poses
+    yield coach
+    coach.close()
+
+
+def centre_x(athlete):
+    return athlete.landmarks.points[:, 0].mean() * 640
+
+
+def test_each_person_keeps_their_athlete_id(coach):
+    frame = scene(*PEOPLE)
+    for i in range(20):
+        athletes = coach.update(frame, i / 30)
+        assert [athlete.id for athlete in athletes] == [0, 1]
+        assert centre_x(athletes[0]) < 320 < centre_x(athletes[1])
+    assert athletes[0].pose is not athletes[1].pose and len(coach.poses) == 2
+
+
+def test_someone_who_leaves_and_returns_gets_a_new_id(coach):
+    coach.update(scene(*PEOPLE), 0.0)
+    right = coach.athletes[1]
+    for i in range(1, 6):
+        coach.update(scene(PEOPLE[0]), i / 30)
+    assert [athlete.id for athlete in coach.athletes] == [0] and coach.finished == [right]
+    assert right.pose.resets == 1
+    for i in range(6, 12):
+        athletes = coach.update(scene(*PEOPLE), i / 30)
+    assert [athlete.id for athlete in athletes] == [0, 2]
+    assert centre_x(athletes[0]) < 320 < centre_x(athletes[1])
+    # The returning person is tracked with the Pose the leaver gave back
+    assert athletes[1].pose is right.pose and len(coach.poses) == 2
+    assert [row["athlete"] for row in coach.summary()] == [0, 1, 2]
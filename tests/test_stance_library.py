@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+from landmarks import NUM_LANDMARKS  # noqa: E402
+from stance_library import StanceLibrary, StanceMatch, library_path, normalize_pose  # noqa: E402
+from synthetic import STANCE_TEMPLATE, mirror_stance, synthetic_landmarks  # noqa: E402
+
+
+def with_visibility(points, visibility):
+    return np.concatenate([points, np.full(points.shape[:-1] + (1,), visibility, dtype=np.float32)], axis=-1)
+
+
+@pytest.fixture
+def library():
+    library = StanceLibrary()
+    library.add('guard', STANCE_TEMPLATE, athlete='sam', mirror=True)
+    library.add('wide', STANCE_TEMPLATE * [1.2, 1.0, 1.0], athlete='alex')
+    return library
+
+
+def test_normalize_pose_ignores_position_and_scale():
+    shifted = STANCE_TEMPLATE * 0.5 + [0.2, 0.1, 0.0]
+    np.testing.assert_allclose(normalize_pose(shifted), normalize_pose(STANCE_TEMPLATE), atol=1e-5)
+
+
+def test_distances_match_brute_force(library):
+    queries = synthetic_landmarks(4, noise=0.01, seed=1)
+    distances = library.distances(queries)
+    expected = np.sqrt(((library.poses[None] - normalize_pose(queries, 4 / 3)[:, None]) ** 2).sum(-1).mean(-1))
+    np.testing.assert_allclose(distances, expected, atol=1e-4)
+
+
+def test_best_finds_the_mirrored_stance(library):
+    match = library.best(with_visibility(mirror_stance(), 0.9))
+    assert (match.name, match.stance, match.distance) == ('guard', 'southpaw', pytest.approx(0, abs=1e-5))
+    assert match.aligned()
+
+
+def test_filters_restrict_the_search(library):
+    assert library.best(STANCE_TEMPLATE, athlete='alex').name == 'wide'
+    assert library.best(STANCE_TEMPLATE, athlete='nobody') is None
+
+
+def test_no_match_when_too_few_joints_are_visible(library):
+    assert library.best(with_visibility(STANCE_TEMPLATE, 0.3)) is None
+    dim = with_visibility(STANCE_TEMPLATE, 0.3)
+    dim[:6, 3] = 0.9
+    assert library.match(dim, k=3) == []
+    assert library.best(dim, min_joints=6) is not None
+
+
+def test_worst_landmark_without_visible_joints():
+    match = StanceMatch(0, 0.0, np.full(NUM_LANDMARKS, np.nan), STANCE_TEMPLATE, 'guard', None, 'orthodox', None)
+    assert match.worst_landmark is None
+    assert not match.aligned()
+
+
+def test_save_and_load_round_trip(library, tmp_path):
+    path = str(tmp_path / 'library.npz')
+    library.save(path)
+    loaded = StanceLibrary.load(path)
+    assert len(loaded) == 3
+    assert loaded.best(STANCE_TEMPLATE).name == library.best(STANCE_TEMPLATE).name
+
+
+def test_a_path_without_the_extension_saves_and_loads_the_same_file(library, tmp_path):
+    library.save(tmp_path / 'library')
+    assert [path.name for path in tmp_path.iterdir()] == ['library.npz']
+    assert len(StanceLibrary.load(tmp_path / 'library')) == 3
+    assert library_path(tmp_path / 'library') == library_path(tmp_path / 'library.npz')
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+from steps import EVALUATION_STEPS, STEPS, StepMachine  # noqa: E402
+from synthetic import STANCE_TEMPLATE, synthetic_landmarks  # noqa: E402
+
+
+def advance_all(machine, outcomes, fps=30.0, start=0.0):
+    points = synthetic_landmarks(len(outcomes), noise=0.0005)
+    return [machine.advance(correct, None if correct else "fix it", start + i / fps, points[i])
+            for i, correct in enumerate(outcomes)]
+
+
+def test_a_step_completes_after_the_hold_time():
+    machine = StepMachine(hold_time=1)
+    advance_all(machine, [True] * 40)
+    assert machine.current_step == 1
+    assert machine.completion_times[0] == pytest.approx(1.0, abs=0.05)
+
+
+def test_one_failing_frame_at_the_start_of_a_hold_does_not_restart_it():
+    machine = StepMachine(hold_time=1)
+    results = advance_all(machine, [True, False] + [True] * 30)
+    assert results[1].remaining_time is not None
+    assert machine.current_step == 1
+
+
+def test_a_step_never_completes_on_a_failing_frame():
+    machine = StepMachine(hold_time=1)
+    results = advance_all(machine, [True] * 30 + [False, False] + [True] * 5)
+    assert [result.remaining_time for result in results[30:32]] == [1, 1]
+    assert machine.current_step == 1 and machine.completion_times[0] == pytest.approx(32 / 30)
+
+
+def test_leaving_the_position_restarts_the_hold():
+    machine = StepMachine(hold_time=1)
+    results = advance_all(machine, [True] * 15 + [False] * 20)
+    assert results[-1].remaining_time is None
+    assert machine.current_step == 0
+
+
+def test_update_scores_the_template_stance_on_every_step():
+    machine = StepMachine(hold_time=0)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    result = machine.update(frame, STANCE_TEMPLATE, 0.0)
+    assert result.correct
+    assert [status.correct for status in machine.board] == [True] * len(STEPS)
+    assert len(StepMachine(EVALUATION_STEPS).steps) == len(EVALUATION_STEPS)
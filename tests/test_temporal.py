@@ -0,0 +1,50 @@
+import numpy as np
+from temporal import HoldWindow, OneEuroFilter, filter_sequence
+from synthetic import STANCE_TEMPLATE, synthetic_landmarks
+
+
+def test_one_euro_filter_smooths_jitter():
+    points = synthetic_landmarks(90, noise=0.005)
+    filtered = filter_sequence(points, np.arange(90) / 30)
+    assert np.abs(filtered[30:] - STANCE_TEMPLATE).std() < 0.5 * np.abs(points[30:] - STANCE_TEMPLATE).std()
+
+
+def test_one_euro_filter_ignores_repeated_timestamps():
+    one_euro = OneEuroFilter()
+    first = one_euro(STANCE_TEMPLATE, 0.0)
+    np.testing.assert_array_equal(one_euro(STANCE_TEMPLATE + 0.1, 0.0), first)
+
+
+def test_a_failing_frame_early_in_a_hold_does_not_end_it():
+    hold = HoldWindow(window=1.0, pass_ratio=0.8, min_duration=0.3)
+    hold.push(0.0, True, STANCE_TEMPLATE)
+    hold.push(1 / 30, False, STANCE_TEMPLATE)
+    assert hold.pass_fraction(1 / 30, 0.0) == 0.5
+    assert hold.holding(1 / 30, 0.0)
+
+
+def test_a_hold_ends_once_most_recent_frames_fail():
+    hold = HoldWindow(window=1.0, pass_ratio=0.8, min_duration=0.3)
+    times = np.arange(30) / 30
+    for t in times:
+        hold.push(t, t < 0.2, STANCE_TEMPLATE)
+    assert not hold.holding(times[-1], 0.0)
+
+
+def test_the_odd_failing_frame_is_tolerated_later_in_a_hold():
+    hold = HoldWindow(window=1.0, pass_ratio=0.8)
+    times = np.arange(30) / 30
+    for i, t in enumerate(times):
+        hold.push(t, i % 10 != 9, STANCE_TEMPLATE)
+    assert hold.holding(times[-1], 0.0)
+
+
+def test_jitter_only_counts_passing_frames():
+    hold = HoldWindow(max_jitter=0.01)
+    points = synthetic_landmarks(30, noise=0.001)
+    for i in range(30):
+        hold.push(i / 30, True, points[i])
+    hold.push(1.0, False, STANCE_TEMPLATE + 0.2)
+    assert hold.stable(1.0)
+    hold.push(1.05, True, STANCE_TEMPLATE + 0.2)
+    assert not hold.stable(1.05)
@@ -1,320 +1,363 @@
 import cv2
 import mediapipe as mp
-import math
 import pickle
+import numpy as np
+from landmarks import as_keypoint_array
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
 POSE_CONNECTIONS = mp_pose.POSE_CONNECTIONS
+_CONNECTIONS = np.array(sorted(POSE_CONNECTIONS), dtype=np.intp).reshape(-1, 2)
 
+# Stance thresholds, used by the checks below and by the rules in steps.py. Ranges are (low, high); foot distances
+# are in shoulder widths, angles in degrees, hand heights and elbow offsets in pixels
+FOOT_LINE_MAX_TILT = 15  # Toe-heel line against the horizontal
+FEET_APART = (1.1, 1.2)
+FOOT_POSITION_APART = (1.2, 1.4)  # The foot position box asks for a wider stance
+STANCE_MAX_TILT = 10  # General stance advice is stricter on the foot line...
+STANCE_APART = (1.2, 1.3)  # ...and wants the feet a little wider
+FRONT_FOOT_ANGLE = (140, 160)
+BACK_FOOT_ANGLE = (50, 90)
+LEFT_KNEE_ANGLE = (140, 170)
+RIGHT_KNEE_ANGLE = (150, 170)
+MAX_HAND_HEIGHT = 50  # Below the chin
+MAX_ELBOW_OFFSET = 50  # Sideways from the shoulder
+
+
+def frame_size(frame):
+    # Checks accept either an image or just its (h, w) shape, so batches can be scored without pixels
+    shape = frame.shape if hasattr(frame, 'shape') else frame
+    return shape[0], shape[1]
+
+
+def _can_draw(frame, keypoints):
+    return isinstance(frame, np.ndarray) and frame.ndim == 3 and keypoints.ndim == 2
+
+
+def _to_pixels(keypoints, frame, *landmarks):
+    h, w = frame_size(frame)
+    indices = [landmark.value for landmark in landmarks]
+    pixels = (keypoints[..., indices, :2] * np.array([w, h], dtype=np.float64)).astype(np.int32)
+    return [pixels[..., i, :] for i in range(len(indices))]
+
+
+def pixel_point(pixel):
+    return int(pixel[0]), int(pixel[1])
+
+
+def join_feedback(messages):
+    # messages is a list of (mask, text); single frames get a string, batches get one string per frame
+    masks = [np.asarray(mask) for mask, _ in messages]
+    if not masks or masks[0].ndim == 0:
+        return " ".join(text for mask, (_, text) in zip(masks, messages) if mask)
+    stacked = np.stack(masks, axis=-1)
+    return [" ".join(text for fired, (_, text) in zip(row, messages) if fired) for row in stacked]
+
+
+def calculate_angle(point1, point2):
+    point1, point2 = np.asarray(point1, dtype=np.float64), np.asarray(point2, dtype=np.float64)
+    return np.degrees(np.arctan2(point2[..., 1] - point1[..., 1], point2[..., 0] - point1[..., 0]))
+
+
+def calculate_distance(point1, point2):
+    point1, point2 = np.asarray(point1, dtype=np.float64), np.asarray(point2, dtype=np.float64)
+    return np.hypot(point1[..., 0] - point2[..., 0], point1[..., 1] - point2[..., 1])
 
-def calculate_angle(a, b):
-    delta_x = b[0] - a[0]
-    delta_y = b[1] - a[1]
-    angle = math.degrees(math.atan2(delta_y, delta_x))
-    return angle
 
 def check_alignment(current_keypoints, ideal_keypoints, threshold=0.1):
-    for i in range(len(current_keypoints)):
-        current = current_keypoints[i]
-        ideal = ideal_keypoints[i]
-        distance = ((current[0] - ideal[0]) ** 2 + (current[1] - ideal[1]) ** 2 + (current[2] - ideal[2]) ** 2) ** 0.5
-        if distance > threshold:
-            return False
-    return True
+    current = as_keypoint_array(current_keypoints)
+    ideal = as_keypoint_array(ideal_keypoints)
+    distance = np.linalg.norm(current - ideal, axis=-1)
+    return np.all(distance <= threshold, axis=-1)
 
-def check_feet_alignment(current_keypoints):
-    left_toe = current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value]
-    right_heel = current_keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value]
-    left_shoulder = current_keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-    right_shoulder = current_keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
 
-    # Calculate the angle of the line between left toe and right heel
+def feet_alignment_scores(current_keypoints):
+    keypoints = as_keypoint_array(current_keypoints)
+    left_toe = keypoints[..., mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value, :2]
+    right_heel = keypoints[..., mp_pose.PoseLandmark.RIGHT_HEEL.value, :2]
+    left_shoulder = keypoints[..., mp_pose.PoseLandmark.LEFT_SHOULDER.value, :2]
+    right_shoulder = keypoints[..., mp_pose.PoseLandmark.RIGHT_SHOULDER.value, :2]
+
+    # Angle of the line between left toe and right heel, and feet distance relative to shoulder width
     foot_line_angle = calculate_angle(right_heel, left_toe)
-    correct_alignment = abs(foot_line_angle) < 15 or abs(foot_line_angle - 180) < 15
+    foot_distance = calculate_distance(left_toe, right_heel)
+    shoulder_width = calculate_distance(left_shoulder, right_shoulder)
+    return foot_line_angle, foot_distance, shoulder_width
 
-    # Calculate the distance between the feet
-    foot_distance = math.sqrt((left_toe[0] - right_heel[0]) ** 2 + (left_toe[1] - right_heel[1]) ** 2)
-    shoulder_width = math.sqrt((left_shoulder[0] - right_shoulder[0]) ** 2 + (left_shoulder[1] - right_shoulder[1]) ** 2)
+
+def check_feet_alignment(current_keypoints):
+    foot_line_angle, foot_distance, shoulder_width = feet_alignment_scores(current_keypoints)
+    correct_alignment = (np.abs(foot_line_angle) < FOOT_LINE_MAX_TILT) | \
+        (np.abs(foot_line_angle - 180) < FOOT_LINE_MAX_TILT)
 
     # Ensure feet are slightly more than shoulder-width apart (10-20% more)
-    correct_distance = 1.1 * shoulder_width <= foot_distance <= 1.2 * shoulder_width
+    correct_distance = (FEET_APART[0] * shoulder_width <= foot_distance) & \
+        (foot_distance <= FEET_APART[1] * shoulder_width)
+
+    return correct_alignment & correct_distance
+
 
-    return correct_alignment and correct_distance
+def check_shoulder_width(current_keypoints):
+    _, foot_distance, shoulder_width = feet_alignment_scores(current_keypoints)
+    return (FEET_APART[0] * shoulder_width <= foot_distance) & (foot_distance <= FEET_APART[1] * shoulder_width)
 
 
-def draw_keypoints_with_lines(frame, keypoints):
+def draw_keypoints_with_lines(frame, keypoints, color=(0, 255, 0)):
+    # All landmarks go to pixels in one step; bones are one polylines call and joints another, since a zero-length
+    # segment drawn 10px thick is exactly a radius-5 filled circle. Landmarks that aren't finite are skipped.
+    # Scaling is done in at least float32: float16 can't hold pixel coordinates to the nearest pixel
     h, w, _ = frame.shape
-    for i, keypoint in enumerate(keypoints):
-        try:
-            x, y = int(keypoint[0] * w), int(keypoint[1] * h)
-            cv2.circle(frame, (x, y), 5, (0, 255, 0), -1)
-        except ValueError as e:
-            print(f"Error processing keypoint {i}: {keypoint}, error: {e}")
-            continue
-
-    for connection in POSE_CONNECTIONS:
-        start_idx, end_idx = connection
-        try:
-            start_point = (int(keypoints[start_idx][0] * w), int(keypoints[start_idx][1] * h))
-            end_point = (int(keypoints[end_idx][0] * w), int(keypoints[end_idx][1] * h))
-            cv2.line(frame, start_point, end_point, (0, 255, 0), 2)
-        except ValueError as e:
-            print(f"Error processing connection {connection}: {e}")
-            continue
+    points = as_keypoint_array(keypoints)[:, :2]
+    valid = np.isfinite(points).all(axis=1)
+    pixels = np.zeros((len(points), 2), dtype=np.int32)
+    pixels[valid] = points[valid] * np.array([w, h], dtype=np.promote_types(points.dtype, np.float32))
 
+    joints = pixels[valid][:, None, :].repeat(2, axis=1)
+    bones = pixels[_CONNECTIONS[valid[_CONNECTIONS].all(axis=1)]]
+    cv2.polylines(frame, joints, False, color, 10)
+    cv2.polylines(frame, bones, False, color, 2)
 
-def calculate_angle(point1, point2):
-    angle = math.degrees(math.atan2(point2[1] - point1[1], point2[0] - point1[0]))
-    return angle
 
 def draw_foot_position_box(frame, current_keypoints):
-    h, w, _ = frame.shape
-    left_toe = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][0] * w),
-                int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][1] * h))
-    right_heel = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value][0] * w),
-                  int(current_keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value][1] * h))
-    left_shoulder = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value][0] * w),
-                     int(current_keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value][1] * h))
-    right_shoulder = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value][0] * w),
-                      int(current_keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value][1] * h))
+    keypoints = as_keypoint_array(current_keypoints)
+    h, _ = frame_size(frame)
+    left_toe, right_heel, left_shoulder, right_shoulder = _to_pixels(
+        keypoints, frame, mp_pose.PoseLandmark.LEFT_FOOT_INDEX, mp_pose.PoseLandmark.RIGHT_HEEL,
+        mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER)
 
     # Calculate the alignment angle
     foot_line_angle = calculate_angle(right_heel, left_toe)
-    correct_alignment = abs(foot_line_angle) < 15 or abs(foot_line_angle - 180) < 15
-
-    # Draw the line between the left foot and right heel
-    line_color = (0, 255, 0) if correct_alignment else (0, 0, 255)
-    cv2.line(frame, left_toe, right_heel, line_color, 2)
+    correct_alignment = (np.abs(foot_line_angle) < FOOT_LINE_MAX_TILT) | \
+        (np.abs(foot_line_angle - 180) < FOOT_LINE_MAX_TILT)
 
     # Calculate the distance between the feet and shoulder width
-    foot_distance = math.sqrt((left_toe[0] - right_heel[0]) ** 2 + (left_toe[1] - right_heel[1]) ** 2)
-    shoulder_width = math.sqrt(
-        (left_shoulder[0] - right_shoulder[0]) ** 2 + (left_shoulder[1] - right_shoulder[1]) ** 2)
-    correct_distance = 1.2 * shoulder_width <= foot_distance <= 1.4 * shoulder_width  # Adjusted threshold
+    foot_distance = calculate_distance(left_toe, right_heel)
+    shoulder_width = calculate_distance(left_shoulder, right_shoulder)
+    correct_distance = (FOOT_POSITION_APART[0] * shoulder_width <= foot_distance) & \
+        (foot_distance <= FOOT_POSITION_APART[1] * shoulder_width)
 
-    # Draw visual cues for foot distance
-    distance_color = (0, 255, 0) if correct_distance else (0, 0, 255)
-    cv2.line(frame, left_shoulder, right_shoulder, (255, 0, 0), 2)  # Draw shoulder line
-    cv2.line(frame, left_toe, right_heel, distance_color, 2)  # Draw foot distance line
+    if _can_draw(frame, keypoints):
+        left_toe, right_heel = pixel_point(left_toe), pixel_point(right_heel)
+        left_shoulder, right_shoulder = pixel_point(left_shoulder), pixel_point(right_shoulder)
 
-    # Adjusted angled lines from shoulders to the ground
-    angle_offset = 0.8  # Adjust this value to change the angle
-    left_shoulder_ground = (int(left_shoulder[0] + shoulder_width * angle_offset), h)  # Adjusted for outward pointing
-    right_shoulder_ground = (int(right_shoulder[0] - shoulder_width * angle_offset), h)  # Adjusted for outward pointing
+        # Draw the line between the left foot and right heel
+        line_color = (0, 255, 0) if correct_alignment else (0, 0, 255)
+        cv2.line(frame, left_toe, right_heel, line_color, 2)
 
-    cv2.line(frame, left_shoulder, left_shoulder_ground, (0, 255, 0), 1)
-    cv2.line(frame, right_shoulder, right_shoulder_ground, (0, 255, 0), 1)
+        # Draw visual cues for foot distance
+        distance_color = (0, 255, 0) if correct_distance else (0, 0, 255)
+        cv2.line(frame, left_shoulder, right_shoulder, (255, 0, 0), 2)  # Draw shoulder line
+        cv2.line(frame, left_toe, right_heel, distance_color, 2)  # Draw foot distance line
 
-    # Draw lines from feet to the corresponding shoulder line
-    cv2.line(frame, left_toe, (left_shoulder_ground[0], left_toe[1]), distance_color, 1)
-    cv2.line(frame, right_heel, (right_shoulder_ground[0], right_heel[1]), distance_color, 1)
+        # Adjusted angled lines from shoulders to the ground
+        angle_offset = 0.8  # Adjust this value to change the angle
+        left_shoulder_ground = (int(left_shoulder[0] + shoulder_width * angle_offset), h)  # Adjusted for outward pointing
+        right_shoulder_ground = (int(right_shoulder[0] - shoulder_width * angle_offset), h)  # Adjusted for outward pointing
 
-    # Determine the feedback
-    if not correct_alignment:
-        feedback = "Adjust Feet"
-    elif not correct_distance:
-        feedback = "Widen feet a bit more" if foot_distance < 1.2 * shoulder_width else "Stance too wide"
-    else:
-        feedback = "Correct Alignment and Distance"
+        cv2.line(frame, left_shoulder, left_shoulder_ground, (0, 255, 0), 1)
+        cv2.line(frame, right_shoulder, right_shoulder_ground, (0, 255, 0), 1)
 
-    return correct_alignment and correct_distance, feedback
+        # Draw lines from feet to the corresponding shoulder line
+        cv2.line(frame, left_toe, (left_shoulder_ground[0], left_toe[1]), distance_color, 1)
+        cv2.line(frame, right_heel, (right_shoulder_ground[0], right_heel[1]), distance_color, 1)
 
-def generate_feedback(current_keypoints):
-    left_toe = current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value]
-    right_heel = current_keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value]
-    left_shoulder = current_keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-    right_shoulder = current_keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
+    # Determine the feedback
+    too_narrow = foot_distance < FOOT_POSITION_APART[0] * shoulder_width
+    feedback = join_feedback([
+        (~correct_alignment, "Adjust Feet"),
+        (correct_alignment & ~correct_distance & too_narrow, "Widen feet a bit more"),
+        (correct_alignment & ~correct_distance & ~too_narrow, "Stance too wide"),
+        (correct_alignment & correct_distance, "Correct Alignment and Distance"),
+    ])
 
-    # Calculate the angle of the line between left toe and right heel
-    foot_line_angle = calculate_angle(right_heel, left_toe)
-    correct_alignment = abs(foot_line_angle) < 10 or abs(foot_line_angle - 180) < 10
+    return correct_alignment & correct_distance, feedback
 
-    # Calculate the distance between the feet and shoulders
-    foot_distance = math.sqrt((left_toe[0] - right_heel[0]) ** 2 + (left_toe[1] - right_heel[1]) ** 2)
-    shoulder_width = math.sqrt(
-        (left_shoulder[0] - right_shoulder[0]) ** 2 + (left_shoulder[1] - right_shoulder[1]) ** 2)
 
-    # Ensure feet are slightly more than shoulder-width apart (20-30% more)
-    correct_distance = 1.2 * shoulder_width <= foot_distance <= 1.3 * shoulder_width
+def generate_feedback(current_keypoints):
+    foot_line_angle, foot_distance, shoulder_width = feet_alignment_scores(current_keypoints)
+    correct_alignment = (np.abs(foot_line_angle) < STANCE_MAX_TILT) | (np.abs(foot_line_angle - 180) < STANCE_MAX_TILT)
 
-    feedback = []
-    if not correct_alignment:
-        feedback.append("Align your front foot toe with your back foot heel.")
-    if not correct_distance:
-        feedback.append("Keep feet slightly more than shoulder-width apart.")
+    # Ensure feet are slightly more than shoulder-width apart (20-30% more)
+    correct_distance = (STANCE_APART[0] * shoulder_width <= foot_distance) & \
+        (foot_distance <= STANCE_APART[1] * shoulder_width)
 
-    return feedback
+    messages = [
+        (~correct_alignment, "Align your front foot toe with your back foot heel."),
+        (~correct_distance, "Keep feet slightly more than shoulder-width apart."),
+    ]
+    if np.ndim(correct_alignment) == 0:
+        return [text for mask, text in messages if mask]
+    return [[text for mask, text in messages if mask[i]] for i in range(len(correct_alignment))]
 
 
-def load_ideal_keypoints():
-    with open("ideal_keypoints.pkl", "rb") as f:
+def load_ideal_keypoints(filename="ideal_keypoints.pkl"):
+    with open(filename, "rb") as f:
         ideal_keypoints = pickle.load(f)
-    return ideal_keypoints
+    return as_keypoint_array(ideal_keypoints)
 
 
 def calculate_angle_2d(point1, point2, point3):
-    angle = math.degrees(math.atan2(point3[1] - point2[1], point3[0] - point2[0]) - math.atan2(point1[1] - point2[1],
-                                                                                               point1[0] - point2[0]))
-    return abs(angle) if abs(angle) <= 180 else 360 - abs(angle)
+    point1, point2, point3 = (np.asarray(p, dtype=np.float64) for p in (point1, point2, point3))
+    angle = np.abs(np.degrees(np.arctan2(point3[..., 1] - point2[..., 1], point3[..., 0] - point2[..., 0]) -
+                              np.arctan2(point1[..., 1] - point2[..., 1], point1[..., 0] - point2[..., 0])))
+    return np.where(angle <= 180, angle, 360 - angle)
 
 
-def check_foot_angles(frame, keypoints):
-    h, w, _ = frame.shape
-    left_heel = (int(keypoints[mp_pose.PoseLandmark.LEFT_HEEL.value][0] * w),
-                 int(keypoints[mp_pose.PoseLandmark.LEFT_HEEL.value][1] * h))
-    left_toe = (int(keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][0] * w),
-                int(keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][1] * h))
-    right_heel = (int(keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value][0] * w),
-                  int(keypoints[mp_pose.PoseLandmark.RIGHT_HEEL.value][1] * h))
-    right_toe = (int(keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][0] * w),
-                 int(keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][1] * h))
-
-    front_foot_angle = calculate_angle_2d(left_heel, left_toe, [left_toe[0] + 0.1, left_toe[1]])
-    back_foot_angle = calculate_angle_2d(right_heel, right_toe, [right_toe[0] + 0.1, right_toe[1]])
-
-    correct_front_foot = 140 <= front_foot_angle <= 160
-    correct_back_foot = 50 <= back_foot_angle <= 90
-
-    feedback = []
-    if not correct_front_foot:
-        if front_foot_angle < 150:
-            feedback.append("Rotate front foot right")
-            cv2.arrowedLine(frame, left_toe, (left_toe[0] + 50, left_toe[1]), (0, 0, 255), 5, tipLength=0.5)
-        else:
-            feedback.append("Rotate front foot left")
-            cv2.arrowedLine(frame, left_toe, (left_toe[0] - 50, left_toe[1]), (0, 0, 255), 5, tipLength=0.5)
-
-    if not correct_back_foot:
-        if back_foot_angle < 50:
-            feedback.append("Rotate back foot right")
-            cv2.arrowedLine(frame, right_toe, (right_toe[0] + 50, right_toe[1]), (0, 0, 255), 5, tipLength=0.5)
-        else:
-            feedback.append("Rotate back foot left")
-            cv2.arrowedLine(frame, right_toe, (right_toe[0] - 50, right_toe[1]), (0, 0, 255), 5, tipLength=0.5)
-
-    return correct_front_foot and correct_back_foot, " ".join(feedback)
+def foot_angle_scores(keypoints, frame):
+    keypoints = as_keypoint_array(keypoints)
+    left_heel, left_toe, right_heel, right_toe = _to_pixels(
+        keypoints, frame, mp_pose.PoseLandmark.LEFT_HEEL, mp_pose.PoseLandmark.LEFT_FOOT_INDEX,
+        mp_pose.PoseLandmark.RIGHT_HEEL, mp_pose.PoseLandmark.RIGHT_FOOT_INDEX)
 
+    front_foot_angle = calculate_angle_2d(left_heel, left_toe, left_toe + (0.1, 0))
+    back_foot_angle = calculate_angle_2d(right_heel, right_toe, right_toe + (0.1, 0))
+    return front_foot_angle, back_foot_angle
 
-def check_knee_bend(frame, keypoints):
-    h, w, _ = frame.shape
-    left_knee = (int(keypoints[mp_pose.PoseLandmark.LEFT_KNEE.value][0] * w),
-                 int(keypoints[mp_pose.PoseLandmark.LEFT_KNEE.value][1] * h))
-    right_knee = (int(keypoints[mp_pose.PoseLandmark.RIGHT_KNEE.value][0] * w),
-                  int(keypoints[mp_pose.PoseLandmark.RIGHT_KNEE.value][1] * h))
-    left_hip = (int(keypoints[mp_pose.PoseLandmark.LEFT_HIP.value][0] * w),
-                int(keypoints[mp_pose.PoseLandmark.LEFT_HIP.value][1] * h))
-    right_hip = (int(keypoints[mp_pose.PoseLandmark.RIGHT_HIP.value][0] * w),
-                 int(keypoints[mp_pose.PoseLandmark.RIGHT_HIP.value][1] * h))
-
-    left_ankle = (int(keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][0] * w),
-                  int(keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][1] * h))
-    right_ankle = (int(keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][0] * w),
-                   int(keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][1] * h))
+
+def check_foot_angles(frame, keypoints):
+    keypoints = as_keypoint_array(keypoints)
+    front_foot_angle, back_foot_angle = foot_angle_scores(keypoints, frame)
+
+    correct_front_foot = (FRONT_FOOT_ANGLE[0] <= front_foot_angle) & (front_foot_angle <= FRONT_FOOT_ANGLE[1])
+    correct_back_foot = (BACK_FOOT_ANGLE[0] <= back_foot_angle) & (back_foot_angle <= BACK_FOOT_ANGLE[1])
+
+    messages = [
+        (~correct_front_foot & (front_foot_angle < FRONT_FOOT_ANGLE[0]), "Rotate front foot right"),
+        (~correct_front_foot & (front_foot_angle >= FRONT_FOOT_ANGLE[0]), "Rotate front foot left"),
+        (~correct_back_foot & (back_foot_angle < BACK_FOOT_ANGLE[0]), "Rotate back foot right"),
+        (~correct_back_foot & (back_foot_angle >= BACK_FOOT_ANGLE[0]), "Rotate back foot left"),
+    ]
+
+    if _can_draw(frame, keypoints):
+        left_toe, right_toe = (pixel_point(p) for p in _to_pixels(
+            keypoints, frame, mp_pose.PoseLandmark.LEFT_FOOT_INDEX, mp_pose.PoseLandmark.RIGHT_FOOT_INDEX))
+        arrows = [
+            (left_toe, (left_toe[0] + 50, left_toe[1])),
+            (left_toe, (left_toe[0] - 50, left_toe[1])),
+            (right_toe, (right_toe[0] + 50, right_toe[1])),
+            (right_toe, (right_toe[0] - 50, right_toe[1])),
+        ]
+        for (fired, _), (start, end) in zip(messages, arrows):
+            if fired:
+                cv2.arrowedLine(frame, start, end, (0, 0, 255), 5, tipLength=0.5)
+
+    return correct_front_foot & correct_back_foot, join_feedback(messages)
+
+
+def knee_angle_scores(keypoints, frame):
+    keypoints = as_keypoint_array(keypoints)
+    left_knee, right_knee, left_hip, right_hip, left_ankle, right_ankle = _to_pixels(
+        keypoints, frame, mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE,
+        mp_pose.PoseLandmark.LEFT_HIP, mp_pose.PoseLandmark.RIGHT_HIP,
+        mp_pose.PoseLandmark.LEFT_ANKLE, mp_pose.PoseLandmark.RIGHT_ANKLE)
 
     left_knee_angle = calculate_angle_2d(left_hip, left_knee, left_ankle)
     right_knee_angle = calculate_angle_2d(right_hip, right_knee, right_ankle)
+    return left_knee_angle, right_knee_angle
+
+
+def check_knee_bend(frame, keypoints):
+    keypoints = as_keypoint_array(keypoints)
+    left_knee_angle, right_knee_angle = knee_angle_scores(keypoints, frame)
 
     # Adjusted threshold for front knee (left knee)
-    correct_left_knee = 140 <= left_knee_angle <= 170
-    correct_right_knee = 150 <= right_knee_angle <= 170
+    correct_left_knee = (LEFT_KNEE_ANGLE[0] <= left_knee_angle) & (left_knee_angle <= LEFT_KNEE_ANGLE[1])
+    correct_right_knee = (RIGHT_KNEE_ANGLE[0] <= right_knee_angle) & (right_knee_angle <= RIGHT_KNEE_ANGLE[1])
+
+    messages = [
+        (~correct_left_knee, "Bend your left knee more (make sure your facing forward)"),
+        (~correct_right_knee, "Bend your right knee more (make sure your facing forward)"),
+    ]
+
+    if _can_draw(frame, keypoints):
+        left_knee, right_knee = (pixel_point(p) for p in _to_pixels(
+            keypoints, frame, mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE))
+        for (fired, _), knee in zip(messages, (left_knee, right_knee)):
+            if fired:
+                cv2.arrowedLine(frame, knee, (knee[0], knee[1] + 50), (0, 0, 255), 5, tipLength=0.5)
 
-    feedback = []
-    if not correct_left_knee:
-        feedback.append("Bend your left knee more (make sure your facing forward)")
-        cv2.arrowedLine(frame, left_knee, (left_knee[0], left_knee[1] + 50), (0, 0, 255), 5, tipLength=0.5)
-    if not correct_right_knee:
-        feedback.append("Bend your right knee more (make sure your facing forward)")
-        cv2.arrowedLine(frame, right_knee, (right_knee[0], right_knee[1] + 50), (0, 0, 255), 5, tipLength=0.5)
+    return correct_left_knee & correct_right_knee, join_feedback(messages)
 
-    return correct_left_knee and correct_right_knee, " ".join(feedback)
+
+def hands_and_chin_scores(keypoints, frame):
+    keypoints = as_keypoint_array(keypoints)
+    left_hand, right_hand, chin, left_elbow, right_elbow, left_shoulder, right_shoulder = _to_pixels(
+        keypoints, frame, mp_pose.PoseLandmark.LEFT_WRIST, mp_pose.PoseLandmark.RIGHT_WRIST,
+        mp_pose.PoseLandmark.NOSE, mp_pose.PoseLandmark.LEFT_ELBOW, mp_pose.PoseLandmark.RIGHT_ELBOW,
+        mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER)
+
+    # Hand height relative to the chin and elbow offset from the shoulder, in pixels
+    left_hand_height = left_hand[..., 1] - chin[..., 1]
+    right_hand_height = right_hand[..., 1] - chin[..., 1]
+    left_elbow_offset = np.abs(left_elbow[..., 0] - left_shoulder[..., 0])
+    right_elbow_offset = np.abs(right_elbow[..., 0] - right_shoulder[..., 0])
+    return left_hand_height, right_hand_height, left_elbow_offset, right_elbow_offset
 
 
 def check_hands_and_chin(frame, keypoints):
-    h, w, _ = frame.shape
-    left_hand = (int(keypoints[mp_pose.PoseLandmark.LEFT_WRIST.value][0] * w),
-                 int(keypoints[mp_pose.PoseLandmark.LEFT_WRIST.value][1] * h))
-    right_hand = (int(keypoints[mp_pose.PoseLandmark.RIGHT_WRIST.value][0] * w),
-                  int(keypoints[mp_pose.PoseLandmark.RIGHT_WRIST.value][1] * h))
-    chin = (int(keypoints[mp_pose.PoseLandmark.NOSE.value][0] * w),
-            int(keypoints[mp_pose.PoseLandmark.NOSE.value][1] * h))
-    left_elbow = (int(keypoints[mp_pose.PoseLandmark.LEFT_ELBOW.value][0] * w),
-                  int(keypoints[mp_pose.PoseLandmark.LEFT_ELBOW.value][1] * h))
-    right_elbow = (int(keypoints[mp_pose.PoseLandmark.RIGHT_ELBOW.value][0] * w),
-                   int(keypoints[mp_pose.PoseLandmark.RIGHT_ELBOW.value][1] * h))
-    left_shoulder = (int(keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value][0] * w),
-                     int(keypoints[mp_pose.PoseLandmark.LEFT_SHOULDER.value][1] * h))
-    right_shoulder = (int(keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value][0] * w),
-                      int(keypoints[mp_pose.PoseLandmark.RIGHT_SHOULDER.value][1] * h))
+    keypoints = as_keypoint_array(keypoints)
+    left_hand_height, right_hand_height, left_elbow_offset, right_elbow_offset = hands_and_chin_scores(keypoints, frame)
 
     # Criteria for hands being raised above the chin with a buffer
-    correct_left_hand = left_hand[1] < chin[1] + 50
-    correct_right_hand = right_hand[1] < chin[1] + 50
+    correct_left_hand = left_hand_height < MAX_HAND_HEIGHT
+    correct_right_hand = right_hand_height < MAX_HAND_HEIGHT
 
     # Criteria for elbows being tucked closer to the torso
-    correct_left_elbow = abs(left_elbow[0] - left_shoulder[0]) < 50
-    correct_right_elbow = abs(right_elbow[0] - right_shoulder[0]) < 50
-
-    feedback = []
-    if not correct_left_hand:
-        feedback.append("Raise your left hand")
-        cv2.arrowedLine(frame, left_hand, (left_hand[0], left_hand[1] - 50), (0, 0, 255), 5, tipLength=0.5)
-    if not correct_right_hand:
-        feedback.append("Raise your right hand")
-        cv2.arrowedLine(frame, right_hand, (right_hand[0], right_hand[1] - 50), (0, 0, 255), 5, tipLength=0.5)
-    if not correct_left_elbow:
-        feedback.append("Tuck your left elbow closer to your body")
-        cv2.arrowedLine(frame, left_elbow, (left_elbow[0] + 50, left_elbow[1]), (0, 0, 255), 5, tipLength=0.5)
-    if not correct_right_elbow:
-        feedback.append("Tuck your right elbow closer to your body")
-        cv2.arrowedLine(frame, right_elbow, (right_elbow[0] - 50, right_elbow[1]), (0, 0, 255), 5, tipLength=0.5)
-
-    return (correct_left_hand and correct_right_hand and correct_left_elbow and correct_right_elbow), " ".join(feedback)
-
-def draw_foot_direction_lines(frame, current_keypoints):
-    h, w, _ = frame.shape
-    left_foot = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][0] * w),
-                 int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][1] * h))
-    right_foot = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][0] * w),
-                  int(current_keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][1] * h))
-    left_ankle = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][0] * w),
-                  int(current_keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][1] * h))
-    right_ankle = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][0] * w),
-                   int(current_keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][1] * h))
+    correct_left_elbow = left_elbow_offset < MAX_ELBOW_OFFSET
+    correct_right_elbow = right_elbow_offset < MAX_ELBOW_OFFSET
+
+    messages = [
+        (~correct_left_hand, "Raise your left hand"),
+        (~correct_right_hand, "Raise your right hand"),
+        (~correct_left_elbow, "Tuck your left elbow closer to your body"),
+        (~correct_right_elbow, "Tuck your right elbow closer to your body"),
+    ]
+
+    if _can_draw(frame, keypoints):
+        left_hand, right_hand, left_elbow, right_elbow = (pixel_point(p) for p in _to_pixels(
+            keypoints, frame, mp_pose.PoseLandmark.LEFT_WRIST, mp_pose.PoseLandmark.RIGHT_WRIST,
+            mp_pose.PoseLandmark.LEFT_ELBOW, mp_pose.PoseLandmark.RIGHT_ELBOW))
+        arrows = [
+            (left_hand, (left_hand[0], left_hand[1] - 50)),
+            (right_hand, (right_hand[0], right_hand[1] - 50)),
+            (left_elbow, (left_elbow[0] + 50, left_elbow[1])),
+            (right_elbow, (right_elbow[0] - 50, right_elbow[1])),
+        ]
+        for (fired, _), (start, end) in zip(messages, arrows):
+            if fired:
+                cv2.arrowedLine(frame, start, end, (0, 0, 255), 5, tipLength=0.5)
+
+    correct = correct_left_hand & correct_right_hand & correct_left_elbow & correct_right_elbow
+    return correct, join_feedback(messages)
+
+
+def _foot_directions(frame, current_keypoints):
+    keypoints = as_keypoint_array(current_keypoints)
+    left_foot, right_foot, left_ankle, right_ankle = _to_pixels(
+        keypoints, frame, mp_pose.PoseLandmark.LEFT_FOOT_INDEX, mp_pose.PoseLandmark.RIGHT_FOOT_INDEX,
+        mp_pose.PoseLandmark.LEFT_ANKLE, mp_pose.PoseLandmark.RIGHT_ANKLE)
 
     # Calculate the angles
-    front_foot_angle = calculate_angle(left_ankle, left_foot)
-    back_foot_angle = calculate_angle(right_ankle, right_foot)
+    front_foot_angle = np.radians(calculate_angle(left_ankle, left_foot))
+    back_foot_angle = np.radians(calculate_angle(right_ankle, right_foot))
 
-    # Draw the direction lines
-    front_direction = (left_foot[0] + int(50 * math.cos(math.radians(front_foot_angle))),
-                       left_foot[1] + int(50 * math.sin(math.radians(front_foot_angle))))
-    back_direction = (right_foot[0] + int(50 * math.cos(math.radians(back_foot_angle))),
-                      right_foot[1] + int(50 * math.sin(math.radians(back_foot_angle))))
+    front_direction = (left_foot[0] + int(50 * np.cos(front_foot_angle)),
+                       left_foot[1] + int(50 * np.sin(front_foot_angle)))
+    back_direction = (right_foot[0] + int(50 * np.cos(back_foot_angle)),
+                      right_foot[1] + int(50 * np.sin(back_foot_angle)))
+    return pixel_point(left_foot), pixel_point(front_direction), pixel_point(right_foot), pixel_point(back_direction)
 
+
+def draw_foot_direction_lines(frame, current_keypoints):
+    left_foot, front_direction, right_foot, back_direction = _foot_directions(frame, current_keypoints)
+
+    # Draw the direction lines
     cv2.line(frame, left_foot, front_direction, (255, 0, 0), 2)
     cv2.line(frame, right_foot, back_direction, (255, 0, 0), 2)
 
 
-
 def draw_foot_rotation_arrows(frame, current_keypoints):
-    h, w, _ = frame.shape
-    left_foot = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][0] * w),
-                 int(current_keypoints[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value][1] * h))
-    right_foot = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][0] * w),
-                  int(current_keypoints[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value][1] * h))
-    left_ankle = (int(current_keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][0] * w),
-                  int(current_keypoints[mp_pose.PoseLandmark.LEFT_ANKLE.value][1] * h))
-    right_ankle = (int(current_keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][0] * w),
-                   int(current_keypoints[mp_pose.PoseLandmark.RIGHT_ANKLE.value][1] * h))
-
-    front_foot_angle = calculate_angle(left_ankle, left_foot)
-    back_foot_angle = calculate_angle(right_ankle, right_foot)
-
-    front_direction = (left_foot[0] + int(50 * math.cos(math.radians(front_foot_angle))),
-                       left_foot[1] + int(50 * math.sin(math.radians(front_foot_angle))))
-    back_direction = (right_foot[0] + int(50 * math.cos(math.radians(back_foot_angle))),
-                      right_foot[1] + int(50 * math.sin(math.radians(back_foot_angle))))
+    left_foot, front_direction, right_foot, back_direction = _foot_directions(frame, current_keypoints)
 
     cv2.arrowedLine(frame, left_foot, front_direction, (255, 0, 0), 2)
     cv2.arrowedLine(frame, right_foot, back_direction, (255, 0, 0), 2)